@@ -1,4 +1,5 @@
 import os
+import threading
 from datetime import timedelta
 from flask import Flask, jsonify
 from flask_cors import CORS
@@ -7,7 +8,7 @@ from flask_migrate import Migrate
 from flask_socketio import SocketIO
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from sqlalchemy import exc as sa_exc
+from sqlalchemy import exc as sa_exc, text
 
 
 # Import Configuration
@@ -20,6 +21,9 @@ jwt = None
 socketio = None
 limiter = None
 
+_services_started = False
+_services_lock = threading.Lock()
+
 KNOWN_BAD_ADMIN_HASH = (
     "scrypt:32768:8:1$gJtLp8lZ1JqWvJqZ$"
     "WvJqZvJqZvJqZvJqZvJqZvJqZvJqZvJqZvJqZvJqZvJqZvJqZvJqZvJqZvJq"
@@ -65,6 +69,60 @@ def ensure_default_admin(app):
             pass
         app.logger.warning("Skipped default admin bootstrap: %s", exc)
 
+def ensure_runtime_schema(app):
+    """
+    Create tables, columns and sequences added after the initial schema.sql if missing.
+    Returns False if the database could not be reached.
+    """
+    try:
+        from models.gallery import GalleryChange
+        from models.report_job import ReportJob
+        from services.visitor_codes import ensure_visitor_code_sequence
+
+        with app.app_context():
+            GalleryChange.__table__.create(bind=db.engine, checkfirst=True)
+            ReportJob.__table__.create(bind=db.engine, checkfirst=True)
+            ensure_visitor_code_sequence(db.engine)
+            with db.engine.begin() as connection:
+                connection.execute(text("ALTER TABLE cameras ADD COLUMN IF NOT EXISTS det_size INTEGER"))
+                connection.execute(text("ALTER TABLE cameras ADD COLUMN IF NOT EXISTS roi JSON"))
+                connection.execute(text("ALTER TABLE report_jobs ADD COLUMN IF NOT EXISTS run_after TIMESTAMP"))
+        return True
+    except Exception as exc:
+        app.logger.warning("Skipped runtime schema bootstrap: %s", exc)
+        return False
+
+def start_background_services(app):
+    """
+    Runtime schema, camera and report workers and model preload, once per process.
+
+    Called by the server entrypoint, or by the first request when
+    START_BACKGROUND_SERVICES is set (e.g. under gunicorn), so importing the app from
+    scripts or the flask CLI never starts them. Until every step succeeds (e.g. the
+    database is not reachable yet) the next call tries again; each step is idempotent.
+    """
+    global _services_started
+    if _services_started:
+        return
+    with _services_lock:
+        if _services_started:
+            return
+        if not ensure_runtime_schema(app):
+            return
+
+        # Per-camera analysis processes (CAMERA_WORKER_MODE=process); no-op inside a worker.
+        from services.camera_workers import start_camera_workers
+        start_camera_workers(app)
+
+        # Visitor PDF worker pool; sessions closing only enqueue report jobs.
+        from services.report_jobs import start_report_workers
+        start_report_workers(app)
+
+        # Load and warm the face models off the request path; see /api/system/ready.
+        from services.model_preload import start_model_preload
+        start_model_preload(app)
+        _services_started = True
+
 def create_app(config_class=Config):
     """
     Application Factory Pattern.
@@ -112,7 +170,7 @@ def create_app(config_class=Config):
     # Ensure routes are imported AFTER db initialization to avoid circular dependencies
     from routes import (
         auth_bp, dashboard_bp, staff_bp, visitors_bp, 
-        reports_bp, analytics_bp, settings_bp, camera_bp, events_bp
+        reports_bp, analytics_bp, settings_bp, camera_bp, events_bp, system_bp
     )
 
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
@@ -124,8 +182,14 @@ def create_app(config_class=Config):
     app.register_blueprint(settings_bp, url_prefix='/api/settings')
     app.register_blueprint(camera_bp, url_prefix='/api/camera')
     app.register_blueprint(events_bp, url_prefix='/api/events')
+    app.register_blueprint(system_bp, url_prefix='/api/system')
     ensure_default_admin(app)
 
+    if app.config.get('START_BACKGROUND_SERVICES', True):
+        @app.before_request
+        def start_services_once():
+            start_background_services(app)
+
     # --- JWT Configuration ---
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
@@ -175,4 +239,7 @@ def create_app(config_class=Config):
 app = create_app()
 
 if __name__ == '__main__':
+    # The debug reloader runs this block in a watcher and a serving process; only the latter starts services.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_services(app)
     socketio.run(app, host='0.0.0.0', port=5000, debug=True)
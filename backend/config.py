@@ -33,10 +33,118 @@ class Config:
     FACE_SIMILARITY_THRESHOLD = float(os.getenv('FACE_SIMILARITY_THRESHOLD', 0.5))
     STAFF_SIMILARITY_THRESHOLD = float(os.getenv('STAFF_SIMILARITY_THRESHOLD', 0.65))
     MIN_FACE_AREA = int(os.getenv('MIN_FACE_AREA', 11000))
-    BLUR_THRESHOLD = float(os.getenv('BLUR_THRESHOLD', 50.0))
+    # Laplacian variance of the face crop downscaled to QUALITY_BLUR_SIZE (downscaling
+    # raises it; 100 there is about 50 at full size). Re-fit with: python -m services.face_quality
+    BLUR_THRESHOLD = float(os.getenv('BLUR_THRESHOLD', 100.0))
     TILT_THRESHOLD = float(os.getenv('TILT_THRESHOLD', 0.25))
     UNKNOWN_FACE_MIN_FRAMES = int(os.getenv('UNKNOWN_FACE_MIN_FRAMES', 3))
     SESSION_GRACE_PERIOD = float(os.getenv('SESSION_GRACE_PERIOD', 2.0))
+    # Default detector input size (square); a camera's det_size overrides it, and a
+    # camera ROI detects only its regions at the same pixel scale
+    FACE_DET_SIZE = int(os.getenv('FACE_DET_SIZE', 640))
+    # Load the face models in a background thread at startup and run MODEL_WARMUP_RUNS
+    # blank inferences, so the first stream frame is not the one paying for it
+    MODEL_PRELOAD = os.getenv('MODEL_PRELOAD', 'true').lower() == 'true'
+    MODEL_WARMUP_RUNS = int(os.getenv('MODEL_WARMUP_RUNS', 2))
+    # ONNX Runtime sessions (detection and recognition). Intra-op threads 0 = CPU count
+    # divided by ORT_THREAD_SHARE, the processes running inference on the host (camera
+    # workers set it to their count). Pick values with: python -m services.ort_tuning
+    ORT_INTRA_OP_THREADS = int(os.getenv('ORT_INTRA_OP_THREADS', 0))
+    ORT_INTER_OP_THREADS = int(os.getenv('ORT_INTER_OP_THREADS', 1))
+    ORT_THREAD_SHARE = int(os.getenv('ORT_THREAD_SHARE', 1))
+    ORT_EXECUTION_MODE = os.getenv('ORT_EXECUTION_MODE', 'sequential')
+    ORT_GRAPH_OPTIMIZATION = os.getenv('ORT_GRAPH_OPTIMIZATION', 'all')
+    ORT_CPU_MEM_ARENA = os.getenv('ORT_CPU_MEM_ARENA', 'true').lower() == 'true'
+    ORT_MEM_PATTERN = os.getenv('ORT_MEM_PATTERN', 'true').lower() == 'true'
+    ORT_ALLOW_SPINNING = os.getenv('ORT_ALLOW_SPINNING', 'true').lower() == 'true'
+    # Aligned face crops per recognition-model call (faces that passed the quality gates)
+    RECOGNITION_BATCH_SIZE = int(os.getenv('RECOGNITION_BATCH_SIZE', 16))
+    # Face tracking: confirmed tracks keep their identity and are only re-embedded every
+    # TRACK_REVERIFY_INTERVAL seconds or when quality rises by TRACK_REVERIFY_QUALITY_GAIN
+    TRACK_IOU_THRESHOLD = float(os.getenv('TRACK_IOU_THRESHOLD', 0.3))
+    TRACK_MAX_AGE = float(os.getenv('TRACK_MAX_AGE', 1.5))
+    TRACK_REVERIFY_INTERVAL = float(os.getenv('TRACK_REVERIFY_INTERVAL', 3.0))
+    TRACK_REVERIFY_QUALITY_GAIN = float(os.getenv('TRACK_REVERIFY_QUALITY_GAIN', 1.25))
+    # Unidentified tracks embed only sightings that enter their best TRACK_BEST_SHOTS;
+    # a new visitor is enrolled from those (sharpest crop, quality-weighted template)
+    TRACK_BEST_SHOTS = int(os.getenv('TRACK_BEST_SHOTS', 3))
+    # Blur (gate and quality score) is measured on the face crop downscaled to this many
+    # pixels (0 = full resolution; then BLUR_THRESHOLD needs a full-size value, e.g. 50)
+    QUALITY_BLUR_SIZE = int(os.getenv('QUALITY_BLUR_SIZE', 96))
+    # Matched sightings adapt the visitor template once per track segment (track end or
+    # every TEMPLATE_FLUSH_INTERVAL seconds, 0 = track end only): the segment's
+    # quality-weighted mean is blended in at TEMPLATE_ADAPT_RATE if it has at least
+    # TEMPLATE_MIN_SAMPLES sightings and cosine >= TEMPLATE_MIN_AGREEMENT to the template
+    TEMPLATE_ADAPT_RATE = float(os.getenv('TEMPLATE_ADAPT_RATE', 0.15))
+    TEMPLATE_MIN_SAMPLES = int(os.getenv('TEMPLATE_MIN_SAMPLES', 3))
+    TEMPLATE_MIN_AGREEMENT = float(os.getenv('TEMPLATE_MIN_AGREEMENT', 0.60))
+    TEMPLATE_FLUSH_INTERVAL = float(os.getenv('TEMPLATE_FLUSH_INTERVAL', 60.0))
+    # Recognition results are persisted write-behind: events are queued (bounded) and a
+    # background writer commits them every RECOGNITION_WRITE_INTERVAL seconds or
+    # RECOGNITION_WRITE_BATCH events. New visitor ids are reserved VISITOR_ID_BLOCK at a time.
+    RECOGNITION_WRITE_QUEUE = int(os.getenv('RECOGNITION_WRITE_QUEUE', 2048))
+    RECOGNITION_WRITE_BATCH = int(os.getenv('RECOGNITION_WRITE_BATCH', 256))
+    RECOGNITION_WRITE_INTERVAL = float(os.getenv('RECOGNITION_WRITE_INTERVAL', 1.0))
+    VISITOR_ID_BLOCK = int(os.getenv('VISITOR_ID_BLOCK', 32))
+    # Visitor codes (ID<n>) come from the visitor_code_seq sequence, reserved this many
+    # per process round trip (1 keeps codes in order across workers, at one query each)
+    VISITOR_CODE_BLOCK = int(os.getenv('VISITOR_CODE_BLOCK', 16))
+    # Visitor snapshots are JPEG-encoded and written by a thread pool off the stream
+    # (inline when the queue is full). IMAGE_MAX_DIMENSION 0 keeps the crop size.
+    IMAGE_WRITE_WORKERS = int(os.getenv('IMAGE_WRITE_WORKERS', 2))
+    IMAGE_WRITE_QUEUE = int(os.getenv('IMAGE_WRITE_QUEUE', 64))
+    IMAGE_JPEG_QUALITY = int(os.getenv('IMAGE_JPEG_QUALITY', 95))
+    IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 0))
+    # Visitor PDFs: closed sessions enqueue report_jobs rows rendered by this many worker
+    # threads (0 = enqueue only, another process renders)
+    REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 2))
+    REPORT_JOB_POLL_INTERVAL = float(os.getenv('REPORT_JOB_POLL_INTERVAL', 2.0))
+    REPORT_JOB_STALE_SECONDS = float(os.getenv('REPORT_JOB_STALE_SECONDS', 600))
+    # A failed PDF job is retried after REPORT_JOB_RETRY_BACKOFF seconds, doubling per
+    # attempt, until it has been tried REPORT_JOB_MAX_ATTEMPTS times
+    REPORT_JOB_MAX_ATTEMPTS = int(os.getenv('REPORT_JOB_MAX_ATTEMPTS', 3))
+    REPORT_JOB_RETRY_BACKOFF = float(os.getenv('REPORT_JOB_RETRY_BACKOFF', 30))
+
+    # Stream analysis rate: 0 uses each camera's fps_limit. Inference is also throttled
+    # to at most MAX_DUTY of wall time (0 disables); skipped frames reuse tracked overlays.
+    STREAM_ANALYSIS_FPS = float(os.getenv('STREAM_ANALYSIS_FPS', 0))
+    STREAM_ANALYSIS_MAX_DUTY = float(os.getenv('STREAM_ANALYSIS_MAX_DUTY', 0.6))
+    # Feed encode profiles (?profile=preview|full): each is encoded at most once per frame
+    # and shared by its viewers. MAX_WIDTH 0 keeps the camera resolution.
+    STREAM_PREVIEW_MAX_WIDTH = int(os.getenv('STREAM_PREVIEW_MAX_WIDTH', 640))
+    STREAM_PREVIEW_JPEG_QUALITY = int(os.getenv('STREAM_PREVIEW_JPEG_QUALITY', 60))
+    STREAM_FULL_MAX_WIDTH = int(os.getenv('STREAM_FULL_MAX_WIDTH', 0))
+    STREAM_FULL_JPEG_QUALITY = int(os.getenv('STREAM_FULL_JPEG_QUALITY', 95))
+    # Per-frame detections (box, identity, score, gate reason) are published as SocketIO
+    # 'detections' events at most DETECTIONS_EMIT_FPS times a second (0 = off). With
+    # STREAM_DRAW_OVERLAYS off the feed is the raw video and clients draw the boxes.
+    DETECTIONS_EMIT_FPS = float(os.getenv('DETECTIONS_EMIT_FPS', 10))
+    STREAM_DRAW_OVERLAYS = os.getenv('STREAM_DRAW_OVERLAYS', 'true').lower() == 'true'
+
+    # 'inline' analyzes in one broadcaster thread per watched camera; 'process' runs one
+    # worker process per active camera (up to CAMERA_WORKER_MAX, 0 = CPU count) and
+    # streams relay its frames
+    CAMERA_WORKER_MODE = os.getenv('CAMERA_WORKER_MODE', 'inline')
+    CAMERA_WORKER_MAX = int(os.getenv('CAMERA_WORKER_MAX', 0))
+    # Runtime schema, camera/report workers and model preload start with `python app.py`,
+    # or on the first request when this is set (WSGI servers); never on a bare import
+    START_BACKGROUND_SERVICES = os.getenv('START_BACKGROUND_SERVICES', 'true').lower() == 'true'
+
+    # Recognition Gallery Cache
+    GALLERY_SYNC_INTERVAL = float(os.getenv('GALLERY_SYNC_INTERVAL', 15.0))
+    GALLERY_SYNC_LOOKBACK = float(os.getenv('GALLERY_SYNC_LOOKBACK', 30.0))
+    GALLERY_CHANGELOG_RETENTION_HOURS = float(os.getenv('GALLERY_CHANGELOG_RETENTION_HOURS', 24))
+    # Visitor search backend: 'exact' linear scan or 'ivf' approximate index with exact re-ranking
+    VISITOR_INDEX_BACKEND = os.getenv('VISITOR_INDEX_BACKEND', 'exact')
+    VISITOR_INDEX_NLIST = int(os.getenv('VISITOR_INDEX_NLIST', 0))
+    VISITOR_INDEX_NPROBE = int(os.getenv('VISITOR_INDEX_NPROBE', 16))
+    VISITOR_INDEX_MIN_TRAIN_SIZE = int(os.getenv('VISITOR_INDEX_MIN_TRAIN_SIZE', 20000))
+    # Compact embedding storage: 'float32', 'float16' or 'int8' (per-vector scale)
+    VISITOR_GALLERY_DTYPE = os.getenv('VISITOR_GALLERY_DTYPE', 'float32')
+    EMBEDDING_DB_FORMAT = os.getenv('EMBEDDING_DB_FORMAT', 'float32')
+    # Memory-mapped gallery snapshot for fast restarts (empty disables it)
+    GALLERY_SNAPSHOT_DIR = os.getenv('GALLERY_SNAPSHOT_DIR', os.path.join(BASE_DIR, 'cache', 'gallery'))
+    GALLERY_SNAPSHOT_INTERVAL = float(os.getenv('GALLERY_SNAPSHOT_INTERVAL', 300.0))
     
     # CORS
     CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
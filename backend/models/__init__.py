@@ -18,4 +18,6 @@ db = SQLAlchemy()
 from .user import User, ActivityLog
 from .staff import Staff, StaffImage
 from .visitor import Visitor, VisitorSession, VisitorImage
-from .camera import Camera, SystemSettings
\ No newline at end of file
+from .camera import Camera, SystemSettings
+from .gallery import GalleryChange
+from .report_job import ReportJob
\ No newline at end of file
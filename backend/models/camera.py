@@ -16,6 +16,10 @@ class Camera(db.Model):
     # SQL columns are separate integers
     resolution_width = db.Column(db.Integer, default=1920)
     resolution_height = db.Column(db.Integer, default=1080)
+    # Detection settings: detector input size (NULL = FACE_DET_SIZE) and regions of
+    # interest, a list of {x, y, w, h} or {points: [[x, y], ...]} in frame fractions
+    det_size = db.Column(db.Integer)
+    roi = db.Column(db.JSON)
 
     def to_dict(self):
         return {
@@ -31,7 +35,9 @@ class Camera(db.Model):
             'resolution': {
                 'width': self.resolution_width,
                 'height': self.resolution_height
-            }
+            },
+            'det_size': self.det_size,
+            'roi': self.roi or []
         }
 
 # Matches SQL Table: system_settings
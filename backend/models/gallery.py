@@ -0,0 +1,78 @@
+from sqlalchemy import event, inspect
+
+from models import db
+from models.staff import Staff, StaffImage
+from models.visitor import Visitor
+
+# Matches SQL Table: gallery_changes
+# Append-only changelog consumed by the recognition caches for incremental sync.
+# 'upsert' means "reload this entity"; a reload that finds no usable row removes it.
+class GalleryChange(db.Model):
+    __tablename__ = 'gallery_changes'
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)  # visitor, staff
+    entity_id = db.Column(db.Integer, nullable=False)
+    operation = db.Column(db.String(10), nullable=False)  # upsert, delete
+    changed_at = db.Column(db.DateTime, server_default=db.func.current_timestamp(), index=True)
+
+
+STAFF_PROFILE_FIELDS = ('staff_id', 'name', 'position', 'department', 'is_active')
+
+
+def _record_change(connection, entity, entity_id, operation):
+    if entity_id is None:
+        return
+    connection.execute(
+        GalleryChange.__table__.insert().values(entity=entity, entity_id=entity_id, operation=operation)
+    )
+
+
+def _attr_changed(target, *names):
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes() for name in names)
+
+
+@event.listens_for(Visitor, 'after_insert')
+def _visitor_inserted(mapper, connection, target):
+    if target.embedding is not None:
+        _record_change(connection, 'visitor', target.id, 'upsert')
+
+
+@event.listens_for(Visitor, 'after_update')
+def _visitor_updated(mapper, connection, target):
+    if _attr_changed(target, 'embedding', 'visitor_id'):
+        _record_change(connection, 'visitor', target.id, 'upsert')
+
+
+@event.listens_for(Visitor, 'after_delete')
+def _visitor_deleted(mapper, connection, target):
+    _record_change(connection, 'visitor', target.id, 'delete')
+
+
+@event.listens_for(Staff, 'after_update')
+def _staff_updated(mapper, connection, target):
+    if _attr_changed(target, *STAFF_PROFILE_FIELDS):
+        _record_change(connection, 'staff', target.id, 'upsert')
+
+
+@event.listens_for(Staff, 'after_delete')
+def _staff_deleted(mapper, connection, target):
+    _record_change(connection, 'staff', target.id, 'delete')
+
+
+@event.listens_for(StaffImage, 'after_insert')
+def _staff_image_inserted(mapper, connection, target):
+    if target.embedding is not None:
+        _record_change(connection, 'staff', target.staff_id, 'upsert')
+
+
+@event.listens_for(StaffImage, 'after_update')
+def _staff_image_updated(mapper, connection, target):
+    if _attr_changed(target, 'embedding', 'staff_id'):
+        _record_change(connection, 'staff', target.staff_id, 'upsert')
+
+
+@event.listens_for(StaffImage, 'after_delete')
+def _staff_image_deleted(mapper, connection, target):
+    _record_change(connection, 'staff', target.staff_id, 'upsert')
@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from models import db
+
+# Matches SQL Table: report_jobs
+# Visitor PDF generation queued by session closure and run by the report worker pool.
+# At most one 'queued' job per visitor: re-enqueueing only widens its event window.
+class ReportJob(db.Model):
+    __tablename__ = 'report_jobs'
+    __table_args__ = (
+        db.Index(
+            'uq_report_jobs_visitor_queued',
+            'visitor_id',
+            unique=True,
+            postgresql_where=db.text("status = 'queued'"),
+        ),
+        db.Index('idx_report_jobs_status_created', 'status', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    visitor_id = db.Column(db.Integer, db.ForeignKey('visitors.id', ondelete='CASCADE'), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    event_start = db.Column(db.DateTime)
+    event_end = db.Column(db.DateTime)
+    file_path = db.Column(db.String(255))
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # A failed job is queued again but not claimed before this time (retry backoff).
+    run_after = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    visitor = db.relationship('Visitor')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'visitor_id': self.visitor.visitor_id if self.visitor else None,
+            'visitor_db_id': self.visitor_id,
+            'status': self.status,
+            'event_start': self.event_start.isoformat() if self.event_start else None,
+            'event_end': self.event_end.isoformat() if self.event_end else None,
+            'file_path': self.file_path,
+            'error': self.error,
+            'attempts': self.attempts,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+        }
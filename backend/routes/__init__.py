@@ -10,6 +10,7 @@ analytics_bp = Blueprint('analytics_bp', __name__)
 settings_bp = Blueprint('settings_bp', __name__)
 camera_bp = Blueprint('camera_bp', __name__)
 events_bp = Blueprint('events_bp', __name__)
+system_bp = Blueprint('system_bp', __name__)
 
 # Import route modules so decorators bind handlers to each blueprint.
 # Without these imports, blueprints are registered with no routes.
@@ -22,3 +23,4 @@ from . import analytics  # noqa: F401,E402
 from . import settings  # noqa: F401,E402
 from . import camera  # noqa: F401,E402
 from . import events  # noqa: F401,E402
+from . import system  # noqa: F401,E402
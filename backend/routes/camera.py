@@ -1,10 +1,44 @@
-import cv2
-import datetime
 from flask import request, jsonify, Response, stream_with_context, current_app
 from flask_jwt_extended import jwt_required
 from routes import camera_bp
 from models import db
 from models.camera import Camera
+from services.camera_workers import get_camera_pool
+from services.frame_capture import capture_stats
+from services.stream_broadcast import STREAM_PROFILES, subscribe, unsubscribe
+
+def _detection_settings(data):
+    """Validated det_size/roi from a request body; returns (values, error message)."""
+    values = {}
+    if 'det_size' in data:
+        det_size = data.get('det_size')
+        if det_size is not None:
+            try:
+                det_size = int(det_size)
+            except (TypeError, ValueError):
+                return None, 'det_size must be an integer'
+            if det_size < 32 or det_size % 32:
+                return None, 'det_size must be a multiple of 32 (at least 32)'
+        values['det_size'] = det_size
+    if 'roi' in data:
+        roi = data.get('roi') or []
+        if not isinstance(roi, list):
+            return None, 'roi must be a list of regions'
+        for region in roi:
+            try:
+                if 'points' in region:
+                    points = [(float(x), float(y)) for x, y in region['points']]
+                    valid = len(points) >= 3 and all(0 <= v <= 1 for point in points for v in point)
+                else:
+                    x, y, w, h = (float(region[key]) for key in ('x', 'y', 'w', 'h'))
+                    valid = 0 <= x < 1 and 0 <= y < 1 and 0 < w <= 1 and 0 < h <= 1
+            except (TypeError, ValueError, KeyError):
+                valid = False
+            if not valid:
+                return None, 'each roi region must be {x, y, w, h} or {points: [[x, y], ...]} in 0-1 fractions'
+        values['roi'] = roi or None
+    return values, None
+
 
 @camera_bp.route('/', methods=['GET'])
 @jwt_required()
@@ -16,6 +50,9 @@ def get_cameras():
 @jwt_required()
 def create_camera():
     data = request.get_json()
+    detection, error = _detection_settings(data)
+    if error:
+        return jsonify({'error': error}), 400
     cam = Camera(
         camera_id=data.get('camera_id'),
         name=data.get('name'),
@@ -24,82 +61,83 @@ def create_camera():
         camera_type=data.get('camera_type', 'webcam'),
         # Extract resolution if nested in JSON from frontend
         resolution_width=data.get('resolution', {}).get('width', 1920),
-        resolution_height=data.get('resolution', {}).get('height', 1080)
+        resolution_height=data.get('resolution', {}).get('height', 1080),
+        **detection
     )
     db.session.add(cam)
     db.session.commit()
     return jsonify(cam.to_dict()), 201
 
-@camera_bp.route('/feed/<camera_id>', methods=['GET'])
-def stream_feed(camera_id):
-    """Stream MJPEG video with face detection overlays"""
+@camera_bp.route('/<camera_id>/detection', methods=['PUT'])
+@jwt_required()
+def update_detection_settings(camera_id):
+    """Set a camera's detector input size and regions of interest."""
     cam = Camera.query.filter_by(camera_id=camera_id).first()
     if not cam:
         return jsonify({'error': 'Camera not found'}), 404
+    detection, error = _detection_settings(request.get_json() or {})
+    if error:
+        return jsonify({'error': error}), 400
+    for key, value in detection.items():
+        setattr(cam, key, value)
+    db.session.commit()
+    return jsonify(cam.to_dict())
 
-    def gen(camera):
-        fr_service = None
-        last_inactive_cleanup = datetime.datetime.min
-        try:
-            # Import lazily to avoid hard-failing stream on model import issues.
-            from services.face_recognition import FaceRecognitionService
-            fr_service = FaceRecognitionService()
-        except Exception as exc:
-            current_app.logger.warning("Face model unavailable for stream: %s", exc)
+@camera_bp.route('/capture-stats', methods=['GET'])
+@jwt_required()
+def get_capture_stats():
+    """Per-camera capture counters: frames decoded, dropped as stale, delivered, latency."""
+    pool = get_camera_pool()
+    if pool is not None:
+        return jsonify(pool.stats())
+    return jsonify(capture_stats())
 
-        stream_url = (camera.stream_url or '0').strip()
-        source = 0 if stream_url in ('', '0') else stream_url
-        cap = cv2.VideoCapture(source)
-        
-        if not cap.isOpened():
-            current_app.logger.error("Could not open camera stream: %s", source)
-            return
+@camera_bp.route('/feed/<camera_id>', methods=['GET'])
+def stream_feed(camera_id):
+    """Stream MJPEG video with face detection overlays (?profile=preview|full)"""
+    cam = Camera.query.filter_by(camera_id=camera_id).first()
+    if not cam:
+        return jsonify({'error': 'Camera not found'}), 404
+    profile = (request.args.get('profile') or 'full').strip().lower()
+    if profile not in STREAM_PROFILES:
+        return jsonify({'error': f"profile must be one of: {', '.join(STREAM_PROFILES)}"}), 400
 
+    def gen(camera_id):
+        # One broadcaster per camera captures, analyzes and encodes; each viewer only
+        # reads the newest JPEG of its profile from its own slot.
+        broadcaster, slot = subscribe(current_app._get_current_object(), camera_id, profile)
         try:
             while True:
-                ret, frame = cap.read()
-                if not ret:
+                frame_bytes, captured_at = slot.get()
+                if frame_bytes is None:
                     break
-                
-                if fr_service is not None:
-                    try:
-                        from routes.events import get_event_state_snapshot
-                        event_state = get_event_state_snapshot(sync=True)
-                        event_active = bool(event_state.get('workflow_active'))
-                        selected_camera_id = event_state.get('selected_camera_id')
-                        if selected_camera_id and selected_camera_id != cam.camera_id:
-                            event_active = False
+                broadcaster.record_delivery(captured_at)
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n\r\n')
+        finally:
+            unsubscribe(broadcaster, slot)
 
-                        if event_active:
-                            frame = fr_service.process_frame_for_stream(
-                                frame,
-                                cam,
-                                event_context=event_state,
-                            )
-                        else:
-                            now_local = datetime.datetime.now()
-                            if (now_local - last_inactive_cleanup).total_seconds() >= 2.0:
-                                fr_service.finalize_active_sessions(
-                                    now_local=now_local,
-                                    event_start=event_state.get('start_time'),
-                                    event_end=event_state.get('end_time'),
-                                    camera_db_id=cam.id,
-                                )
-                                last_inactive_cleanup = now_local
-                    except Exception as exc:
-                        current_app.logger.warning("Stream frame annotation failed: %s", exc)
-                
-                ret, jpeg = cv2.imencode('.jpg', frame)
-                if not ret:
+    def gen_from_worker(pool, camera_id):
+        # Analysis runs in a camera worker process; this only relays its encoded frames.
+        # A timeout (worker restarting or still loading models) keeps the feed open.
+        pool.add_viewer(camera_id, profile)
+        try:
+            seq = 0
+            while True:
+                seq, frame_bytes = pool.read(camera_id, seq, profile=profile)
+                if frame_bytes is None:
+                    if not pool.serves(camera_id):
+                        break
                     continue
-                frame_bytes = jpeg.tobytes()
                 yield (b'--frame\r\n'
                        b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n\r\n')
         finally:
-            cap.release()
+            pool.remove_viewer(camera_id, profile)
 
+    pool = get_camera_pool()
+    body = gen_from_worker(pool, cam.camera_id) if pool is not None else gen(cam.camera_id)
     return Response(
-        stream_with_context(gen(cam)),
+        stream_with_context(body),
         mimetype='multipart/x-mixed-replace; boundary=frame',
         headers={
             'Cache-Control': 'no-cache, no-store, must-revalidate',
@@ -75,3 +75,61 @@ def download_visitor_report(visitor_id):
     from services.report_generator import ReportGenerator
     filepath = ReportGenerator().generate_visitor_pdf(visitor)
     return send_file(filepath, as_attachment=True, download_name=os.path.basename(filepath))
+
+
+@reports_bp.route('/jobs', methods=['GET'])
+@jwt_required()
+def list_report_jobs():
+    from sqlalchemy.orm import joinedload
+    from models.report_job import ReportJob
+
+    query = ReportJob.query.options(joinedload(ReportJob.visitor))
+    status = request.args.get('status')
+    if status:
+        query = query.filter_by(status=status)
+    visitor_code = request.args.get('visitor_id')
+    if visitor_code:
+        query = query.join(Visitor, Visitor.id == ReportJob.visitor_id).filter(Visitor.visitor_id == visitor_code)
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+    jobs = query.order_by(ReportJob.created_at.desc()).limit(limit).all()
+    return jsonify([job.to_dict() for job in jobs])
+
+
+@reports_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_report_job(job_id):
+    from models.report_job import ReportJob
+
+    return jsonify(ReportJob.query.get_or_404(job_id).to_dict())
+
+
+@reports_bp.route('/jobs/<int:job_id>/download', methods=['GET'])
+@jwt_required()
+def download_report_job(job_id):
+    from models.report_job import ReportJob
+
+    job = ReportJob.query.get_or_404(job_id)
+    if job.status != 'done' or not job.file_path:
+        return jsonify({'error': f'Report job is {job.status}'}), 409
+    filepath = os.path.join(current_app.config['REPORTS_FOLDER'], job.file_path)
+    return send_file(filepath, as_attachment=True, download_name=os.path.basename(filepath))
+
+
+@reports_bp.route('/visitor/<visitor_id>/jobs', methods=['POST'])
+@jwt_required()
+def enqueue_visitor_report_job(visitor_id):
+    from models import db
+    from models.report_job import ReportJob
+    from services.report_jobs import enqueue_visitor_report, notify_report_workers
+
+    visitor = Visitor.query.filter_by(visitor_id=visitor_id).first_or_404()
+    data = request.get_json(silent=True) or {}
+    try:
+        event_start = datetime.fromisoformat(data['event_start']) if data.get('event_start') else None
+        event_end = datetime.fromisoformat(data['event_end']) if data.get('event_end') else None
+    except ValueError:
+        return jsonify({'error': 'event_start and event_end must be ISO datetimes'}), 400
+    job_id = enqueue_visitor_report(visitor.id, event_start, event_end)
+    db.session.commit()
+    notify_report_workers()
+    return jsonify(ReportJob.query.get(job_id).to_dict()), 202
@@ -21,7 +21,7 @@ DEFAULT_SETTINGS = {
         'description': 'Legacy alias for similarity threshold',
     },
     'blur_threshold': {
-        'value': 50.0,
+        'value': 100.0,
         'value_type': 'float',
         'description': 'Blur detection threshold',
     },
@@ -154,3 +154,22 @@ def update_settings():
 
     db.session.commit()
     return jsonify({'updated': sorted(set(updated_keys))})
+
+
+
+@settings_bp.route('/recognition/rebuild-cache', methods=['POST'])
+@jwt_required()
+def rebuild_recognition_cache():
+    try:
+        from services.camera_workers import get_camera_pool
+
+        pool = get_camera_pool()
+        if pool is not None:
+            # Matching happens in the camera workers; each rebuilds its own caches.
+            return jsonify({'workers': pool.send_all('rebuild')}), 202
+        from services.face_recognition import FaceRecognitionService
+        counts = FaceRecognitionService().rebuild_caches()
+    except Exception as exc:
+        current_app.logger.exception("Recognition cache rebuild failed")
+        return jsonify({'error': str(exc)}), 500
+    return jsonify(counts)
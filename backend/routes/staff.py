@@ -7,12 +7,24 @@ from models import db
 from models.staff import Staff, StaffImage
 from sqlalchemy.exc import IntegrityError
 from werkzeug.utils import secure_filename
+from utils.embedding_codec import encode_embedding
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'bmp'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _refresh_staff_cache():
+    """Reload staff where faces are matched: the camera workers if any, else this process."""
+    from services.camera_workers import get_camera_pool
+
+    pool = get_camera_pool()
+    if pool is not None:
+        pool.send_all('refresh_staff')
+        return
+    from services.face_recognition import FaceRecognitionService
+    FaceRecognitionService().refresh_staff_cache()
+
 @staff_bp.route('/', methods=['GET'])
 @jwt_required()
 def get_staff():
@@ -67,7 +79,7 @@ def create_staff():
                 new_image = StaffImage(
                     staff_id=new_staff.id,
                     image_path=f"staff/{filename}",
-                    embedding=embedding.tobytes() if embedding is not None else None,
+                    embedding=encode_embedding(embedding, current_app.config.get('EMBEDDING_DB_FORMAT', 'float32')),
                     is_primary=not has_primary
                 )
                 has_primary = True
@@ -81,8 +93,7 @@ def create_staff():
         
         db.session.commit()
         try:
-            from services.face_recognition import FaceRecognitionService
-            FaceRecognitionService().refresh_staff_cache()
+            _refresh_staff_cache()
         except Exception:
             # Staff creation should not fail if cache refresh fails.
             pass
@@ -114,6 +125,11 @@ def update_staff(id):
     staff.phone = data.get('phone', staff.phone)
     
     db.session.commit()
+    try:
+        _refresh_staff_cache()
+    except Exception:
+        # Cached overlay labels refresh on the next periodic sync otherwise.
+        pass
     return jsonify(staff.to_dict())
 
 @staff_bp.route('/<int:id>', methods=['DELETE'])
@@ -123,8 +139,7 @@ def delete_staff(id):
     db.session.delete(staff)
     db.session.commit()
     try:
-        from services.face_recognition import FaceRecognitionService
-        FaceRecognitionService().refresh_staff_cache()
+        _refresh_staff_cache()
     except Exception:
         pass
     return jsonify({'message': 'Staff member deleted'})
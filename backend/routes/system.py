@@ -0,0 +1,10 @@
+from flask import jsonify
+from routes import system_bp
+from services.model_preload import model_status
+
+
+@system_bp.route('/ready', methods=['GET'])
+def readiness():
+    """Readiness probe: 200 once the face models are loaded and warmed, else 503."""
+    status = model_status()
+    return jsonify(status), 200 if status['ready'] else 503
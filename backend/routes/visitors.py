@@ -3,19 +3,10 @@ from flask_jwt_extended import jwt_required
 from routes import visitors_bp
 from models import db
 from models.visitor import Visitor, VisitorSession
+from services.visitor_codes import claim_visitor_code, next_visitor_code
 from datetime import datetime
-import re
 from sqlalchemy import and_, or_
-
-
-def _next_visitor_code():
-    max_num = 0
-    for value in db.session.query(Visitor.visitor_id).all():
-        visitor_id = value[0] or ''
-        match = re.match(r'^ID(\d+)$', visitor_id)
-        if match:
-            max_num = max(max_num, int(match.group(1)))
-    return f"ID{max_num + 1}"
+from sqlalchemy.exc import IntegrityError
 
 
 def _format_duration(seconds):
@@ -152,15 +143,25 @@ def check_in():
         visitor = Visitor.query.filter_by(visitor_id=external_visitor_id).first()
 
     if visitor is None:
-        generated_id = external_visitor_id or _next_visitor_code()
-        visitor = Visitor(
-            visitor_id=generated_id,
-            first_seen=datetime.now(),
-            last_seen=datetime.now(),
-            visit_count=1
-        )
-        db.session.add(visitor)
-        db.session.flush()
+        if external_visitor_id:
+            claim_visitor_code(external_visitor_id)
+        generated_id = external_visitor_id or next_visitor_code()
+        for attempt in range(3):
+            visitor = Visitor(
+                visitor_id=generated_id,
+                first_seen=datetime.now(),
+                last_seen=datetime.now(),
+                visit_count=1
+            )
+            try:
+                with db.session.begin_nested():
+                    db.session.add(visitor)
+                break
+            except IntegrityError:
+                # A generated code can collide with one assigned by hand; draw another.
+                if external_visitor_id or attempt == 2:
+                    raise
+                generated_id = next_visitor_code()
     else:
         visitor.last_seen = datetime.now()
         visitor.visit_count = (visitor.visit_count or 0) + 1
@@ -193,13 +194,10 @@ def check_out(id):
     active_session.exit_time = datetime.now()
     active_session.is_active = False
     visitor.last_seen = datetime.now()
+    # The PDF is rendered by the report workers; closing the session only queues it.
+    from services.report_jobs import enqueue_visitor_report, notify_report_workers
+    enqueue_visitor_report(visitor.id)
     db.session.commit()
-
-    try:
-        from services.report_generator import ReportGenerator
-        ReportGenerator().generate_visitor_pdf(visitor)
-    except Exception:
-        # Session closure should still succeed even if report generation fails.
-        pass
+    notify_report_workers()
 
     return jsonify(active_session.to_dict())
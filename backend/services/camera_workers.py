@@ -0,0 +1,426 @@
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+WORKER_ROLE_ENV = 'CAMERA_WORKER_ROLE'
+_STATS_INTERVAL = 1.0
+
+
+def is_camera_worker() -> bool:
+    return os.getenv(WORKER_ROLE_ENV) == 'worker'
+
+
+def _worker_main(camera_id: str, snapshot_writer: bool, thread_share: int, control, results):
+    """
+    Entry point of a camera worker process: capture, analyze and annotate one camera.
+
+    The process builds its own app and FaceRecognitionService. The visitor gallery is
+    restored from the shared snapshot (copy-on-write memory map) and then follows the
+    gallery changelog like any other process, so matching reads a shared gallery.
+    Frames are only JPEG-encoded and sent back for the profiles the web process has
+    viewers of, once per profile. Detections are always sent back (throttled) so the
+    web process can publish them over SocketIO.
+    """
+    from app import app
+    from models.camera import Camera
+    from services.detection_events import DetectionPublisher
+    from services.frame_capture import acquire_grabber, camera_source, release_grabber
+    from services.image_store import shutdown_image_writer
+    from services.stream_broadcast import STREAM_PROFILES, encode_jpeg, profile_settings
+    from services.stream_overlay import draw_overlays
+    from services.stream_pipeline import StreamPipeline
+
+    app.config['GALLERY_SNAPSHOT_WRITE'] = bool(snapshot_writer)
+    # Inference threads are split across the running workers; the pool sends a new
+    # share whenever cameras are added or removed.
+    app.config['ORT_THREAD_SHARE'] = max(1, int(thread_share))
+    with app.app_context():
+        camera = Camera.query.filter_by(camera_id=camera_id).first()
+        if camera is None:
+            return
+        fr_service = None
+        try:
+            from services.face_recognition import FaceRecognitionService
+            fr_service = FaceRecognitionService()
+            fr_service.warm_up(int(app.config.get('MODEL_WARMUP_RUNS', 2)))
+        except Exception as exc:
+            app.logger.warning("Face model unavailable for camera worker %s: %s", camera_id, exc)
+
+        grabber = acquire_grabber(camera.camera_id, camera_source(camera), logger=app.logger)
+        if grabber is None:
+            app.logger.error("Camera worker could not open stream: %s", camera_id)
+            return
+
+        state = {'event': {}, 'viewers': {}, 'stop': False}
+        settings = {profile: profile_settings(app.config, profile) for profile in STREAM_PROFILES}
+        draw = bool(app.config.get('STREAM_DRAW_OVERLAYS', True))
+
+        def send_detections(payload):
+            try:
+                results.put_nowait({'type': 'detections', 'camera_id': camera_id, 'payload': payload})
+            except queue.Full:
+                pass
+
+        publisher = DetectionPublisher(
+            camera_id,
+            emit=send_detections,
+            max_fps=float(app.config.get('DETECTIONS_EMIT_FPS', 10.0)),
+        )
+        pipeline = StreamPipeline(
+            fr_service,
+            camera,
+            lambda: state['event'],
+            fps_limit=float(app.config.get('STREAM_ANALYSIS_FPS', 0)) or camera.fps_limit,
+            max_duty=float(app.config.get('STREAM_ANALYSIS_MAX_DUTY', 0.6)),
+            logger=app.logger,
+        )
+        grabber.analysis = pipeline
+        last_stats = 0.0
+        sent_dropped = 0
+        try:
+            seq = 0
+            while not state['stop']:
+                while True:
+                    try:
+                        kind, payload = control.get_nowait()
+                    except queue.Empty:
+                        break
+                    if kind == 'stop':
+                        state['stop'] = True
+                    elif kind == 'threads':
+                        app.config['ORT_THREAD_SHARE'] = max(1, int(payload))
+                        if fr_service is not None and fr_service.resize_sessions(app.config['ORT_THREAD_SHARE']):
+                            app.logger.info(
+                                "Camera worker %s: %d inference threads",
+                                camera_id,
+                                fr_service.ort_settings['intra_op_threads'],
+                            )
+                    elif kind == 'refresh_staff':
+                        if fr_service is not None:
+                            fr_service.refresh_staff_cache()
+                    elif kind == 'rebuild':
+                        if fr_service is not None:
+                            fr_service.rebuild_caches()
+                    else:
+                        state[kind] = payload
+                if state['stop']:
+                    break
+
+                seq, frame, captured_at = grabber.read(seq, timeout=1.0)
+                if frame is None:
+                    if not grabber.running:
+                        break
+                    continue
+
+                overlays = pipeline.process(frame)
+                publisher.publish(overlays, frame.shape, captured_at, pipeline.last_analyzed)
+                profiles = [profile for profile, count in state['viewers'].items() if count > 0]
+                if profiles and draw and overlays:
+                    frame = draw_overlays(frame.copy(), overlays)
+                for profile in profiles:
+                    jpeg = encode_jpeg(frame, *settings[profile])
+                    if jpeg is None:
+                        continue
+                    try:
+                        results.put_nowait({
+                            'type': 'frame',
+                            'camera_id': camera_id,
+                            'profile': profile,
+                            'jpeg': jpeg,
+                            'captured_at': captured_at,
+                        })
+                        grabber.record_delivery(captured_at)
+                    except queue.Full:
+                        sent_dropped += 1
+
+                now = time.time()
+                if now - last_stats >= _STATS_INTERVAL:
+                    stats = grabber.stats()
+                    stats['queue_dropped'] = sent_dropped
+                    stats['pid'] = os.getpid()
+                    try:
+                        results.put_nowait({'type': 'stats', 'camera_id': camera_id, 'stats': stats})
+                    except queue.Full:
+                        pass
+                    last_stats = now
+        finally:
+            release_grabber(grabber)
+            # Spawned processes skip atexit handlers; commit queued results explicitly.
+            if fr_service is not None:
+                fr_service.shutdown()
+            shutdown_image_writer()
+
+
+class _WorkerHandle:
+    def __init__(self, process, control, config: Tuple, thread_share: int = 1):
+        self.process = process
+        self.control = control
+        self.config = config
+        self.thread_share = thread_share
+        self.started_at = time.time()
+        self.event_state = None
+        self.viewers: Dict[str, int] = {}
+
+
+class CameraWorkerPool:
+    """
+    Runs one analysis process per active camera, independent of HTTP viewers.
+
+    A supervisor thread in the web process reconciles workers with the active cameras,
+    restarts dead ones and forwards the event state (which lives in this process). A
+    collector thread keeps the newest encoded frame and stats per camera for streams.
+    """
+
+    def __init__(self, app, max_workers: int, poll_interval: float = 1.0, result_queue_size: int = 64):
+        self.app = app
+        self.max_workers = max(1, int(max_workers))
+        self.poll_interval = poll_interval
+        # spawn: ONNX Runtime and capture threads do not survive fork.
+        self._ctx = mp.get_context('spawn')
+        self._results = self._ctx.Queue(maxsize=result_queue_size)
+        self._workers: Dict[str, _WorkerHandle] = {}
+        self._writer_id: Optional[str] = None
+        # Viewer counts and newest frames are kept per (camera, profile). Frame numbers
+        # keep counting across worker restarts so open feeds pick up the new worker.
+        self._viewers: Dict[str, Dict[str, int]] = {}
+        self._frames: Dict[Tuple[str, str], Tuple[int, Optional[bytes]]] = {}
+        # Cameras the supervisor last found active; None until its first pass.
+        self._active: Optional[set] = None
+        self._stats: Dict[str, Dict] = {}
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for target, name in ((self._supervise, 'camera-supervisor'), (self._collect, 'camera-collector')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            handles = list(self._workers.items())
+            self._workers.clear()
+        for camera_id, handle in handles:
+            self._stop_worker(camera_id, handle)
+
+    def _spawn(self, camera_id: str, config: Tuple, snapshot_writer: bool, thread_share: int = 1) -> _WorkerHandle:
+        control = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(camera_id, snapshot_writer, thread_share, control, self._results),
+            name=f"camera-worker-{camera_id}",
+            daemon=True,
+        )
+        # The child re-imports the app; the role variable keeps it from starting its own pool.
+        previous = os.environ.get(WORKER_ROLE_ENV)
+        os.environ[WORKER_ROLE_ENV] = 'worker'
+        try:
+            process.start()
+        finally:
+            if previous is None:
+                os.environ.pop(WORKER_ROLE_ENV, None)
+            else:
+                os.environ[WORKER_ROLE_ENV] = previous
+        self.app.logger.info("Started camera worker %s (pid %s)", camera_id, process.pid)
+        return _WorkerHandle(process, control, config, thread_share)
+
+    def _stop_worker(self, camera_id: str, handle: _WorkerHandle):
+        try:
+            handle.control.put_nowait(('stop', None))
+        except Exception:
+            pass
+        handle.process.join(timeout=5.0)
+        if handle.process.is_alive():
+            handle.process.terminate()
+            handle.process.join(timeout=2.0)
+        with self._cond:
+            for key in [key for key in self._frames if key[0] == camera_id]:
+                # Drop the stale frame but keep its number.
+                self._frames[key] = (self._frames[key][0], None)
+            self._stats.pop(camera_id, None)
+            self._cond.notify_all()
+        self.app.logger.info("Stopped camera worker %s", camera_id)
+
+    def _wanted_cameras(self) -> Dict[str, Tuple]:
+        from models import db
+        from models.camera import Camera
+
+        with self.app.app_context():
+            try:
+                cameras = (
+                    Camera.query.filter_by(is_active=True)
+                    .order_by(Camera.id)
+                    .limit(self.max_workers)
+                    .all()
+                )
+                # A change to any of these restarts the camera's worker.
+                return {
+                    cam.camera_id: (cam.stream_url, cam.fps_limit, cam.det_size, repr(cam.roi))
+                    for cam in cameras
+                }
+            finally:
+                db.session.remove()
+
+    def _supervise(self):
+        from routes.events import get_event_state_snapshot
+
+        while not self._stop.is_set():
+            try:
+                wanted = self._wanted_cameras()
+                with self._cond:
+                    self._active = set(wanted)
+                    self._cond.notify_all()
+                event_state = get_event_state_snapshot(sync=True)
+                self._reconcile(wanted, event_state)
+            except Exception as exc:
+                self.app.logger.warning("Camera worker supervision failed: %s", exc)
+            self._stop.wait(self.poll_interval)
+
+    def _reconcile(self, wanted: Dict[str, Tuple], event_state: Dict):
+        with self._lock:
+            stale = [
+                camera_id
+                for camera_id, handle in self._workers.items()
+                if camera_id not in wanted or handle.config != wanted[camera_id] or not handle.process.is_alive()
+            ]
+            stopping = [(camera_id, self._workers.pop(camera_id)) for camera_id in stale]
+        for camera_id, handle in stopping:
+            self._stop_worker(camera_id, handle)
+
+        with self._lock:
+            share = max(1, len(wanted))
+            for camera_id, config in wanted.items():
+                if camera_id not in self._workers:
+                    # Exactly one worker refreshes the shared gallery snapshot.
+                    writer = self._writer_id not in self._workers
+                    self._workers[camera_id] = self._spawn(
+                        camera_id, config, snapshot_writer=writer, thread_share=share
+                    )
+                    if writer:
+                        self._writer_id = camera_id
+            for camera_id, handle in self._workers.items():
+                # Keep the cores split across the workers actually running.
+                if handle.thread_share != share:
+                    handle.control.put(('threads', share))
+                    handle.thread_share = share
+                viewers = dict(self._viewers.get(camera_id, {}))
+                if handle.event_state != event_state:
+                    handle.control.put(('event', event_state))
+                    handle.event_state = event_state
+                if handle.viewers != viewers:
+                    handle.control.put(('viewers', viewers))
+                    handle.viewers = viewers
+
+    def _collect(self):
+        from services.detection_events import emit_detections
+
+        while not self._stop.is_set():
+            try:
+                message = self._results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+            camera_id = message.get('camera_id')
+            with self._cond:
+                if message.get('type') == 'frame':
+                    key = (camera_id, message.get('profile', 'full'))
+                    seq = self._frames.get(key, (0, b''))[0] + 1
+                    self._frames[key] = (seq, message['jpeg'])
+                    self._cond.notify_all()
+                elif message.get('type') == 'stats':
+                    self._stats[camera_id] = message['stats']
+            if message.get('type') == 'detections':
+                try:
+                    emit_detections(message['payload'])
+                except Exception as exc:
+                    self.app.logger.warning("Detections publish failed for %s: %s", camera_id, exc)
+
+    def send_all(self, kind: str, payload=None) -> int:
+        """
+        Queue a control message ('refresh_staff', 'rebuild') for every running worker,
+        which holds the galleries that match faces; returns how many were sent.
+        """
+        with self._lock:
+            handles = list(self._workers.values())
+        for handle in handles:
+            handle.control.put((kind, payload))
+        return len(handles)
+
+    def add_viewer(self, camera_id: str, profile: str = 'full'):
+        self._set_viewers(camera_id, profile, 1)
+
+    def remove_viewer(self, camera_id: str, profile: str = 'full'):
+        self._set_viewers(camera_id, profile, -1)
+
+    def _set_viewers(self, camera_id: str, profile: str, delta: int):
+        with self._lock:
+            counts = self._viewers.setdefault(camera_id, {})
+            counts[profile] = max(0, counts.get(profile, 0) + delta)
+            viewers = dict(counts)
+            handle = self._workers.get(camera_id)
+            if handle is not None and handle.viewers != viewers:
+                handle.control.put(('viewers', viewers))
+                handle.viewers = viewers
+
+    def read(
+        self, camera_id: str, after_seq: int = 0, timeout: float = 10.0, profile: str = 'full'
+    ) -> Tuple[int, Optional[bytes]]:
+        """Newest encoded frame of a camera profile newer than ``after_seq``; None on timeout."""
+        key = (camera_id, profile)
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                seq, data = self._frames.get(key, (0, None))
+                if seq > after_seq and data is not None:
+                    return seq, data
+                remaining = deadline - time.time()
+                if remaining <= 0 or self._stop.is_set():
+                    return after_seq, None
+                self._cond.wait(remaining)
+
+    def serves(self, camera_id: str) -> bool:
+        """
+        False once the pool has stopped or the camera is no longer active. A camera
+        whose worker is (re)starting, or not started yet, is still served.
+        """
+        with self._cond:
+            if self._stop.is_set():
+                return False
+            return self._active is None or camera_id in self._active
+
+    def stats(self):
+        with self._lock:
+            alive = {camera_id: handle.process.is_alive() for camera_id, handle in self._workers.items()}
+        with self._cond:
+            return [
+                {**self._stats.get(camera_id, {'camera_id': camera_id}), 'worker_alive': is_alive}
+                for camera_id, is_alive in alive.items()
+            ]
+
+
+_pool: Optional[CameraWorkerPool] = None
+
+
+def start_camera_workers(app) -> Optional[CameraWorkerPool]:
+    """Start the process pool when CAMERA_WORKER_MODE is 'process' (never inside a worker)."""
+    global _pool
+    mode = (app.config.get('CAMERA_WORKER_MODE') or 'inline').strip().lower()
+    if mode != 'process' or is_camera_worker() or _pool is not None:
+        return _pool
+    max_workers = int(app.config.get('CAMERA_WORKER_MAX', 0)) or (os.cpu_count() or 1)
+    # A camera worker owns the snapshot; the web process only reads it.
+    app.config['GALLERY_SNAPSHOT_WRITE'] = False
+    _pool = CameraWorkerPool(app, max_workers=max_workers)
+    _pool.start()
+    return _pool
+
+
+def get_camera_pool() -> Optional[CameraWorkerPool]:
+    return _pool
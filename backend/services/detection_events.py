@@ -0,0 +1,60 @@
+import time
+from typing import Callable, Dict, List, Optional
+
+from services.stream_overlay import detections
+
+DETECTIONS_EVENT = 'detections'
+
+
+def emit_detections(payload: Dict):
+    """Broadcast one detections payload on the app's SocketIO instance."""
+    from app import socketio
+
+    if socketio is not None:
+        socketio.emit(DETECTIONS_EVENT, payload)
+
+
+class DetectionPublisher:
+    """
+    Publishes a camera's per-frame detections, at most ``max_fps`` times a second.
+
+    Boxes are in source-frame pixels (``width`` x ``height``), so clients can draw them
+    over any stream profile. An empty frame is sent once, to clear client overlays,
+    and then not again until something is detected.
+    """
+
+    def __init__(self, camera_id: str, emit: Callable[[Dict], None] = emit_detections, max_fps: float = 10.0):
+        self.camera_id = camera_id
+        self.emit = emit
+        self.interval = 1.0 / max_fps if max_fps > 0 else None
+        self._last_emit = 0.0
+        self._last_empty = False
+        self.published = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval is not None
+
+    def publish(self, overlays: List[Dict], frame_shape, captured_at: float, analyzed: bool) -> Optional[Dict]:
+        if self.interval is None:
+            return None
+        now = time.time()
+        empty = not overlays
+        if empty and self._last_empty:
+            return None
+        if not empty and now - self._last_emit < self.interval:
+            return None
+        height, width = frame_shape[:2]
+        payload = {
+            'camera_id': self.camera_id,
+            'captured_at': captured_at,
+            'width': int(width),
+            'height': int(height),
+            'analyzed': bool(analyzed),
+            'detections': detections(overlays),
+        }
+        self._last_emit = now
+        self._last_empty = empty
+        self.published += 1
+        self.emit(payload)
+        return payload
@@ -0,0 +1,412 @@
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from services.gallery_index import DenseRows, ExactIndex
+from utils.embedding_codec import STORAGE_DTYPES, quantize_rows
+
+
+def normalize_rows(matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """L2-normalize rows; returns (normalized, mask of rows with non-zero norm)."""
+    arr = np.asarray(matrix, dtype=np.float32)
+    if arr.ndim == 1:
+        arr = arr.reshape(1, -1)
+    norms = np.linalg.norm(arr, axis=1)
+    valid = norms > 0
+    out = np.zeros_like(arr)
+    out[valid] = arr[valid] / norms[valid, None]
+    return out, valid
+
+
+class VisitorGallery:
+    """
+    Visitor embeddings kept as one contiguous matrix plus a parallel id array.
+
+    Rows are addressed through ``_row_of`` so new visitors and EMA template updates
+    patch the matrix in place. Matching goes through a pluggable search index
+    (see ``services.gallery_index``); the default is one exact matrix product.
+    ``storage`` selects float32, float16 or int8 (with a per-row scale) rows; compact
+    rows are scored directly in bounded chunks.
+    """
+
+    def __init__(self, capacity: int = 1024, index=None, storage: str = 'float32'):
+        if storage not in STORAGE_DTYPES:
+            raise ValueError(f"Unsupported gallery storage: {storage}")
+        self._initial_capacity = max(1, int(capacity))
+        self._index = index if index is not None else ExactIndex()
+        self.storage = storage
+        self._matrix: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._size = 0
+        self._row_of: Dict[int, int] = {}
+        self._codes: Dict[int, str] = {}
+        # Bumped on every mutation so callers can tell whether a snapshot is stale.
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, db_id) -> bool:
+        return db_id in self._row_of
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self._matrix is None else int(self._matrix.shape[1])
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._size]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by live rows (codes plus scales)."""
+        if self._matrix is None:
+            return 0
+        total = self._matrix[:self._size].nbytes
+        if self._scales is not None:
+            total += self._scales[:self._size].nbytes
+        return int(total)
+
+    def rows(self) -> DenseRows:
+        if self._matrix is None:
+            return DenseRows(np.empty((0, 0), dtype=np.float32))
+        scales = None if self._scales is None else self._scales[:self._size]
+        return DenseRows(self._matrix[:self._size], scales)
+
+    @property
+    def index(self):
+        return self._index
+
+    def set_index(self, index):
+        self._index = index if index is not None else ExactIndex()
+        self._index.build(self.rows())
+
+    def index_training_sample(self) -> Optional[np.ndarray]:
+        """Rows for the index to train on when (re)training is due, else None."""
+        return self._index.training_sample(self.rows())
+
+    def install_index(self, centroids: np.ndarray):
+        self._index.install(centroids, self.rows())
+
+    def code(self, db_id: int) -> Optional[str]:
+        return self._codes.get(db_id)
+
+    def set_code(self, db_id: int, code: str):
+        if db_id in self._row_of:
+            self._codes[db_id] = code
+            self.version += 1
+
+    def vector(self, db_id: int) -> Optional[np.ndarray]:
+        row = self._row_of.get(db_id)
+        if row is None:
+            return None
+        return self.rows().decode([row])[0].copy()
+
+    def _allocate(self, capacity: int, dim: int):
+        matrix = np.zeros((capacity, dim), dtype=np.dtype(self.storage))
+        scales = np.ones(capacity, dtype=np.float32) if self.storage == 'int8' else None
+        ids = np.full(capacity, -1, dtype=np.int64)
+        return matrix, scales, ids
+
+    def _reserve(self, dim: int, needed: int):
+        if self._matrix is None:
+            self._matrix, self._scales, self._ids = self._allocate(max(self._initial_capacity, needed), dim)
+            return
+        if self._matrix.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match gallery dimension {self._matrix.shape[1]}")
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        matrix, scales, ids = self._allocate(capacity, dim)
+        matrix[:self._size] = self._matrix[:self._size]
+        if scales is not None:
+            scales[:self._size] = self._scales[:self._size]
+        ids[:self._size] = self._ids[:self._size]
+        self._matrix, self._scales, self._ids = matrix, scales, ids
+
+    def _write_rows(self, rows, vectors: np.ndarray):
+        data, scales = quantize_rows(vectors, self.storage)
+        self._matrix[rows] = data
+        if scales is not None:
+            self._scales[rows] = scales
+
+    def load(self, db_ids: Iterable[int], vectors: np.ndarray, codes: Iterable[str]):
+        """Replace the whole gallery; ``vectors`` must already be normalized float32."""
+        db_ids = np.asarray(list(db_ids), dtype=np.int64)
+        codes = list(codes)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._matrix = None
+        self._scales = None
+        self._size = 0
+        self._row_of = {}
+        self._codes = {}
+        self._ids = np.empty(0, dtype=np.int64)
+        if len(db_ids):
+            self._reserve(vectors.shape[1], len(db_ids))
+            self._write_rows(slice(0, len(db_ids)), vectors)
+            self._ids[:len(db_ids)] = db_ids
+            self._size = len(db_ids)
+            self._row_of = {int(db_id): row for row, db_id in enumerate(db_ids.tolist())}
+            self._codes = {int(db_id): code for db_id, code in zip(db_ids.tolist(), codes)}
+        self._index.build(self.rows())
+        self.version += 1
+
+    def adopt(self, db_ids: np.ndarray, matrix: np.ndarray, codes: Iterable[str], scales: Optional[np.ndarray] = None):
+        """
+        Use ``matrix`` (e.g. a copy-on-write memmap of a snapshot) as the backing store
+        without copying it. The first insert past its length moves the rows into RAM.
+        Rows stored in a different representation are converted once.
+        """
+        db_ids = np.array(db_ids, dtype=np.int64)
+        if len(db_ids) and (matrix.dtype != np.dtype(self.storage) or (self.storage == 'int8') != (scales is not None)):
+            self.load(db_ids, DenseRows(matrix, scales).decode(), codes)
+            return
+        self._matrix = matrix if len(db_ids) else None
+        self._scales = None if scales is None or not len(db_ids) else np.array(scales, dtype=np.float32)
+        self._ids = db_ids
+        self._size = len(db_ids)
+        self._row_of = {int(db_id): row for row, db_id in enumerate(db_ids.tolist())}
+        self._codes = {int(db_id): code for db_id, code in zip(db_ids.tolist(), codes)}
+        self._index.build(self.rows())
+        self.version += 1
+
+    def export(self, exclude: Optional[Iterable[int]] = None) -> Dict:
+        """
+        Copies of the live rows in their stored representation, safe to hand to a
+        background writer; ids in ``exclude`` are left out.
+        """
+        rows = self.rows()
+        keep = slice(None)
+        if exclude:
+            keep = ~np.isin(self.ids, np.fromiter(exclude, dtype=np.int64))
+        ids = self.ids[keep].copy()
+        return {
+            'visitor_ids': ids,
+            'visitor_matrix': np.array(rows.data[keep]),
+            'visitor_scales': None if rows.scales is None else np.array(rows.scales[keep]),
+            'visitor_codes': [self._codes.get(int(db_id), '') for db_id in ids.tolist()],
+        }
+
+    def upsert(self, db_id: int, vector: np.ndarray, code: Optional[str] = None):
+        """Insert a normalized vector or overwrite its row in place."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        row = self._row_of.get(db_id)
+        if row is None:
+            self._reserve(vector.shape[0], self._size + 1)
+            row = self._size
+            self._size += 1
+            self._row_of[db_id] = row
+            self._ids[row] = db_id
+            self._write_rows(row, vector)
+            self._index.add(row, vector)
+        else:
+            self._write_rows(row, vector)
+            self._index.update(row, vector)
+        if code is not None:
+            self._codes[db_id] = code
+        self.version += 1
+
+    def remove(self, db_id: int) -> bool:
+        """Drop a row by moving the last live row into its slot."""
+        row = self._row_of.pop(db_id, None)
+        self._codes.pop(db_id, None)
+        if row is None:
+            return False
+        last = self._size - 1
+        self._index.remove(row, last)
+        if row != last:
+            moved_id = int(self._ids[last])
+            self._matrix[row] = self._matrix[last]
+            if self._scales is not None:
+                self._scales[row] = self._scales[last]
+            self._ids[row] = moved_id
+            self._row_of[moved_id] = row
+        self._ids[last] = -1
+        self._size = last
+        self.version += 1
+        return True
+
+    def match_many(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score every query row against the gallery through the search index.
+
+        Returns (best_db_ids, best_scores); ids are -1 and scores -1.0 when the
+        gallery is empty.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        count = queries.shape[0]
+        if self._size == 0 or count == 0:
+            return np.full(count, -1, dtype=np.int64), np.full(count, -1.0, dtype=np.float32)
+        best_rows, best_scores = self._index.search(self.rows(), queries)
+        best_ids = np.where(best_rows >= 0, self._ids[np.maximum(best_rows, 0)], -1)
+        return best_ids, best_scores
+
+    def match(self, query: np.ndarray) -> Tuple[Optional[int], float]:
+        ids, scores = self.match_many(query)
+        if ids[0] < 0:
+            return None, -1.0
+        return int(ids[0]), float(scores[0])
+
+
+class StaffGallery:
+    """
+    Staff templates stacked into one matrix, grouped into contiguous segments per staff member.
+
+    ``match_many`` scores all faces against all templates in one product and reduces each
+    segment by max, so a staff member with several enrolment images counts once.
+    Staff metadata is cached alongside to build overlay labels without DB lookups.
+    """
+
+    def __init__(self):
+        self._templates = np.empty((0, 0), dtype=np.float32)
+        self._segment_starts = np.empty(0, dtype=np.int64)
+        self._staff_ids = np.empty(0, dtype=np.int64)
+        self._profiles: Dict[int, Dict] = {}
+        self._by_staff: Dict[int, np.ndarray] = {}
+        self.version = 0
+
+    def __len__(self) -> int:
+        return int(self._staff_ids.shape[0])
+
+    def __contains__(self, staff_db_id) -> bool:
+        return staff_db_id in self._by_staff
+
+    @property
+    def dim(self) -> Optional[int]:
+        return int(self._templates.shape[1]) if self._templates.shape[0] else None
+
+    @property
+    def template_count(self) -> int:
+        return int(self._templates.shape[0])
+
+    def profile(self, staff_db_id: int) -> Optional[Dict]:
+        return self._profiles.get(staff_db_id)
+
+    def _restack(self):
+        # Staff galleries are small, so restacking on change is cheaper than tracking row slots.
+        staff_ids = sorted(self._by_staff)
+        self.version += 1
+        if not staff_ids:
+            self._templates = np.empty((0, 0), dtype=np.float32)
+            self._segment_starts = np.empty(0, dtype=np.int64)
+            self._staff_ids = np.empty(0, dtype=np.int64)
+            return
+        blocks = [self._by_staff[staff_db_id] for staff_db_id in staff_ids]
+        sizes = np.array([block.shape[0] for block in blocks], dtype=np.int64)
+        self._templates = np.ascontiguousarray(np.concatenate(blocks, axis=0), dtype=np.float32)
+        self._segment_starts = np.concatenate(([0], np.cumsum(sizes)[:-1])).astype(np.int64)
+        self._staff_ids = np.asarray(staff_ids, dtype=np.int64)
+
+    def load(self, staff_db_ids: Iterable[int], vectors: np.ndarray, profiles: Dict[int, Dict]):
+        """
+        Replace all templates; ``staff_db_ids`` gives the owner of each normalized row.
+        Rows are regrouped so each staff member occupies one contiguous segment.
+        """
+        owners = np.asarray(list(staff_db_ids), dtype=np.int64)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self._by_staff = {}
+        for staff_db_id in np.unique(owners).tolist():
+            self._by_staff[staff_db_id] = vectors[owners == staff_db_id]
+        self._profiles = {staff_db_id: profiles.get(staff_db_id, {}) for staff_db_id in self._by_staff}
+        self._restack()
+
+    def upsert_staff(self, staff_db_id: int, vectors: np.ndarray, profile: Dict):
+        """Replace one staff member's normalized templates and profile."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors.reshape(1, -1)
+        if vectors.shape[0] == 0:
+            self.remove_staff(staff_db_id)
+            return
+        self._by_staff[staff_db_id] = vectors
+        self._profiles[staff_db_id] = profile
+        self._restack()
+
+    def remove_staff(self, staff_db_id: int) -> bool:
+        self._profiles.pop(staff_db_id, None)
+        if self._by_staff.pop(staff_db_id, None) is None:
+            return False
+        self._restack()
+        return True
+
+    def export(self) -> Dict:
+        owners = np.repeat(self._staff_ids, np.diff(np.append(self._segment_starts, self.template_count)))
+        return {
+            'staff_owners': owners,
+            'staff_templates': self._templates.copy(),
+            'staff_profiles': dict(self._profiles),
+        }
+
+    def match_many(self, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns (best_staff_db_ids, best_scores) per query row; -1 ids when empty."""
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        count = queries.shape[0]
+        if self.template_count == 0 or count == 0:
+            return np.full(count, -1, dtype=np.int64), np.full(count, -1.0, dtype=np.float32)
+        scores = queries @ self._templates.T
+        per_staff = np.maximum.reduceat(scores, self._segment_starts, axis=1)
+        best = np.argmax(per_staff, axis=1)
+        return self._staff_ids[best], per_staff[np.arange(count), best]
+
+
+def storage_report(vectors: np.ndarray, queries: np.ndarray, storage: str, threshold: float) -> Dict:
+    """
+    Compare a compact gallery against float32 on the same data: memory, match
+    throughput, top-1 agreement and accept/reject agreement at ``threshold``.
+    """
+    ids = np.arange(len(vectors), dtype=np.int64)
+    codes = [''] * len(vectors)
+    reference = VisitorGallery()
+    reference.load(ids, vectors, codes)
+    gallery = VisitorGallery(storage=storage)
+    gallery.load(ids, vectors, codes)
+    gallery.match_many(queries[:1])
+
+    ref_ids, ref_scores = reference.match_many(queries)
+    started = time.perf_counter()
+    best_ids, best_scores = gallery.match_many(queries)
+    elapsed = time.perf_counter() - started
+
+    ref_hit = ref_scores >= threshold
+    hit = best_scores >= threshold
+    decisions = (hit == ref_hit) & (~hit | (best_ids == ref_ids))
+    return {
+        'storage': storage,
+        'gallery_size': len(gallery),
+        'bytes': gallery.nbytes,
+        'bytes_saved': reference.nbytes - gallery.nbytes,
+        'queries_per_second': queries.shape[0] / elapsed if elapsed > 0 else float('inf'),
+        'top1_agreement': float(np.mean(best_ids == ref_ids)),
+        'decision_agreement': float(np.mean(decisions)),
+        'max_score_error': float(np.max(np.abs(best_scores - ref_scores))),
+        'threshold': threshold,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    import os
+
+    from services.gallery_index import _synthetic_gallery
+
+    parser = argparse.ArgumentParser(description='Memory/throughput/agreement report for compact gallery storage.')
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--noise', type=float, default=0.8, help='query perturbation relative to a unit vector')
+    parser.add_argument('--threshold', type=float, default=float(os.getenv('FACE_SIMILARITY_THRESHOLD', 0.5)))
+    parser.add_argument('--storage', nargs='+', default=list(STORAGE_DTYPES))
+    args = parser.parse_args()
+
+    gallery_matrix, probe_matrix = _synthetic_gallery(args.size, args.dim, args.queries, args.noise)
+    for storage in args.storage:
+        print(json.dumps(storage_report(gallery_matrix, probe_matrix, storage, args.threshold)))
@@ -0,0 +1,108 @@
+from typing import Dict, Tuple
+
+import cv2
+import numpy as np
+
+
+def pose_metrics(kps) -> Tuple[bool, float, float]:
+    """(has_pose, yaw_ratio, roll_degrees) from the five detector keypoints."""
+    if kps is None or len(kps) < 3:
+        return False, 0.0, 0.0
+    left_eye = kps[0]
+    right_eye = kps[1]
+    nose = kps[2]
+    dx = float(right_eye[0] - left_eye[0])
+    dy = float(right_eye[1] - left_eye[1])
+    eye_distance = abs(dx)
+    if eye_distance == 0:
+        return False, 0.0, 0.0
+    eyes_mid_x = (float(left_eye[0]) + float(right_eye[0])) / 2.0
+    yaw_ratio = abs(float(nose[0]) - eyes_mid_x) / eye_distance
+    roll_angle_deg = abs(float(np.degrees(np.arctan2(dy, dx))))
+    return True, yaw_ratio, roll_angle_deg
+
+
+def sharpness(frame, bbox, max_side: int = 96) -> float:
+    """
+    Variance of the Laplacian over the face crop, downscaled so its longer side is at
+    most ``max_side`` pixels (0 keeps full resolution). Cost no longer grows with face size.
+    """
+    x1, y1, x2, y2 = bbox
+    crop = frame[y1:y2, x1:x2]
+    if crop.size == 0:
+        return 0.0
+    longest = max(crop.shape[0], crop.shape[1])
+    if max_side and longest > max_side:
+        scale = max_side / float(longest)
+        size = (max(1, int(crop.shape[1] * scale)), max(1, int(crop.shape[0] * scale)))
+        crop = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def assess_face(frame, bbox, face, blur_threshold: float, blur_size: int = 96) -> Dict:
+    """
+    Cheap per-detection quality: the raw gate metrics plus one combined ``score``.
+
+    ``blur`` is measured once, on the crop downscaled to ``blur_size``; BLUR_THRESHOLD
+    is calibrated for that measurement (see the calibration helper below) and both the
+    gate and the score use it. The score multiplies detector confidence, face size
+    (sqrt of area), sharpness (blur / (blur + blur_threshold), 0.5 at the gate) and
+    frontalness from keypoints, so it ranks the detections of one track for best-shot
+    selection.
+    """
+    x1, y1, x2, y2 = bbox
+    det_score = float(getattr(face, 'det_score', 0.0))
+    area = max(0, (x2 - x1) * (y2 - y1))
+    try:
+        blur = sharpness(frame, bbox, blur_size)
+    except Exception:
+        blur = 0.0
+    has_pose, yaw_ratio, roll_deg = pose_metrics(getattr(face, 'kps', None))
+
+    sharp_term = blur / (blur + max(blur_threshold, 1e-6))
+    pose_term = 1.0
+    if has_pose:
+        pose_term = max(0.0, 1.0 - yaw_ratio) * max(0.0, float(np.cos(np.radians(roll_deg))))
+    return {
+        'det_score': det_score,
+        'area': area,
+        'blur': blur,
+        'has_pose': has_pose,
+        'yaw_ratio': yaw_ratio,
+        'roll_deg': roll_deg,
+        'score': det_score * float(np.sqrt(area)) * sharp_term * pose_term,
+    }
+
+
+def calibrate_blur_threshold(crops, full_threshold: float, max_side: int = 96) -> Dict:
+    """
+    Downscaled-blur threshold rejecting the same share of ``crops`` (face images) as
+    ``full_threshold`` does on the full-resolution Laplacian.
+    """
+    full = np.array([sharpness(crop, (0, 0, crop.shape[1], crop.shape[0]), 0) for crop in crops])
+    scaled = np.array([sharpness(crop, (0, 0, crop.shape[1], crop.shape[0]), max_side) for crop in crops])
+    rejected = float(np.mean(full < full_threshold)) if len(full) else 0.0
+    threshold = float(np.quantile(scaled, rejected)) if len(scaled) else full_threshold
+    return {
+        'crops': len(crops),
+        'max_side': max_side,
+        'full_threshold': full_threshold,
+        'rejected_share': rejected,
+        'blur_threshold': round(threshold, 1),
+        'agreement': float(np.mean((full < full_threshold) == (scaled < threshold))) if len(full) else 1.0,
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Calibrate BLUR_THRESHOLD for the downscaled blur measurement.')
+    parser.add_argument('images', nargs='+', help='face crops, e.g. saved visitor images')
+    parser.add_argument('--size', type=int, default=96, help='QUALITY_BLUR_SIZE')
+    parser.add_argument('--full-threshold', type=float, default=50.0, help='threshold tuned at full resolution')
+    args = parser.parse_args()
+
+    images = [image for image in (cv2.imread(path) for path in args.images) if image is not None]
+    print(json.dumps(calibrate_blur_threshold(images, args.full_threshold, args.size)))
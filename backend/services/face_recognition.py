@@ -1,44 +1,136 @@
+import atexit
 import datetime
 import os
-import re
-from typing import Dict, List, Optional, Tuple
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
 
-import cv2
 import numpy as np
 from flask import current_app
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface.utils import face_align
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
 
 from models import db
-from models.visitor import Visitor, VisitorImage, VisitorSession
+from models.visitor import Visitor
+from services.embedding_gallery import StaffGallery, VisitorGallery, normalize_rows
+from services.face_quality import assess_face
+from services.face_tracker import CameraState, FaceTracker, PendingCandidates
+from services.gallery_index import make_index
+from services.gallery_snapshot import SnapshotWriter, load_snapshot
+from services.image_store import get_image_writer
+from services.model_preload import record_model_load
+from services.ort_tuning import apply_session_options, session_settings
+from services.recognition_writer import (
+    CAMERA_SESSIONS_CLOSED,
+    LAST_SEEN,
+    SESSION_CLOSED,
+    SESSION_OPENED,
+    TEMPLATE_UPDATED,
+    VISITOR_CREATED,
+    RecognitionWriter,
+)
+from services.stream_overlay import draw_overlays, make_overlay
+from services.visitor_codes import next_visitor_code
+from utils.embedding_codec import decode_embedding, encode_embedding
+from utils.geometry import pairwise_iou, points_in_polygon, roi_regions, suppress_duplicates
+from utils.rwlock import ReadWriteLock
+from utils.sequence_block import SequenceBlock
 
 
 class FaceRecognitionService:
     _instance = None
+    # The boot-time preload thread and the first request may construct it concurrently.
+    _instance_lock = threading.Lock()
 
     def __new__(cls):
         if cls._instance is None:
-            cls._instance = super(FaceRecognitionService, cls).__new__(cls)
-            cls._instance._initialize()
+            with cls._instance_lock:
+                if cls._instance is None:
+                    instance = super(FaceRecognitionService, cls).__new__(cls)
+                    instance._initialize()
+                    # Published only once fully initialized, so a failed load is retried.
+                    cls._instance = instance
         return cls._instance
 
     def _initialize(self):
         print("Initializing InsightFace model...")
+        started = time.perf_counter()
+        providers = ['CPUExecutionProvider']
         self.app = FaceAnalysis(
             name='buffalo_l',
-            providers=['CPUExecutionProvider'],
+            providers=providers,
             allowed_modules=['detection', 'recognition'],
         )
-        self.app.prepare(ctx_id=0, det_size=(640, 640))
+        # Thread pools sized for this process's share of the host (see ort_tuning).
+        self._providers = providers
+        self.ort_settings = session_settings(current_app.config)
+        apply_session_options(self.app, self.ort_settings, providers)
+        # Default detector input; cameras may override it (Camera.det_size).
+        self._det_size = max(32, int(current_app.config.get('FACE_DET_SIZE', 640)))
+        self.app.prepare(ctx_id=0, det_size=(self._det_size, self._det_size))
+        record_model_load((time.perf_counter() - started) * 1000.0)
         print("InsightFace model loaded.")
 
-        self._embeddings: Dict[int, np.ndarray] = {}
-        self._visitor_codes: Dict[int, str] = {}
-        self._staff_embeddings: List[Tuple[int, np.ndarray]] = []
+        self._gallery = VisitorGallery(
+            index=self._make_visitor_index(),
+            storage=current_app.config.get('VISITOR_GALLERY_DTYPE', 'float32'),
+        )
+        self._staff_gallery = StaffGallery()
+        # Camera threads share only the galleries: matching takes the read side,
+        # sync and enrollment the write side. Tracks and pending faces are per camera.
+        self._gallery_lock = ReadWriteLock()
+        self._sync_lock = threading.Lock()
+        # Enrollments handed to the writer but maybe not committed; kept out of snapshots.
+        self._pending_visitors: Set[int] = set()
+        self._pending_lock = threading.Lock()
+        self._camera_states: Dict[Optional[int], CameraState] = {}
+        self._camera_states_lock = threading.Lock()
+        # Sessions are per visitor, so a visitor walking between cameras keeps one.
         self._active_tracks: Dict[int, Dict] = {}
-        self._pending_candidates: List[Dict] = []
-        self._next_visitor_num: Optional[int] = None
+        self._sessions_lock = threading.RLock()
+        # New visitors get their primary key up front so enrollment never waits on Postgres.
+        self._visitor_pks = SequenceBlock('visitors_id_seq', int(current_app.config.get('VISITOR_ID_BLOCK', 32)))
+        cfg = current_app.config
+        self._flask_app = current_app._get_current_object()
+        self._writer = RecognitionWriter(
+            self._flask_app,
+            max_queue=int(cfg.get('RECOGNITION_WRITE_QUEUE', 2048)),
+            batch_size=int(cfg.get('RECOGNITION_WRITE_BATCH', 256)),
+            flush_interval=float(cfg.get('RECOGNITION_WRITE_INTERVAL', 1.0)),
+            on_create_failed=self._visitor_create_failed,
+            on_code_changed=self._visitor_code_changed,
+        )
+        atexit.register(self.shutdown)
         self._last_cache_sync = datetime.datetime.min
         self._last_staff_cache_sync = datetime.datetime.min
+        self._visitor_watermark: Optional[datetime.datetime] = None
+        self._staff_watermark: Optional[datetime.datetime] = None
+        self._last_changelog_prune = datetime.datetime.min
+        self._snapshot_checked = False
+        self._snapshot_saved_versions: Optional[Tuple[int, int]] = None
+        self._last_snapshot_save = datetime.datetime.min
+        self._snapshot_dir = current_app.config.get('GALLERY_SNAPSHOT_DIR')
+        # Camera worker processes share one snapshot directory; only one of them writes it.
+        self._snapshot_writer = None
+        if self._snapshot_dir and current_app.config.get('GALLERY_SNAPSHOT_WRITE', True):
+            self._snapshot_writer = SnapshotWriter(self._snapshot_dir, logger=current_app.logger)
+
+    @staticmethod
+    def _make_visitor_index():
+        cfg = current_app.config
+        backend = cfg.get('VISITOR_INDEX_BACKEND', 'exact')
+        if (backend or 'exact').strip().lower() != 'ivf':
+            return make_index(backend)
+        return make_index(
+            backend,
+            nlist=int(cfg.get('VISITOR_INDEX_NLIST', 0)),
+            nprobe=int(cfg.get('VISITOR_INDEX_NPROBE', 16)),
+            min_train_size=int(cfg.get('VISITOR_INDEX_MIN_TRAIN_SIZE', 20000)),
+        )
 
     @staticmethod
     def _norm(embedding: np.ndarray) -> np.ndarray:
@@ -50,147 +142,339 @@ class FaceRecognitionService:
             return None
         return arr / n
 
+    def _camera_state(self, camera_db_id) -> CameraState:
+        with self._camera_states_lock:
+            state = self._camera_states.get(camera_db_id)
+            if state is None:
+                cfg = current_app.config
+                tracker = FaceTracker(
+                    iou_threshold=float(cfg.get('TRACK_IOU_THRESHOLD', 0.3)),
+                    max_age=float(cfg.get('TRACK_MAX_AGE', 1.5)),
+                    reverify_interval=float(cfg.get('TRACK_REVERIFY_INTERVAL', 3.0)),
+                    quality_gain=float(cfg.get('TRACK_REVERIFY_QUALITY_GAIN', 1.25)),
+                    best_k=int(cfg.get('TRACK_BEST_SHOTS', 3)),
+                )
+                state = CameraState(camera_db_id, tracker, PendingCandidates())
+                self._camera_states[camera_db_id] = state
+            return state
+
+    @staticmethod
+    def _decode_embeddings(rows, embedding_index: int, expected_dim: Optional[int] = None):
+        """Decode BYTEA embeddings into a normalized matrix; returns (kept_rows, matrix)."""
+        decoded = [(row, decode_embedding(row[embedding_index])) for row in rows]
+        decoded = [(row, vec) for row, vec in decoded if vec is not None]
+        if not decoded:
+            return [], None
+        rows = [row for row, _ in decoded]
+        raw = [vec for _, vec in decoded]
+        if expected_dim is None:
+            # Rows with a foreign embedding size cannot share the matrix; keep the majority size.
+            expected_dim = Counter(vec.shape[0] for vec in raw).most_common(1)[0][0]
+        keep = [idx for idx, vec in enumerate(raw) if vec.shape[0] == expected_dim]
+        if not keep:
+            return [], None
+        normed, valid = normalize_rows(np.stack([raw[idx] for idx in keep]))
+        kept_rows = [rows[idx] for idx, ok in zip(keep, valid) if ok]
+        return kept_rows, normed[valid]
+
+    @staticmethod
+    def _encode_embedding(embedding: np.ndarray) -> bytes:
+        return encode_embedding(embedding, current_app.config.get('EMBEDDING_DB_FORMAT', 'float32'))
+
+    @staticmethod
+    def _db_now() -> datetime.datetime:
+        # Watermarks use the DB clock so they compare cleanly with gallery_changes.changed_at.
+        return db.session.query(func.localtimestamp()).scalar()
+
+    def _fetch_changed_ids(self, entity: str, since: datetime.datetime):
+        from models.gallery import GalleryChange
+
+        lookback = datetime.timedelta(seconds=float(current_app.config.get('GALLERY_SYNC_LOOKBACK', 30.0)))
+        rows = db.session.query(GalleryChange.entity_id, func.max(GalleryChange.changed_at)).filter(
+            GalleryChange.entity == entity,
+            GalleryChange.changed_at > since - lookback,
+        ).group_by(GalleryChange.entity_id).all()
+        watermark = since
+        for _, changed_at in rows:
+            if changed_at is not None and changed_at > watermark:
+                watermark = changed_at
+        return [row[0] for row in rows], watermark
+
     @staticmethod
-    def _iou(box_a, box_b) -> float:
-        xa = max(box_a[0], box_b[0])
-        ya = max(box_a[1], box_b[1])
-        xb = min(box_a[2], box_b[2])
-        yb = min(box_a[3], box_b[3])
-        inter_w = max(0, xb - xa)
-        inter_h = max(0, yb - ya)
-        inter = inter_w * inter_h
-        if inter == 0:
-            return 0.0
-        area_a = max(0, box_a[2] - box_a[0]) * max(0, box_a[3] - box_a[1])
-        area_b = max(0, box_b[2] - box_b[0]) * max(0, box_b[3] - box_b[1])
-        union = area_a + area_b - inter
-        if union <= 0:
-            return 0.0
-        return inter / float(union)
+    def _chunks(values, size=1000):
+        for idx in range(0, len(values), size):
+            yield values[idx:idx + size]
+
+    def _visitor_rows_query(self):
+        return db.session.query(Visitor.id, Visitor.visitor_id, Visitor.embedding).filter(
+            Visitor.embedding.isnot(None)
+        )
+
+    def _staff_rows_query(self):
+        from models.staff import Staff, StaffImage
+
+        return db.session.query(
+            Staff.id,
+            StaffImage.embedding,
+            Staff.staff_id,
+            Staff.name,
+            Staff.position,
+            Staff.department,
+        ).join(StaffImage, StaffImage.staff_id == Staff.id).filter(
+            StaffImage.embedding.isnot(None),
+            Staff.is_active.is_(True),
+        )
 
     @staticmethod
-    def _tilt_metrics(face) -> Tuple[bool, float, float]:
-        kps = getattr(face, 'kps', None)
-        if kps is None or len(kps) < 3:
-            return False, 0.0, 0.0
-        left_eye = kps[0]
-        right_eye = kps[1]
-        nose = kps[2]
-        dx = float(right_eye[0] - left_eye[0])
-        dy = float(right_eye[1] - left_eye[1])
-        eye_distance = abs(dx)
-        if eye_distance == 0:
-            return False, 0.0, 0.0
-        eyes_mid_x = (float(left_eye[0]) + float(right_eye[0])) / 2.0
-        yaw_ratio = abs(float(nose[0]) - eyes_mid_x) / eye_distance
-        roll_angle_deg = abs(float(np.degrees(np.arctan2(dy, dx))))
-        return True, yaw_ratio, roll_angle_deg
+    def _staff_profiles(rows) -> Dict[int, Dict]:
+        return {
+            row[0]: {'staff_id': row[2], 'name': row[3], 'position': row[4], 'department': row[5]}
+            for row in rows
+        }
+
+    def _rebuild_visitor_cache(self):
+        watermark = self._db_now()
+        rows, normed = self._decode_embeddings(self._visitor_rows_query().all(), 2)
+        with self._gallery_lock.write_lock():
+            if normed is not None:
+                self._gallery.load([row[0] for row in rows], normed, [row[1] for row in rows])
+            else:
+                self._gallery.load([], np.empty((0, 0), dtype=np.float32), [])
+        self._visitor_watermark = watermark
+
+    def _apply_visitor_delta(self):
+        changed_ids, watermark = self._fetch_changed_ids('visitor', self._visitor_watermark)
+        if changed_ids:
+            found = set()
+            for chunk in self._chunks(changed_ids):
+                rows = self._visitor_rows_query().filter(Visitor.id.in_(chunk)).all()
+                rows, normed = self._decode_embeddings(rows, 2, expected_dim=self._gallery.dim)
+                with self._gallery_lock.write_lock():
+                    for row, vector in zip(rows, normed if normed is not None else []):
+                        self._gallery.upsert(row[0], vector, code=row[1])
+                        found.add(row[0])
+            with self._gallery_lock.write_lock():
+                for db_id in changed_ids:
+                    if db_id not in found:
+                        self._gallery.remove(db_id)
+        self._visitor_watermark = watermark
+
+    def _rebuild_staff_cache(self):
+        watermark = self._db_now()
+        rows, normed = self._decode_embeddings(self._staff_rows_query().all(), 1)
+        with self._gallery_lock.write_lock():
+            if normed is not None:
+                self._staff_gallery.load([row[0] for row in rows], normed, self._staff_profiles(rows))
+            else:
+                self._staff_gallery.load([], np.empty((0, 0), dtype=np.float32), {})
+        self._staff_watermark = watermark
+
+    def _apply_staff_delta(self):
+        from models.staff import Staff
+
+        changed_ids, watermark = self._fetch_changed_ids('staff', self._staff_watermark)
+        for chunk in self._chunks(changed_ids):
+            rows = self._staff_rows_query().filter(Staff.id.in_(chunk)).all()
+            rows, normed = self._decode_embeddings(rows, 1, expected_dim=self._staff_gallery.dim)
+            profiles = self._staff_profiles(rows)
+            with self._gallery_lock.write_lock():
+                for staff_db_id in chunk:
+                    mask = [row[0] == staff_db_id for row in rows]
+                    if normed is None or not any(mask):
+                        self._staff_gallery.remove_staff(staff_db_id)
+                        continue
+                    self._staff_gallery.upsert_staff(staff_db_id, normed[np.asarray(mask)], profiles[staff_db_id])
+        self._staff_watermark = watermark
+
+    def _prune_changelog(self, now):
+        from models.gallery import GalleryChange
+
+        if (now - self._last_changelog_prune).total_seconds() < 3600:
+            return
+        self._last_changelog_prune = now
+        retention = datetime.timedelta(hours=float(current_app.config.get('GALLERY_CHANGELOG_RETENTION_HOURS', 24)))
+        try:
+            GalleryChange.query.filter(GalleryChange.changed_at < self._db_now() - retention).delete(
+                synchronize_session=False
+            )
+            db.session.commit()
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            current_app.logger.warning("Failed to prune gallery changelog: %s", exc)
+
+    def _restore_from_snapshot(self) -> bool:
+        """Map the on-disk gallery snapshot; the caller then applies the DB delta since it."""
+        self._snapshot_checked = True
+        if not self._snapshot_dir:
+            return False
+        try:
+            snapshot = load_snapshot(self._snapshot_dir)
+        except Exception as exc:
+            current_app.logger.warning("Ignoring unreadable gallery snapshot: %s", exc)
+            return False
+        if snapshot is None:
+            return False
+
+        visitor_watermark = snapshot['visitor_watermark']
+        staff_watermark = snapshot['staff_watermark']
+        if visitor_watermark is None or staff_watermark is None:
+            return False
+        # A delta can only be replayed while the changelog still covers the snapshot.
+        retention = datetime.timedelta(hours=float(current_app.config.get('GALLERY_CHANGELOG_RETENTION_HOURS', 24)))
+        if min(visitor_watermark, staff_watermark) < self._db_now() - retention:
+            return False
+
+        with self._gallery_lock.write_lock():
+            self._gallery.adopt(
+                snapshot['visitor_ids'],
+                snapshot['visitor_matrix'],
+                snapshot['visitor_codes'],
+                scales=snapshot.get('visitor_scales'),
+            )
+            self._staff_gallery.load(snapshot['staff_owners'], snapshot['staff_templates'], snapshot['staff_profiles'])
+        self._visitor_watermark = visitor_watermark
+        self._staff_watermark = staff_watermark
+        self._snapshot_saved_versions = (self._gallery.version, self._staff_gallery.version)
+        current_app.logger.info(
+            "Gallery restored from snapshot %s (%d visitors)",
+            snapshot['manifest'].get('version'),
+            len(self._gallery),
+        )
+        return True
+
+    def _maybe_save_snapshot(self, now, force=False):
+        if self._snapshot_writer is None or self._visitor_watermark is None or self._staff_watermark is None:
+            return
+        versions = (self._gallery.version, self._staff_gallery.version)
+        if versions == self._snapshot_saved_versions:
+            return
+        interval = float(current_app.config.get('GALLERY_SNAPSHOT_INTERVAL', 300.0))
+        if not force and (now - self._last_snapshot_save).total_seconds() < interval:
+            return
+        # Only committed visitors go into the snapshot: an enrollment still in the write
+        # queue may fail, and the delta replayed after a restore could never remove it.
+        # One committed after the watermark is replayed from the changelog instead.
+        with self._pending_lock:
+            pending = list(self._pending_visitors)
+        committed = set()
+        try:
+            for chunk in self._chunks(pending):
+                committed.update(row[0] for row in db.session.query(Visitor.id).filter(Visitor.id.in_(chunk)).all())
+        except SQLAlchemyError as exc:
+            db.session.rollback()
+            current_app.logger.warning("Skipped gallery snapshot: %s", exc)
+            return
+        with self._gallery_lock.read_lock():
+            with self._pending_lock:
+                self._pending_visitors -= committed
+                uncommitted = set(self._pending_visitors)
+            arrays = {**self._gallery.export(exclude=uncommitted), **self._staff_gallery.export()}
+        if self._snapshot_writer.submit(arrays, self._visitor_watermark, self._staff_watermark):
+            self._snapshot_saved_versions = versions
+            self._last_snapshot_save = now
 
     def _sync_embedding_cache(self, force=False):
         now = datetime.datetime.now()
-        if not force and (now - self._last_cache_sync).total_seconds() < 15:
+        interval = float(current_app.config.get('GALLERY_SYNC_INTERVAL', 15.0))
+        if not force and (now - self._last_cache_sync).total_seconds() < interval:
             return
-
-        visitors = Visitor.query.filter(Visitor.embedding.isnot(None)).all()
-        cache_embeddings = {}
-        cache_codes = {}
-        for visitor in visitors:
-            emb = np.frombuffer(visitor.embedding, dtype=np.float32)
-            normed = self._norm(emb)
-            if normed is not None:
-                cache_embeddings[visitor.id] = normed
-                cache_codes[visitor.id] = visitor.visitor_id
-        self._embeddings = cache_embeddings
-        self._visitor_codes = cache_codes
+        # One thread syncs; the other cameras keep matching against the current gallery.
+        # Until the first load there is no gallery to match against, so they wait for it.
+        cold = self._visitor_watermark is None
+        if not self._sync_lock.acquire(blocking=force or cold):
+            return
+        try:
+            if cold and self._visitor_watermark is not None and not force:
+                return
+            self._sync_visitor_gallery(now)
+        finally:
+            self._sync_lock.release()
+
+    def _sync_visitor_gallery(self, now):
+        rebuilt = False
+        if self._visitor_watermark is None and not self._snapshot_checked:
+            self._restore_from_snapshot()
+        if self._visitor_watermark is None:
+            self._rebuild_visitor_cache()
+            rebuilt = True
+        else:
+            try:
+                self._apply_visitor_delta()
+            except SQLAlchemyError as exc:
+                db.session.rollback()
+                current_app.logger.warning("Visitor delta sync failed, rebuilding cache: %s", exc)
+                self._rebuild_visitor_cache()
+                rebuilt = True
+        self._refresh_visitor_index()
+        self._prune_changelog(now)
         self._last_cache_sync = now
+        self._maybe_save_snapshot(now, force=rebuilt)
+
+    def _refresh_visitor_index(self):
+        """
+        (Re)train the visitor index when due. The k-means runs outside the gallery lock;
+        cameras only wait for the centroids to be installed. Caller holds ``_sync_lock``.
+        """
+        with self._gallery_lock.read_lock():
+            sample = self._gallery.index_training_sample()
+        if sample is None:
+            return
+        centroids = self._gallery.index.fit(sample)
+        with self._gallery_lock.write_lock():
+            self._gallery.install_index(centroids)
 
     def _sync_staff_cache(self, force=False):
         now = datetime.datetime.now()
-        if not force and (now - self._last_staff_cache_sync).total_seconds() < 15:
+        interval = float(current_app.config.get('GALLERY_SYNC_INTERVAL', 15.0))
+        if not force and (now - self._last_staff_cache_sync).total_seconds() < interval:
             return
-
-        from models.staff import StaffImage
-
-        cache_staff = []
-        staff_images = StaffImage.query.filter(StaffImage.embedding.isnot(None)).all()
-        for img in staff_images:
-            if not img.staff or not img.staff.is_active:
-                continue
-            stored = np.frombuffer(img.embedding, dtype=np.float32)
-            stored = self._norm(stored)
-            if stored is None:
-                continue
-            cache_staff.append((img.staff.id, stored))
-
-        self._staff_embeddings = cache_staff
+        cold = self._staff_watermark is None
+        if not self._sync_lock.acquire(blocking=force or cold):
+            return
+        try:
+            if cold and self._staff_watermark is not None and not force:
+                return
+            self._sync_staff_gallery(now)
+        finally:
+            self._sync_lock.release()
+
+    def _sync_staff_gallery(self, now):
+        if self._staff_watermark is None and not self._snapshot_checked:
+            self._restore_from_snapshot()
+        if self._staff_watermark is None:
+            self._rebuild_staff_cache()
+        else:
+            try:
+                self._apply_staff_delta()
+            except SQLAlchemyError as exc:
+                db.session.rollback()
+                current_app.logger.warning("Staff delta sync failed, rebuilding cache: %s", exc)
+                self._rebuild_staff_cache()
         self._last_staff_cache_sync = now
 
     def refresh_staff_cache(self):
         self._last_staff_cache_sync = datetime.datetime.min
         self._sync_staff_cache(force=True)
 
-    def _get_next_visitor_id(self) -> str:
-        if self._next_visitor_num is None:
-            max_num = 0
-            for value in db.session.query(Visitor.visitor_id).all():
-                visitor_id = value[0] or ''
-                match = re.match(r'^ID(\d+)$', visitor_id)
-                if match:
-                    max_num = max(max_num, int(match.group(1)))
-            self._next_visitor_num = max_num + 1
-
-        visitor_code = f"ID{self._next_visitor_num}"
-        self._next_visitor_num += 1
-        return visitor_code
-
-    def _upsert_pending_candidate(self, bbox, embedding, now_local):
-        best_idx = None
-        best_iou = 0.0
-        for idx, cand in enumerate(self._pending_candidates):
-            iou = self._iou(cand.get('bbox'), bbox)
-            if iou > 0.45 and iou > best_iou:
-                best_iou = iou
-                best_idx = idx
-
-        if best_idx is None:
-            candidate = {
-                'bbox': bbox,
-                'embedding': embedding,
-                'count': 1,
-                'first_seen': now_local,
-                'last_seen': now_local,
-            }
-            self._pending_candidates.append(candidate)
-            return candidate
-
-        candidate = self._pending_candidates[best_idx]
-        candidate['bbox'] = bbox
-        candidate['last_seen'] = now_local
-        candidate['count'] = int(candidate.get('count', 0)) + 1
-        prior_embedding = candidate.get('embedding')
-        if prior_embedding is not None:
-            blended = self._norm((prior_embedding * 0.6) + (embedding * 0.4))
-            candidate['embedding'] = blended if blended is not None else embedding
-        else:
-            candidate['embedding'] = embedding
-        return candidate
-
-    def _clear_pending_for_bbox(self, bbox):
-        self._pending_candidates = [
-            cand for cand in self._pending_candidates
-            if self._iou(cand.get('bbox'), bbox) <= 0.30
-        ]
+    def rebuild_caches(self):
+        """Full reload of visitor and staff caches; incremental sync covers normal operation."""
+        with self._sync_lock:
+            self._rebuild_visitor_cache()
+            self._rebuild_staff_cache()
+            self._refresh_visitor_index()
+            now = datetime.datetime.now()
+            self._last_cache_sync = now
+            self._last_staff_cache_sync = now
+            self._maybe_save_snapshot(now, force=True)
+        return {'visitors': len(self._gallery), 'staff': len(self._staff_gallery)}
+
+    def _blend_candidate_embedding(self, prior: np.ndarray, embedding: np.ndarray) -> np.ndarray:
+        blended = self._norm((prior * 0.6) + (embedding * 0.4))
+        return blended if blended is not None else embedding
 
-    def _clear_specific_candidate(self, candidate):
-        self._pending_candidates = [cand for cand in self._pending_candidates if cand is not candidate]
-
-    def _purge_pending_candidates(self, now_local):
-        self._pending_candidates = [
-            cand for cand in self._pending_candidates
-            if (now_local - cand.get('last_seen', now_local)).total_seconds() <= 2.5
-        ]
-
-    def _save_primary_face_image(self, frame, bbox, visitor_code) -> str:
+    @staticmethod
+    def _primary_face_crop(frame, bbox):
+        """Face plus head and shoulders, copied so it outlives the frame."""
         x1, y1, x2, y2 = bbox
         h, w = frame.shape[:2]
         face_w = max(1, x2 - x1)
@@ -205,77 +489,105 @@ class FaceRecognitionService:
         nx2 = min(w, x2 + expand_x)
         ny2 = min(h, y2 + expand_y_bottom)
 
-        crop = frame[ny1:ny2, nx1:nx2]
+        return frame[ny1:ny2, nx1:nx2].copy()
+
+    def _save_primary_face_image(self, crop, visitor_code) -> str:
+        """Queue the crop for the image writer pool; the path is valid immediately."""
         filename = f"{visitor_code}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
-        rel_path = os.path.join('visitors', filename)
-        abs_path = os.path.join(current_app.config['UPLOAD_FOLDER'], rel_path)
-        os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-        cv2.imwrite(abs_path, crop)
-        return rel_path
-
-    def _match_visitor(self, embedding: np.ndarray, threshold: float):
-        best_db_id = None
-        best_score = -1.0
-        for db_id, known_embedding in self._embeddings.items():
-            score = float(np.dot(embedding, known_embedding))
-            if score > best_score:
-                best_score = score
-                best_db_id = db_id
-        if best_db_id is not None and best_score >= threshold:
-            return best_db_id, best_score
-        return None, best_score
-
-    def _ensure_active_session(
+        return get_image_writer().save(crop, os.path.join('visitors', filename))
+
+    def _match_staff_many(self, embeddings: np.ndarray, threshold: float) -> List[Tuple[Optional[int], float]]:
+        with self._gallery_lock.read_lock():
+            best_ids, best_scores = self._staff_gallery.match_many(embeddings)
+        matches = []
+        for staff_db_id, score in zip(best_ids.tolist(), best_scores.tolist()):
+            if staff_db_id >= 0 and score >= threshold:
+                matches.append((staff_db_id, score))
+            else:
+                matches.append((None, score))
+        return matches
+
+    def _match_visitors(self, embeddings: np.ndarray, threshold: float) -> List[Tuple[Optional[int], float]]:
+        with self._gallery_lock.read_lock():
+            best_ids, best_scores = self._gallery.match_many(embeddings)
+        matches = []
+        for db_id, score in zip(best_ids.tolist(), best_scores.tolist()):
+            if db_id >= 0 and score >= threshold:
+                matches.append((db_id, score))
+            else:
+                matches.append((None, score))
+        return matches
+
+    @staticmethod
+    def _close_time(now_local, event_start=None, event_end=None):
+        close_time = now_local
+        if event_end is not None:
+            close_time = min(close_time, event_end)
+        if event_start is not None:
+            close_time = max(close_time, event_start)
+        return close_time
+
+    def _visitor_seen(
         self,
-        visitor: Visitor,
+        visitor_db_id: int,
         camera_db_id: Optional[int],
+        bbox,
         now_local: datetime.datetime,
         event_start: Optional[datetime.datetime] = None,
     ):
-        track = self._active_tracks.get(visitor.id)
-        if track is not None:
-            return track.get('session_id')
-
-        active_session = VisitorSession.query.filter_by(visitor_id=visitor.id, is_active=True).order_by(
-            VisitorSession.entry_time.desc()
-        ).first()
-        if active_session is None:
-            entry_time = max(now_local, event_start) if event_start else now_local
-            active_session = VisitorSession(
-                visitor_id=visitor.id,
-                camera_id=camera_db_id,
-                entry_time=entry_time,
-                is_active=True,
-            )
-            db.session.add(active_session)
-            visitor.visit_count = (visitor.visit_count or 0) + 1
-            db.session.flush()
-
-        self._active_tracks[visitor.id] = {
-            'last_seen': now_local,
-            'bbox': None,
-            'session_id': active_session.id,
-            'camera_id': camera_db_id,
-        }
-        return active_session.id
+        """Keep the visitor's in-memory session alive, opening one on first sighting."""
+        with self._sessions_lock:
+            track = self._active_tracks.get(visitor_db_id)
+            opened = track is None
+            if opened:
+                track = self._active_tracks[visitor_db_id] = {'camera_id': camera_db_id}
+            track['bbox'] = bbox
+            track['last_seen'] = now_local
+        if opened:
+            self._writer.submit({
+                'type': SESSION_OPENED,
+                'visitor_db_id': visitor_db_id,
+                'camera_db_id': camera_db_id,
+                'entry_time': max(now_local, event_start) if event_start else now_local,
+            })
+        self._writer.submit({'type': LAST_SEEN, 'visitor_db_id': visitor_db_id, 'at': now_local})
+
+    def _flush_track_templates(self, tracks, now_local, due_only: bool = False):
+        """
+        Fold each track's accumulated sightings into its visitor template and queue
+        one write. Ended tracks always flush; with ``due_only`` only tracks that have
+        accumulated for TEMPLATE_FLUSH_INTERVAL seconds do.
+        """
+        cfg = current_app.config
+        rate = min(1.0, max(0.0, float(cfg.get('TEMPLATE_ADAPT_RATE', 0.15))))
+        min_samples = max(1, int(cfg.get('TEMPLATE_MIN_SAMPLES', 3)))
+        min_agreement = float(cfg.get('TEMPLATE_MIN_AGREEMENT', 0.60))
+        interval = float(cfg.get('TEMPLATE_FLUSH_INTERVAL', 60.0))
 
-    def _generate_visitor_pdf(
-        self,
-        visitor_db_id: int,
-        event_start: Optional[datetime.datetime] = None,
-        event_end: Optional[datetime.datetime] = None,
-    ):
-        try:
-            from services.report_generator import ReportGenerator
-            visitor = Visitor.query.get(visitor_db_id)
-            if visitor:
-                ReportGenerator().generate_visitor_pdf(
-                    visitor,
-                    event_start=event_start,
-                    event_end=event_end,
-                )
-        except Exception as exc:
-            current_app.logger.warning("Visitor PDF generation failed for visitor_id=%s: %s", visitor_db_id, exc)
+        for face_track in tracks:
+            if face_track.template_since is None:
+                continue
+            if due_only and (interval <= 0 or (now_local - face_track.template_since).total_seconds() < interval):
+                continue
+            visitor_db_id = face_track.db_id if face_track.kind == 'visitor' else None
+            mean, samples = face_track.take_template()
+            if visitor_db_id is None or mean is None or samples < min_samples or rate <= 0:
+                continue
+            updated = None
+            with self._gallery_lock.write_lock():
+                current = self._gallery.vector(visitor_db_id)
+                # Drift limits: a segment that disagrees with the stored template is
+                # more likely a mismatch than an appearance change, and an accepted
+                # one moves the template by at most ``rate`` of the angle between them.
+                if current is not None and float(np.dot(current, mean)) >= min_agreement:
+                    updated = self._norm((current * (1.0 - rate)) + (mean * rate))
+                    self._gallery.upsert(visitor_db_id, updated)
+            if updated is not None:
+                self._writer.submit({
+                    'type': TEMPLATE_UPDATED,
+                    'visitor_db_id': visitor_db_id,
+                    'embedding': self._encode_embedding(updated),
+                })
 
     def _finalize_absent_sessions(
         self,
@@ -287,57 +599,42 @@ class FaceRecognitionService:
         camera_db_id: Optional[int] = None,
     ):
         grace = float(current_app.config.get('SESSION_GRACE_PERIOD', 2.0))
-        to_remove = []
-        changed = False
 
-        for visitor_db_id, track in list(self._active_tracks.items()):
-            if camera_db_id is not None and track.get('camera_id') != camera_db_id:
-                continue
-            if visitor_db_id in valid_db_ids:
-                continue
-
-            last_bbox = track.get('bbox')
-            is_still_present = False
-            if last_bbox is not None:
-                for invalid_bbox in invalid_bboxes:
-                    if self._iou(last_bbox, invalid_bbox) > 0.30:
-                        is_still_present = True
-                        break
-
-            if is_still_present:
-                track['last_seen'] = now_local
-                continue
-
-            last_seen = track.get('last_seen', now_local)
-            if (now_local - last_seen).total_seconds() <= grace:
-                continue
-
-            close_time = now_local
-            if event_end is not None:
-                close_time = min(close_time, event_end)
-            if event_start is not None:
-                close_time = max(close_time, event_start)
-
-            session_id = track.get('session_id')
-            if session_id:
-                session = VisitorSession.query.get(session_id)
-                if session and session.is_active:
-                    session.is_active = False
-                    session.exit_time = close_time
-                    changed = True
-
-            visitor = Visitor.query.get(visitor_db_id)
-            if visitor:
-                visitor.last_seen = close_time
-                changed = True
-
-            to_remove.append(visitor_db_id)
-            self._generate_visitor_pdf(visitor_db_id, event_start=event_start, event_end=event_end)
-
-        for visitor_db_id in to_remove:
-            self._active_tracks.pop(visitor_db_id, None)
-
-        return changed
+        # Decide and detach under the lock; the writer closes them in the DB.
+        closing = []
+        with self._sessions_lock:
+            candidates = [
+                (visitor_db_id, track)
+                for visitor_db_id, track in self._active_tracks.items()
+                if (camera_db_id is None or track.get('camera_id') == camera_db_id)
+                and visitor_db_id not in valid_db_ids
+            ]
+            # A visitor whose last box overlaps a face rejected by the quality gates is
+            # still in view; one IoU matrix covers every (track, rejected face) pair.
+            still_present = np.zeros(len(candidates), dtype=bool)
+            with_bbox = [idx for idx, (_, track) in enumerate(candidates) if track.get('bbox') is not None]
+            if with_bbox and invalid_bboxes:
+                ious = pairwise_iou([candidates[idx][1]['bbox'] for idx in with_bbox], invalid_bboxes)
+                still_present[with_bbox] = np.any(ious > 0.30, axis=1)
+
+            for (visitor_db_id, track), is_still_present in zip(candidates, still_present.tolist()):
+                if is_still_present:
+                    track['last_seen'] = now_local
+                    continue
+                last_seen = track.get('last_seen', now_local)
+                if (now_local - last_seen).total_seconds() <= grace:
+                    continue
+                closing.append((visitor_db_id, self._active_tracks.pop(visitor_db_id)))
+
+        close_time = self._close_time(now_local, event_start, event_end)
+        for visitor_db_id, _ in closing:
+            self._writer.submit({
+                'type': SESSION_CLOSED,
+                'visitor_db_id': visitor_db_id,
+                'exit_time': close_time,
+                'event_start': event_start,
+                'event_end': event_end,
+            })
 
     def finalize_active_sessions(
         self,
@@ -347,7 +644,8 @@ class FaceRecognitionService:
         camera_db_id: Optional[int] = None,
     ):
         reference_time = now_local or datetime.datetime.now()
-        changed = self._finalize_absent_sessions(
+        self._flush_camera_templates(reference_time, camera_db_id)
+        self._finalize_absent_sessions(
             valid_db_ids=set(),
             invalid_bboxes=[],
             now_local=reference_time,
@@ -355,65 +653,216 @@ class FaceRecognitionService:
             event_end=event_end,
             camera_db_id=camera_db_id,
         )
-
         # Safety net: if process restarted and in-memory tracking is empty,
         # close stale DB active sessions when event is not active anymore.
-        query = VisitorSession.query.filter_by(is_active=True)
-        if camera_db_id is not None:
-            query = query.filter_by(camera_id=camera_db_id)
-        active_sessions = query.all()
-        for session in active_sessions:
-            close_time = reference_time
-            if event_end is not None:
-                close_time = min(close_time, event_end)
-            if event_start is not None:
-                close_time = max(close_time, event_start)
-            session.is_active = False
-            session.exit_time = close_time
-            visitor = Visitor.query.get(session.visitor_id)
-            if visitor:
-                visitor.last_seen = close_time
-                self._generate_visitor_pdf(visitor.id, event_start=event_start, event_end=event_end)
-            changed = True
-
-        if changed:
-            try:
-                db.session.commit()
-            except Exception as exc:
-                db.session.rollback()
-                current_app.logger.warning("Failed to finalize sessions: %s", exc)
+        self._writer.submit({
+            'type': CAMERA_SESSIONS_CLOSED,
+            'camera_db_id': camera_db_id,
+            'exit_time': self._close_time(reference_time, event_start, event_end),
+            'event_start': event_start,
+            'event_end': event_end,
+        })
+
+    def _flush_camera_templates(self, now_local, camera_db_id: Optional[int] = None):
+        """Flush open template accumulators of one camera (or all) when tracking stops."""
+        with self._camera_states_lock:
+            states = [
+                state for key, state in self._camera_states.items()
+                if camera_db_id is None or key == camera_db_id
+            ]
+        for state in states:
+            with state.lock:
+                self._flush_track_templates(state.tracker.pop_ended() + state.tracker.tracks, now_local)
+
+    def _visitor_create_failed(self, event: Dict):
+        """Undo an enrollment the writer could not persist."""
+        visitor_db_id = event['visitor_db_id']
+        with self._gallery_lock.write_lock():
+            self._gallery.remove(visitor_db_id)
+        with self._pending_lock:
+            self._pending_visitors.discard(visitor_db_id)
+        with self._sessions_lock:
+            self._active_tracks.pop(visitor_db_id, None)
+
+    def _visitor_code_changed(self, event: Dict):
+        """The writer enrolled a visitor under a new code (its first one was taken)."""
+        with self._gallery_lock.write_lock():
+            self._gallery.set_code(event['visitor_db_id'], event['visitor_code'])
+
+    def write_stats(self) -> Dict:
+        return self._writer.stats()
+
+    def shutdown(self, timeout: float = 10.0):
+        """Commit queued recognition results; called at exit and by camera workers."""
+        try:
+            with self._flask_app.app_context():
+                self._flush_camera_templates(datetime.datetime.now())
+        except Exception as exc:
+            self._flask_app.logger.warning("Could not flush template updates at shutdown: %s", exc)
+        self._writer.stop(timeout)
+
+    def warm_up(self, runs: int = 2) -> float:
+        """
+        Run the detector and recognizer on blank input so ONNX Runtime finishes its
+        lazy allocations before the first real frame; returns the elapsed ms.
+        """
+        started = time.perf_counter()
+        frame = np.zeros((self._det_size, self._det_size, 3), dtype=np.uint8)
+        rec_model = self.app.models['recognition']
+        crop = np.zeros((rec_model.input_size[1], rec_model.input_size[0], 3), dtype=np.uint8)
+        for _ in range(max(1, int(runs))):
+            self.app.det_model.detect(frame, input_size=(self._det_size, self._det_size), max_num=0, metric='default')
+            rec_model.get_feat([crop])
+        return (time.perf_counter() - started) * 1000.0
+
+    def resize_sessions(self, thread_share: int) -> bool:
+        """
+        Rebuild the model sessions for a new ORT_THREAD_SHARE; False if the settings
+        are unchanged. Calls already running finish on the old sessions.
+        """
+        settings = session_settings(current_app.config, thread_share)
+        if settings == self.ort_settings:
+            return False
+        apply_session_options(self.app, settings, self._providers)
+        self.ort_settings = settings
+        return True
+
+    def _detect_faces(self, frame, camera=None) -> List[Face]:
+        """
+        Run only the detector; faces carry bbox, kps and det_score but no embedding.
+
+        With a camera ROI only its regions are detected, each at the scale the whole
+        frame would get at the camera's det_size (so the detector input shrinks with
+        the region), and boxes are mapped back to frame coordinates.
+        """
+        det_size = int(getattr(camera, 'det_size', None) or 0) or self._det_size
+        height, width = frame.shape[:2]
+        regions = roi_regions(getattr(camera, 'roi', None), width, height) if camera is not None else []
+        if not regions:
+            bboxes, kpss = self.app.det_model.detect(
+                frame, input_size=(det_size, det_size), max_num=0, metric='default'
+            )
+            return self._faces(bboxes, kpss)
+
+        scale = min(det_size / float(width), det_size / float(height))
+        found_boxes, found_kps = [], []
+        for (x1, y1, x2, y2), polygon in regions:
+            input_size = (self._det_input(x2 - x1, scale), self._det_input(y2 - y1, scale))
+            bboxes, kpss = self.app.det_model.detect(
+                frame[y1:y2, x1:x2], input_size=input_size, max_num=0, metric='default'
+            )
+            if bboxes.shape[0] == 0:
+                continue
+            bboxes = bboxes.copy()
+            bboxes[:, [0, 2]] += x1
+            bboxes[:, [1, 3]] += y1
+            if kpss is not None:
+                kpss = kpss + np.array([x1, y1], dtype=kpss.dtype)
+            if polygon is not None:
+                centers = np.stack([(bboxes[:, 0] + bboxes[:, 2]) / 2, (bboxes[:, 1] + bboxes[:, 3]) / 2], axis=1)
+                inside = points_in_polygon(centers, polygon)
+                bboxes = bboxes[inside]
+                kpss = kpss[inside] if kpss is not None else None
+            found_boxes.append(bboxes)
+            found_kps.append(kpss)
+        if not found_boxes:
+            return []
+        bboxes = np.concatenate(found_boxes, axis=0)
+        kpss = None if any(kps is None for kps in found_kps) else np.concatenate(found_kps, axis=0)
+        if len(regions) > 1:
+            # Overlapping regions see the same face twice.
+            keep = suppress_duplicates(bboxes[:, 0:4], bboxes[:, 4], threshold=0.4)
+            bboxes = bboxes[keep]
+            kpss = kpss[keep] if kpss is not None else None
+        return self._faces(bboxes, kpss)
+
+    @staticmethod
+    def _det_input(pixels: int, scale: float) -> int:
+        # Detector strides go up to 32.
+        return max(32, int(np.ceil(pixels * scale / 32.0)) * 32)
+
+    @staticmethod
+    def _faces(bboxes, kpss) -> List[Face]:
+        faces = []
+        for idx in range(bboxes.shape[0]):
+            kps = kpss[idx] if kpss is not None else None
+            faces.append(Face(bbox=bboxes[idx, 0:4], kps=kps, det_score=bboxes[idx, 4]))
+        return faces
+
+    def _embed_faces(self, frame, faces: List[Face]) -> np.ndarray:
+        """
+        Align each face and run the recognition model over the crops in batches.
+
+        Returns an (N, dim) matrix of normalized embeddings; rows of faces without
+        keypoints or with a zero embedding are left as zeros.
+        """
+        rec_model = self.app.models['recognition']
+        batch_size = max(1, int(current_app.config.get('RECOGNITION_BATCH_SIZE', 16)))
+        indices = [idx for idx, face in enumerate(faces) if face.kps is not None]
+        embeddings = None
+        for start in range(0, len(indices), batch_size):
+            chunk = indices[start:start + batch_size]
+            crops = [
+                face_align.norm_crop(frame, landmark=faces[idx].kps, image_size=rec_model.input_size[0])
+                for idx in chunk
+            ]
+            feats, _ = normalize_rows(rec_model.get_feat(crops).reshape(len(chunk), -1))
+            if embeddings is None:
+                embeddings = np.zeros((len(faces), feats.shape[1]), dtype=np.float32)
+            embeddings[chunk] = feats
+        if embeddings is None:
+            return np.zeros((len(faces), 0), dtype=np.float32)
+        return embeddings
 
     def get_embedding(self, image_array):
         if image_array is None or image_array.size == 0:
             return None
-        faces = self.app.get(image_array)
+        faces = self._detect_faces(image_array)
         if not faces:
             return None
-        raw = getattr(faces[0], 'normed_embedding', None)
-        if raw is None:
-            raw = getattr(faces[0], 'embedding', None)
-        return self._norm(raw)
+        embeddings = self._embed_faces(image_array, faces[:1])
+        if embeddings.shape[1] == 0:
+            return None
+        return self._norm(embeddings[0])
 
     def process_frame_for_stream(self, frame, camera=None, event_context=None):
-        now_local = datetime.datetime.now()
+        """Analyze a frame and draw its overlays in place; returns the frame."""
+        overlays = self.analyze_frame(frame, camera, event_context=event_context)
+        return draw_overlays(frame, overlays)
+
+    def analyze_frame(self, frame, camera=None, event_context=None) -> List[Dict]:
+        """
+        Run detection, recognition and session bookkeeping on one frame.
+
+        Returns the overlays (box, label, color) to draw; the frame is not modified.
+        Frames from different cameras run concurrently; frames of one camera are serialized.
+        """
         self._sync_embedding_cache()
         self._sync_staff_cache()
+        state = self._camera_state(getattr(camera, 'id', None))
+        with state.lock:
+            return self._analyze_camera_frame(state, frame, camera, event_context)
 
+    def _analyze_camera_frame(self, state: CameraState, frame, camera, event_context) -> List[Dict]:
+        now_local = datetime.datetime.now()
         cfg = current_app.config
         conf_threshold = float(cfg.get('FACE_CONFIDENCE_THRESHOLD', 0.5))
         similarity_threshold = float(cfg.get('FACE_SIMILARITY_THRESHOLD', 0.5))
         staff_similarity_threshold = float(cfg.get('STAFF_SIMILARITY_THRESHOLD', 0.65))
-        blur_threshold = float(cfg.get('BLUR_THRESHOLD', 50.0))
+        blur_threshold = float(cfg.get('BLUR_THRESHOLD', 100.0))
         tilt_threshold = float(cfg.get('TILT_THRESHOLD', 0.25))
+        blur_size = int(cfg.get('QUALITY_BLUR_SIZE', 96))
         min_face_area = int(cfg.get('MIN_FACE_AREA', 11000))
 
-        camera_db_id = getattr(camera, 'id', None)
+        camera_db_id = state.camera_db_id
         event_start = event_context.get('start_time') if event_context else None
         event_end = event_context.get('end_time') if event_context else None
-        faces = self.app.get(frame)
+        # Detection only; recognition runs once below on the faces that pass the gates.
+        faces = self._detect_faces(frame, camera)
         valid_db_ids = set()
         invalid_bboxes = []
-        changed = False
+        overlays: List[Dict] = []
+        gated: List[Tuple[Tuple[int, int, int, int], Face, float]] = []
 
         for face in faces:
             box = face.bbox.astype(int)
@@ -430,179 +879,227 @@ class FaceRecognitionService:
             score = float(getattr(face, 'det_score', 0.0))
             if score < conf_threshold:
                 invalid_bboxes.append(current_bbox)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (80, 80, 255), 1)
-                cv2.putText(frame, "Low Conf", (x1, max(20, y1 - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (80, 80, 255), 2)
+                overlays.append(make_overlay(
+                    current_bbox, "Low Conf", (80, 80, 255), thickness=1, font_scale=0.55, reason='low_confidence',
+                ))
                 continue
 
             face_area = (x2 - x1) * (y2 - y1)
             if face_area < min_face_area:
                 invalid_bboxes.append(current_bbox)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 1)
-                cv2.putText(frame, "Too Far", (x1, max(20, y1 - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (0, 0, 255), 2)
+                overlays.append(make_overlay(
+                    current_bbox, "Too Far", (0, 0, 255), thickness=1, font_scale=0.55, reason='too_far',
+                ))
                 continue
 
-            try:
-                gray = cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
-                blur_value = float(cv2.Laplacian(gray, cv2.CV_64F).var())
-            except Exception:
-                blur_value = 0.0
-            if blur_value < blur_threshold:
+            quality = assess_face(frame, current_bbox, face, blur_threshold, blur_size=blur_size)
+            if quality['blur'] < blur_threshold:
                 invalid_bboxes.append(current_bbox)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (30, 30, 255), 1)
-                cv2.putText(frame, "Blurry", (x1, max(20, y1 - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (30, 30, 255), 2)
+                overlays.append(make_overlay(
+                    current_bbox, "Blurry", (30, 30, 255), thickness=1, font_scale=0.55, reason='blurry',
+                ))
                 continue
 
-            has_pose, yaw_ratio, roll_angle_deg = self._tilt_metrics(face)
             max_roll = max(5.0, tilt_threshold * 45.0)
-            if has_pose and (yaw_ratio > tilt_threshold or roll_angle_deg > max_roll):
+            if quality['has_pose'] and (quality['yaw_ratio'] > tilt_threshold or quality['roll_deg'] > max_roll):
                 invalid_bboxes.append(current_bbox)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), (255, 60, 255), 2)
-                cv2.putText(frame, "Tilted", (x1, max(20, y1 - 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255, 60, 255), 2)
+                overlays.append(make_overlay(
+                    current_bbox, "Tilted", (255, 60, 255), thickness=2, font_scale=0.55, reason='tilted',
+                ))
                 continue
 
-            emb = getattr(face, 'normed_embedding', None)
-            if emb is None:
-                emb = getattr(face, 'embedding', None)
-            emb = self._norm(emb)
-            if emb is None:
-                invalid_bboxes.append(current_bbox)
-                continue
+            gated.append((current_bbox, face, quality['score']))
 
-            matched_staff, staff_score = self.find_matching_staff(
-                emb,
-                db.session,
-                threshold=staff_similarity_threshold,
-                with_score=True,
+        # Track every gated face. Unidentified tracks are embedded only when a sighting
+        # enters their best-K shots, confirmed tracks only when due for reverification.
+        tracker = state.tracker
+        face_tracks = tracker.update([bbox for bbox, _, _ in gated], now_local)
+        qualities = [quality for _, _, quality in gated]
+        to_embed = [
+            idx for idx, face_track in enumerate(face_tracks)
+            if tracker.needs_recognition(face_track, qualities[idx], now_local)
+        ]
+        embeddings: Dict[int, np.ndarray] = {}
+        if to_embed:
+            matrix = self._embed_faces(frame, [gated[idx][1] for idx in to_embed])
+            for idx, emb in zip(to_embed, matrix):
+                if matrix.shape[1] == 0 or not np.any(emb):
+                    invalid_bboxes.append(gated[idx][0])
+                    continue
+                embeddings[idx] = emb
+                face_track = face_tracks[idx]
+                # Only unidentified tracks may become a visitor and need their crop.
+                crop = None if face_track.identified else self._primary_face_crop(frame, gated[idx][0])
+                face_track.add_shot(qualities[idx], emb, crop, tracker.best_k)
+
+        accepted = []
+        for idx, (current_bbox, _, _) in enumerate(gated):
+            if idx in to_embed and idx not in embeddings:
+                continue
+            accepted.append((current_bbox, embeddings.get(idx), face_tracks[idx], qualities[idx]))
+
+        # Score the newly embedded faces against staff templates, then the remaining
+        # ones against the visitor gallery, one matrix product each.
+        recognized = [idx for idx, item in enumerate(accepted) if item[1] is not None]
+        staff_matches: List[Tuple[Optional[int], float]] = [(None, 0.0)] * len(accepted)
+        if recognized:
+            matches = self._match_staff_many(
+                np.stack([accepted[idx][1] for idx in recognized]),
+                staff_similarity_threshold,
             )
-            if matched_staff is not None:
-                self._clear_pending_for_bbox(current_bbox)
-                staff_role = (matched_staff.position or matched_staff.department or 'Staff').strip()
-                label = f"{matched_staff.staff_id} | {matched_staff.name} [{staff_role}] ({staff_score:.2f})"
+            for idx, match in zip(recognized, matches):
+                staff_matches[idx] = match
+        visitor_faces = [idx for idx in recognized if staff_matches[idx][0] is None]
+        visitor_matches = {}
+        if visitor_faces:
+            matches = self._match_visitors(
+                np.stack([accepted[idx][1] for idx in visitor_faces]),
+                similarity_threshold,
+            )
+            visitor_matches = dict(zip(visitor_faces, matches))
+        for idx, (_, emb, face_track, _) in enumerate(accepted):
+            if emb is not None:
+                continue
+            if face_track.kind == 'staff':
+                staff_matches[idx] = (face_track.db_id, face_track.score)
+            else:
+                visitor_matches[idx] = (face_track.db_id, face_track.score)
+
+        # Unknown faces join their pending candidates in one IoU assignment; tracked
+        # unknown faces that were not re-embedded still count as a sighting.
+        unknown_faces = sorted(
+            idx for idx, (matched_db_id, _) in visitor_matches.items()
+            if matched_db_id is None
+        )
+        candidates = dict(zip(unknown_faces, state.pending.upsert_many(
+            [accepted[idx][0] for idx in unknown_faces],
+            [accepted[idx][1] for idx in unknown_faces],
+            now_local,
+            self._blend_candidate_embedding,
+        ))) if unknown_faces else {}
+        known_bboxes = []
+
+        for idx, (current_bbox, emb, face_track, quality) in enumerate(accepted):
+            staff_db_id, staff_score = staff_matches[idx]
+            if staff_db_id is not None:
+                if emb is not None:
+                    face_track.set_identity('staff', staff_db_id, staff_score, quality, now_local)
+                known_bboxes.append(current_bbox)
+                with self._gallery_lock.read_lock():
+                    profile = self._staff_gallery.profile(staff_db_id) or {}
+                staff_role = (profile.get('position') or profile.get('department') or 'Staff').strip()
+                label = f"{profile.get('staff_id')} | {profile.get('name')} [{staff_role}] ({staff_score:.2f})"
                 color = (255, 170, 0)
-                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                cv2.putText(
-                    frame,
-                    label,
-                    (x1, max(20, y1 - 10)),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.56,
-                    color,
-                    2,
-                )
+                identity = {
+                    'type': 'staff',
+                    'db_id': staff_db_id,
+                    'id': profile.get('staff_id'),
+                    'name': profile.get('name'),
+                }
+                overlays.append(make_overlay(
+                    current_bbox, label, color, font_scale=0.56, kind='staff',
+                    reason='matched', identity=identity, score=staff_score, quality=quality,
+                ))
                 continue
 
-            matched_db_id, matched_score = self._match_visitor(emb, similarity_threshold)
+            matched_db_id, matched_score = visitor_matches[idx]
             label = "Unknown"
             color = (0, 255, 255)
+            identity = None
+            reason = 'unknown'
 
             if matched_db_id is None:
-                candidate = self._upsert_pending_candidate(current_bbox, emb, now_local)
+                if emb is not None:
+                    face_track.set_identity(None, None, 0.0, quality, now_local)
+                candidate = candidates[idx]
+                # Enroll from the track's sharpest sightings rather than the latest one.
+                stable_embedding = face_track.best_embedding()
+                if stable_embedding is None:
+                    stable_embedding = candidate.get('embedding') if candidate.get('embedding') is not None else emb
                 min_frames = max(1, int(cfg.get('UNKNOWN_FACE_MIN_FRAMES', 3)))
-                if int(candidate.get('count', 0)) < min_frames:
+                if int(candidate.get('count', 0)) < min_frames or stable_embedding is None:
                     color = (0, 200, 255)
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                    cv2.putText(
-                        frame,
-                        "Analyzing...",
-                        (x1, max(20, y1 - 10)),
-                        cv2.FONT_HERSHEY_SIMPLEX,
-                        0.56,
-                        color,
-                        2,
-                    )
+                    overlays.append(make_overlay(
+                        current_bbox, "Analyzing...", color, font_scale=0.56,
+                        reason='analyzing', quality=quality,
+                    ))
                     continue
 
-                self._clear_specific_candidate(candidate)
-                stable_embedding = candidate.get('embedding') if candidate.get('embedding') is not None else emb
-                visitor_code = self._get_next_visitor_id()
-                image_rel_path = self._save_primary_face_image(frame, current_bbox, visitor_code)
-                visitor = Visitor(
-                    visitor_id=visitor_code,
-                    primary_image_path=image_rel_path,
-                    embedding=stable_embedding.astype(np.float32).tobytes(),
-                    first_seen=max(now_local, event_start) if event_start else now_local,
-                    last_seen=max(now_local, event_start) if event_start else now_local,
-                    visit_count=1,
-                )
-                db.session.add(visitor)
-                db.session.flush()
-
-                db.session.add(VisitorImage(visitor_id=visitor.id, image_path=image_rel_path))
-                session = VisitorSession(
-                    visitor_id=visitor.id,
-                    camera_id=camera_db_id,
-                    entry_time=max(now_local, event_start) if event_start else now_local,
-                    is_active=True,
-                )
-                db.session.add(session)
-                db.session.flush()
-
-                self._embeddings[visitor.id] = stable_embedding
-                self._visitor_codes[visitor.id] = visitor_code
-                self._active_tracks[visitor.id] = {
-                    'last_seen': now_local,
-                    'bbox': current_bbox,
-                    'session_id': session.id,
-                    'camera_id': camera_db_id,
-                }
-                valid_db_ids.add(visitor.id)
+                state.pending.discard(candidate)
+                visitor_code = next_visitor_code()
+                crop = face_track.best_crop()
+                if crop is None:
+                    crop = self._primary_face_crop(frame, current_bbox)
+                image_rel_path = self._save_primary_face_image(crop, visitor_code)
+                seen_at = max(now_local, event_start) if event_start else now_local
+                visitor_db_id = self._visitor_pks.next(db.engine)
+                # Registered before the writer can commit it (see _maybe_save_snapshot).
+                with self._pending_lock:
+                    self._pending_visitors.add(visitor_db_id)
+                self._writer.submit({
+                    'type': VISITOR_CREATED,
+                    'visitor_db_id': visitor_db_id,
+                    'visitor_code': visitor_code,
+                    'image_path': image_rel_path,
+                    'embedding': self._encode_embedding(stable_embedding),
+                    'camera_db_id': camera_db_id,
+                    'seen_at': seen_at,
+                })
+                with self._gallery_lock.write_lock():
+                    self._gallery.upsert(visitor_db_id, stable_embedding, code=visitor_code)
+                with self._sessions_lock:
+                    self._active_tracks[visitor_db_id] = {
+                        'last_seen': now_local,
+                        'bbox': current_bbox,
+                        'camera_id': camera_db_id,
+                    }
+                valid_db_ids.add(visitor_db_id)
+                face_track.set_identity('visitor', visitor_db_id, 1.0, quality, now_local)
                 label = f"{visitor_code} (New)"
                 color = (0, 255, 255)
-                changed = True
+                identity = {'type': 'visitor', 'db_id': visitor_db_id, 'id': visitor_code}
+                matched_score = 1.0
+                reason = 'enrolled'
             else:
-                visitor = Visitor.query.get(matched_db_id)
-                if visitor is None:
+                # Labels come from the gallery; the DB is only written behind.
+                with self._gallery_lock.read_lock():
+                    visitor_code = self._gallery.code(matched_db_id)
+                if visitor_code is None:
+                    face_track.set_identity(None, None, 0.0, 0.0, now_local)
                     continue
-                self._clear_pending_for_bbox(current_bbox)
-
-                self._ensure_active_session(visitor, camera_db_id, now_local, event_start=event_start)
-                track = self._active_tracks.get(visitor.id)
-                if track is not None:
-                    track['bbox'] = current_bbox
-                    track['last_seen'] = now_local
-                visitor.last_seen = now_local
-
-                if matched_score < 0.98:
-                    updated = self._norm((self._embeddings[visitor.id] * 0.85) + (emb * 0.15))
-                    if updated is not None:
-                        self._embeddings[visitor.id] = updated
-                        visitor.embedding = updated.astype(np.float32).tobytes()
-                label = f"{visitor.visitor_id} ({matched_score:.2f})"
+                if emb is not None:
+                    face_track.set_identity('visitor', matched_db_id, matched_score, quality, now_local)
+                known_bboxes.append(current_bbox)
+                self._visitor_seen(matched_db_id, camera_db_id, current_bbox, now_local, event_start=event_start)
+
+                if emb is not None and matched_score < 0.98:
+                    # Adapted once per track segment (see _flush_track_templates).
+                    face_track.accumulate_template(emb, quality, now_local)
+                label = f"{visitor_code} ({matched_score:.2f})"
                 color = (0, 255, 0)
-                valid_db_ids.add(visitor.id)
-                changed = True
-
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            cv2.putText(
-                frame,
-                label,
-                (x1, max(20, y1 - 10)),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.60,
-                color,
-                2,
-            )
-
-        if self._finalize_absent_sessions(
+                identity = {'type': 'visitor', 'db_id': matched_db_id, 'id': visitor_code}
+                reason = 'matched'
+                valid_db_ids.add(matched_db_id)
+
+            overlays.append(make_overlay(
+                current_bbox, label, color, font_scale=0.60, kind='visitor',
+                reason=reason, identity=identity, score=matched_score if identity else None, quality=quality,
+            ))
+
+        state.pending.clear_overlapping(known_bboxes)
+        self._flush_track_templates(tracker.pop_ended(), now_local)
+        self._flush_track_templates(tracker.tracks, now_local, due_only=True)
+        self._finalize_absent_sessions(
             valid_db_ids,
             invalid_bboxes,
             now_local,
             event_start=event_start,
             event_end=event_end,
             camera_db_id=camera_db_id,
-        ):
-            changed = True
-
-        self._purge_pending_candidates(now_local)
-
-        if changed:
-            try:
-                db.session.commit()
-            except Exception as exc:
-                db.session.rollback()
-                current_app.logger.warning("Failed to persist recognition update: %s", exc)
+        )
+        state.pending.purge(now_local)
 
-        return frame
+        return overlays
 
     def compare_faces(self, embedding1, embedding2, threshold=0.5):
         emb1 = self._norm(embedding1)
@@ -622,15 +1119,9 @@ class FaceRecognitionService:
             threshold = float(current_app.config.get('STAFF_SIMILARITY_THRESHOLD', 0.65))
 
         self._sync_staff_cache()
-        best_staff_id = None
-        best_score = -1.0
-        for staff_db_id, stored in self._staff_embeddings:
-            score = float(np.dot(emb, stored))
-            if score > best_score:
-                best_score = score
-                best_staff_id = staff_db_id
-
-        if best_staff_id is not None and best_score >= threshold:
+        best_staff_id, best_score = self._match_staff_many(emb, threshold)[0]
+
+        if best_staff_id is not None:
             matched_staff = Staff.query.get(best_staff_id)
             if with_score:
                 return matched_staff, best_score
@@ -0,0 +1,313 @@
+import itertools
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from utils.geometry import greedy_assign, pairwise_iou
+
+
+class _BoxFilter:
+    """
+    Constant-velocity Kalman filter over a box as (cx, cy, w, h).
+
+    Time steps are in seconds, so a variable analysis rate still predicts sensibly.
+    """
+
+    _H = np.hstack([np.eye(4), np.zeros((4, 4))]).astype(np.float64)
+
+    def __init__(self, bbox, process_noise: float = 40.0, measurement_noise: float = 4.0):
+        self.x = np.zeros(8, dtype=np.float64)
+        self.x[:4] = self._measure(bbox)
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1e3, 1e3, 1e3, 1e3])
+        self.q = process_noise
+        self.R = np.eye(4) * measurement_noise ** 2
+
+    @staticmethod
+    def _measure(bbox) -> np.ndarray:
+        x1, y1, x2, y2 = [float(v) for v in bbox]
+        return np.array([(x1 + x2) / 2.0, (y1 + y2) / 2.0, max(1.0, x2 - x1), max(1.0, y2 - y1)])
+
+    def predict(self, dt: float) -> np.ndarray:
+        dt = max(0.0, float(dt))
+        F = np.eye(8)
+        F[:4, 4:] = np.eye(4) * dt
+        Q = np.eye(8) * (self.q ** 2)
+        Q[:4, :4] *= dt ** 2
+        Q[4:, 4:] *= max(dt, 1e-3)
+        self.x = F @ self.x
+        self.x[2:4] = np.maximum(self.x[2:4], 1.0)
+        self.P = F @ self.P @ F.T + Q
+        return self.bbox()
+
+    def update(self, bbox):
+        z = self._measure(bbox)
+        y = z - self._H @ self.x
+        S = self._H @ self.P @ self._H.T + self.R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(8) - K @ self._H) @ self.P
+
+    def bbox(self) -> np.ndarray:
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2.0, cy - h / 2.0, cx + w / 2.0, cy + h / 2.0])
+
+
+class FaceTrack:
+    """One tracked face and the identity recognition last gave it."""
+
+    def __init__(self, track_id: int, bbox, now):
+        self.track_id = track_id
+        self.filter = _BoxFilter(bbox)
+        self.bbox = tuple(int(v) for v in bbox)
+        self.hits = 1
+        self.last_update = now
+        # 'staff' or 'visitor' once recognized; None while unknown/pending.
+        self.kind: Optional[str] = None
+        self.db_id: Optional[int] = None
+        self.score = 0.0
+        self.verified_at = None
+        self.verified_quality = 0.0
+        # Best-K embedded sightings, best first: {'quality', 'embedding', 'crop'}.
+        self.best_shots: List[Dict] = []
+        # Template adaptation for the matched visitor, accumulated over this track and
+        # applied to the gallery once per segment (or timer) instead of per sighting.
+        self.template_sum: Optional[np.ndarray] = None
+        self.template_weight = 0.0
+        self.template_samples = 0
+        self.template_since = None
+
+    @property
+    def identified(self) -> bool:
+        return self.kind is not None and self.db_id is not None
+
+    def qualifies(self, quality: float, best_k: int) -> bool:
+        """Whether a sighting of this quality would enter the best-K shots."""
+        return len(self.best_shots) < best_k or quality > self.best_shots[-1]['quality']
+
+    def add_shot(self, quality: float, embedding: np.ndarray, crop, best_k: int):
+        self.best_shots.append({'quality': float(quality), 'embedding': embedding, 'crop': crop})
+        self.best_shots.sort(key=lambda shot: shot['quality'], reverse=True)
+        del self.best_shots[max(1, best_k):]
+
+    def best_embedding(self) -> Optional[np.ndarray]:
+        """Quality-weighted mean of the best-K embeddings, L2-normalized."""
+        if not self.best_shots:
+            return None
+        weights = np.array([max(shot['quality'], 1e-6) for shot in self.best_shots], dtype=np.float32)
+        mean = np.average(np.stack([shot['embedding'] for shot in self.best_shots]), axis=0, weights=weights)
+        norm = float(np.linalg.norm(mean))
+        return (mean / norm).astype(np.float32) if norm > 0 else None
+
+    def accumulate_template(self, embedding: np.ndarray, weight: float, now):
+        weighted = np.asarray(embedding, dtype=np.float32) * max(float(weight), 1e-6)
+        self.template_sum = weighted if self.template_sum is None else self.template_sum + weighted
+        self.template_weight += max(float(weight), 1e-6)
+        self.template_samples += 1
+        if self.template_since is None:
+            self.template_since = now
+
+    def take_template(self):
+        """(normalized mean, sample count) of the accumulated sightings; resets the accumulator."""
+        total, samples = self.template_sum, self.template_samples
+        self.template_sum = None
+        self.template_weight = 0.0
+        self.template_samples = 0
+        self.template_since = None
+        if total is None:
+            return None, 0
+        norm = float(np.linalg.norm(total))
+        return (total / norm if norm > 0 else None), samples
+
+    def best_crop(self):
+        for shot in self.best_shots:
+            if shot.get('crop') is not None:
+                return shot['crop']
+        return None
+
+    def set_identity(self, kind: Optional[str], db_id: Optional[int], score: float, quality: float, now):
+        if db_id != self.db_id or (kind if db_id is not None else None) != self.kind:
+            # Samples gathered under another identity must not reach this one.
+            self.take_template()
+        self.kind = kind if db_id is not None else None
+        self.db_id = db_id
+        self.score = float(score)
+        self.verified_at = now
+        self.verified_quality = float(quality)
+        if self.identified:
+            # Crops are only kept to enroll an unknown face.
+            for shot in self.best_shots:
+                shot['crop'] = None
+
+
+class FaceTracker:
+    """
+    SORT-style tracker for one camera: Kalman-predicted boxes matched to detections by IoU.
+
+    Tracks without an identity are embedded only while a sighting enters their best
+    ``best_k`` shots; identified tracks after ``reverify_interval`` seconds or when the
+    face quality rose by ``quality_gain``.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: float = 0.3,
+        max_age: float = 1.5,
+        reverify_interval: float = 3.0,
+        quality_gain: float = 1.25,
+        best_k: int = 3,
+    ):
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.reverify_interval = reverify_interval
+        self.quality_gain = quality_gain
+        self.best_k = max(1, int(best_k))
+        self.tracks: List[FaceTrack] = []
+        # Tracks dropped by ``update`` since the last ``pop_ended``.
+        self.ended: List[FaceTrack] = []
+        self._ids = itertools.count(1)
+        self._last_time = None
+
+    def update(self, boxes, now) -> List[FaceTrack]:
+        """Advance to ``now`` and return the track of every box in ``boxes`` (same order)."""
+        dt = 0.0 if self._last_time is None else (now - self._last_time).total_seconds()
+        self._last_time = now
+        predicted = [track.filter.predict(dt) for track in self.tracks]
+
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        assigned: List[Optional[FaceTrack]] = [None] * boxes.shape[0]
+        if self.tracks and boxes.shape[0]:
+            ious = pairwise_iou(np.asarray(predicted), boxes)
+            for track_idx, box_idx in greedy_assign(ious, self.iou_threshold):
+                track = self.tracks[track_idx]
+                track.filter.update(boxes[box_idx])
+                track.bbox = tuple(int(v) for v in boxes[box_idx])
+                track.hits += 1
+                track.last_update = now
+                assigned[box_idx] = track
+
+        for box_idx, track in enumerate(assigned):
+            if track is None:
+                track = FaceTrack(next(self._ids), boxes[box_idx], now)
+                self.tracks.append(track)
+                assigned[box_idx] = track
+
+        alive = []
+        for track in self.tracks:
+            if (now - track.last_update).total_seconds() <= self.max_age:
+                alive.append(track)
+            else:
+                self.ended.append(track)
+        self.tracks = alive
+        return assigned
+
+    def pop_ended(self) -> List[FaceTrack]:
+        ended, self.ended = self.ended, []
+        return ended
+
+    def needs_recognition(self, track: FaceTrack, quality: float, now) -> bool:
+        if not track.identified or track.verified_at is None:
+            return track.qualifies(quality, self.best_k)
+        if (now - track.verified_at).total_seconds() >= self.reverify_interval:
+            return True
+        return quality > track.verified_quality * self.quality_gain
+
+    def stats(self) -> Dict:
+        return {
+            'tracks': len(self.tracks),
+            'identified': sum(1 for track in self.tracks if track.identified),
+        }
+
+
+class PendingCandidates:
+    """
+    Unknown faces waiting for enough consistent sightings to become a visitor.
+
+    Boxes live in one (N, 4) array next to the candidate dicts, so matching a whole
+    frame's unknown faces is one pairwise IoU matrix plus a one-to-one assignment.
+    """
+
+    def __init__(self, match_iou: float = 0.45, clear_iou: float = 0.30, max_age: float = 2.5):
+        self.match_iou = match_iou
+        self.clear_iou = clear_iou
+        self.max_age = max_age
+        self._items: List[Dict] = []
+        self._boxes = np.zeros((0, 4), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _keep(self, mask: np.ndarray):
+        self._items = [item for item, keep in zip(self._items, mask.tolist()) if keep]
+        self._boxes = self._boxes[mask]
+
+    def upsert_many(self, bboxes, embeddings, now, blend) -> List[Dict]:
+        """
+        Attach each face to its best-overlapping candidate (or a new one) and return the
+        candidate per face. ``blend(prior, new)`` merges the stored embedding; a None
+        embedding (a tracked face that was not re-embedded) only counts the sighting.
+        """
+        boxes = np.asarray(bboxes, dtype=np.float32).reshape(-1, 4)
+        matched: List[Optional[Dict]] = [None] * boxes.shape[0]
+        ious = pairwise_iou(self._boxes, boxes)
+        for cand_idx, box_idx in greedy_assign(ious, self.match_iou):
+            candidate = self._items[cand_idx]
+            candidate['bbox'] = tuple(int(v) for v in boxes[box_idx])
+            candidate['last_seen'] = now
+            candidate['count'] = int(candidate.get('count', 0)) + 1
+            prior_embedding = candidate.get('embedding')
+            if embeddings[box_idx] is not None:
+                candidate['embedding'] = (
+                    embeddings[box_idx] if prior_embedding is None else blend(prior_embedding, embeddings[box_idx])
+                )
+            self._boxes[cand_idx] = boxes[box_idx]
+            matched[box_idx] = candidate
+
+        new_rows = []
+        for box_idx, candidate in enumerate(matched):
+            if candidate is not None:
+                continue
+            candidate = {
+                'bbox': tuple(int(v) for v in boxes[box_idx]),
+                'embedding': embeddings[box_idx],
+                'count': 1,
+                'first_seen': now,
+                'last_seen': now,
+            }
+            self._items.append(candidate)
+            new_rows.append(boxes[box_idx])
+            matched[box_idx] = candidate
+        if new_rows:
+            self._boxes = np.vstack([self._boxes, np.asarray(new_rows, dtype=np.float32)])
+        return matched
+
+    def clear_overlapping(self, bboxes):
+        """Drop candidates overlapping any of ``bboxes`` (faces that turned out to be known)."""
+        if not self._items or len(bboxes) == 0:
+            return
+        ious = pairwise_iou(self._boxes, bboxes)
+        self._keep(~np.any(ious > self.clear_iou, axis=1))
+
+    def discard(self, candidate: Dict):
+        self._keep(np.array([item is not candidate for item in self._items], dtype=bool))
+
+    def purge(self, now):
+        if not self._items:
+            return
+        ages = np.array([(now - item.get('last_seen', now)).total_seconds() for item in self._items])
+        self._keep(ages <= self.max_age)
+
+
+class CameraState:
+    """
+    Recognition state owned by one camera: its face tracker and pending unknown faces.
+
+    ``lock`` serializes frames of this camera only, so cameras never wait on each
+    other and an unknown face is never matched against another camera's candidates.
+    """
+
+    def __init__(self, camera_db_id: Optional[int], tracker: FaceTracker, pending: PendingCandidates):
+        self.camera_db_id = camera_db_id
+        self.tracker = tracker
+        self.pending = pending
+        self.lock = threading.Lock()
@@ -0,0 +1,174 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def camera_source(camera):
+    """OpenCV source for a Camera row: device 0 for webcams, otherwise the stream URL."""
+    stream_url = (camera.stream_url or '0').strip()
+    return 0 if stream_url in ('', '0') else stream_url
+
+
+class FrameGrabber:
+    """
+    Decodes one camera source on a background thread and keeps only the newest frame.
+
+    Consumers never see a backlog: a frame that is replaced before anyone read it is
+    counted as dropped. One grabber is shared by every viewer of the same camera.
+    """
+
+    def __init__(self, camera_id: str, source, logger=None):
+        self.camera_id = camera_id
+        self.source = source
+        self.logger = logger
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._frame: Optional[np.ndarray] = None
+        self._seq = 0
+        self._captured_at = 0.0
+        self._frame_consumed = True
+        self._running = False
+        self._users = 0
+        self.opened = False
+        self.started_at: Optional[float] = None
+        self.captured = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.latency_ms = 0.0
+        # Optional object with a stats() dict, e.g. the stream's analysis scheduler.
+        self.analysis = None
+        # Optional broadcaster fanning encoded frames out to the viewers (stats() dict).
+        self.broadcast = None
+
+    def start(self) -> bool:
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            cap.release()
+            return False
+        # Keep the driver-side queue short; the thread drains whatever is left.
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.opened = True
+        self._running = True
+        self.started_at = time.time()
+        self._thread = threading.Thread(
+            target=self._run,
+            args=(cap,),
+            name=f"capture-{self.camera_id}",
+            daemon=True,
+        )
+        self._thread.start()
+        return True
+
+    def _run(self, cap):
+        try:
+            while not self._stop.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    if self.logger is not None:
+                        self.logger.warning("Camera %s stream ended", self.camera_id)
+                    break
+                with self._cond:
+                    if not self._frame_consumed:
+                        self.dropped += 1
+                    self._frame = frame
+                    self._seq += 1
+                    self._captured_at = time.time()
+                    self._frame_consumed = False
+                    self.captured += 1
+                    self._cond.notify_all()
+        finally:
+            cap.release()
+            with self._cond:
+                self._running = False
+                self._cond.notify_all()
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def read(self, after_seq: int = 0, timeout: float = 5.0) -> Tuple[int, Optional[np.ndarray], float]:
+        """
+        Block until a frame newer than ``after_seq`` is available.
+
+        Returns (seq, frame, captured_at); frame is None when the source stopped
+        or nothing arrived within ``timeout``.
+        """
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._seq <= after_seq and self._running:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            if self._seq <= after_seq:
+                return after_seq, None, 0.0
+            self._frame_consumed = True
+            return self._seq, self._frame, self._captured_at
+
+    def record_delivery(self, captured_at: float):
+        """Note that a frame captured at ``captured_at`` left the server."""
+        latency = (time.time() - captured_at) * 1000.0
+        with self._cond:
+            self.delivered += 1
+            self.latency_ms = latency if self.delivered == 1 else 0.9 * self.latency_ms + 0.1 * latency
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+
+    def stats(self) -> Dict:
+        analysis = self.analysis.stats() if self.analysis is not None else None
+        broadcast = self.broadcast.stats() if self.broadcast is not None else None
+        with self._cond:
+            uptime = time.time() - self.started_at if self.started_at else 0.0
+            return {
+                'camera_id': self.camera_id,
+                'running': self._running,
+                'viewers': self._users,
+                'captured': self.captured,
+                'dropped': self.dropped,
+                'delivered': self.delivered,
+                'capture_fps': round(self.captured / uptime, 2) if uptime > 0 else 0.0,
+                'latency_ms': round(self.latency_ms, 1),
+                'analysis': analysis,
+                'stream': broadcast,
+            }
+
+
+_grabbers: Dict[str, FrameGrabber] = {}
+_grabbers_lock = threading.Lock()
+
+
+def acquire_grabber(camera_id: str, source, logger=None) -> Optional[FrameGrabber]:
+    """Return the running grabber for a camera, starting one if needed; None if the source will not open."""
+    with _grabbers_lock:
+        grabber = _grabbers.get(camera_id)
+        if grabber is None or not grabber.running:
+            grabber = FrameGrabber(camera_id, source, logger=logger)
+            if not grabber.start():
+                return None
+            _grabbers[camera_id] = grabber
+        grabber._users += 1
+        return grabber
+
+
+def release_grabber(grabber: FrameGrabber):
+    """Drop one viewer; the capture thread stops with the last one."""
+    with _grabbers_lock:
+        grabber._users = max(0, grabber._users - 1)
+        if grabber._users > 0:
+            return
+        if _grabbers.get(grabber.camera_id) is grabber:
+            _grabbers.pop(grabber.camera_id, None)
+    grabber.stop()
+
+
+def capture_stats():
+    with _grabbers_lock:
+        grabbers = list(_grabbers.values())
+    return [grabber.stats() for grabber in grabbers]
@@ -0,0 +1,359 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils.embedding_codec import dequantize_rows
+
+
+class DenseRows:
+    """
+    Read-only view over stored gallery rows: float32, float16, or int8 with per-row scales.
+
+    Compact rows are decoded in bounded chunks so scoring never materializes a full
+    float32 copy of the gallery.
+    """
+
+    def __init__(self, data: np.ndarray, scales: Optional[np.ndarray] = None, chunk: int = 16384):
+        self.data = data
+        self.scales = scales
+        self.chunk = max(1, int(chunk))
+
+    def __len__(self) -> int:
+        return int(self.data.shape[0])
+
+    @property
+    def is_float32(self) -> bool:
+        return self.data.dtype == np.float32 and self.scales is None
+
+    def decode(self, rows=None) -> np.ndarray:
+        data = self.data if rows is None else self.data[rows]
+        if self.is_float32:
+            return np.asarray(data)
+        scales = None if self.scales is None else (self.scales if rows is None else self.scales[rows])
+        return dequantize_rows(data, scales)
+
+    def iter_chunks(self):
+        for start in range(0, len(self), self.chunk):
+            stop = min(start + self.chunk, len(self))
+            yield start, self.decode(slice(start, stop))
+
+    def score(self, queries: np.ndarray, rows=None) -> np.ndarray:
+        """(queries x rows) similarity matrix."""
+        if rows is not None or self.is_float32:
+            return queries @ self.decode(rows).T
+        scores = np.empty((queries.shape[0], len(self)), dtype=np.float32)
+        for start, block in self.iter_chunks():
+            scores[:, start:start + block.shape[0]] = queries @ block.T
+        return scores
+
+
+def exact_search(rows: DenseRows, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Best row and score per query by a full scan."""
+    count = queries.shape[0]
+    if len(rows) == 0 or count == 0:
+        return np.full(count, -1, dtype=np.int64), np.full(count, -1.0, dtype=np.float32)
+    scores = rows.score(queries)
+    best_rows = np.argmax(scores, axis=1)
+    return best_rows.astype(np.int64), scores[np.arange(count), best_rows]
+
+
+class ExactIndex:
+    """Linear scan over every gallery row; always exact."""
+
+    name = 'exact'
+
+    def build(self, rows: DenseRows):
+        pass
+
+    def add(self, row: int, vector: np.ndarray):
+        pass
+
+    def update(self, row: int, vector: np.ndarray):
+        pass
+
+    def remove(self, row: int, last_row: int):
+        pass
+
+    def training_sample(self, rows: DenseRows) -> Optional[np.ndarray]:
+        return None
+
+    def train(self, rows: DenseRows):
+        pass
+
+    def search(self, rows: DenseRows, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        return exact_search(rows, queries)
+
+    def stats(self) -> Dict:
+        return {'backend': self.name}
+
+
+class IVFIndex:
+    """
+    Inverted-file index over gallery rows (pure NumPy).
+
+    Rows are bucketed by their nearest spherical k-means centroid. A query probes the
+    ``nprobe`` closest buckets and re-ranks their rows exactly against the full vectors.
+    Until it is trained the exact scan is used. Training is explicit and split so the
+    caller can run the k-means (``fit``) without holding the gallery lock and only
+    ``install`` the centroids under it; ``search`` never changes the index.
+    Retraining is due once the gallery has grown by ``retrain_growth``.
+    """
+
+    name = 'ivf'
+
+    def __init__(
+        self,
+        nlist: int = 0,
+        nprobe: int = 8,
+        min_train_size: int = 4096,
+        train_sample: int = 32768,
+        iterations: int = 12,
+        retrain_growth: float = 2.0,
+        seed: int = 0,
+    ):
+        self.nlist = int(nlist)
+        self.nprobe = max(1, int(nprobe))
+        self.min_train_size = max(1, int(min_train_size))
+        self.train_sample = max(1, int(train_sample))
+        self.iterations = max(1, int(iterations))
+        self.retrain_growth = max(1.1, float(retrain_growth))
+        self._rng = np.random.default_rng(seed)
+        self._centroids: Optional[np.ndarray] = None
+        self._assign = np.empty(0, dtype=np.int32)
+        self._lists: List[List[int]] = []
+        self._list_arrays: List[Optional[np.ndarray]] = []
+        self._trained_size = 0
+
+    @property
+    def trained(self) -> bool:
+        return self._centroids is not None
+
+    def _auto_nlist(self, size: int) -> int:
+        if self.nlist > 0:
+            return min(self.nlist, size)
+        return min(size, int(max(16, min(4096, 4 * np.sqrt(size)))))
+
+    def _kmeans(self, sample: np.ndarray, nlist: int) -> np.ndarray:
+        centroids = sample[self._rng.choice(sample.shape[0], nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = self._nearest(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            empty = norms == 0
+            if np.any(empty):
+                # Re-seed empty buckets from random rows so every list stays usable.
+                sums[empty] = sample[self._rng.choice(sample.shape[0], int(empty.sum()), replace=False)]
+                norms[empty] = np.linalg.norm(sums[empty], axis=1)
+            centroids = sums / np.maximum(norms, 1e-12)[:, None]
+        return centroids.astype(np.float32)
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 8192) -> np.ndarray:
+        # Chunked so the (rows x nlist) score block stays small for large galleries.
+        labels = np.empty(vectors.shape[0], dtype=np.int32)
+        for start in range(0, vectors.shape[0], chunk):
+            block = vectors[start:start + chunk]
+            labels[start:start + chunk] = np.argmax(block @ centroids.T, axis=1)
+        return labels
+
+    def training_sample(self, rows: DenseRows) -> Optional[np.ndarray]:
+        """A private copy of rows to ``fit`` on, or None while training is not due."""
+        size = len(rows)
+        if size < self.min_train_size:
+            return None
+        if self.trained and size < self._trained_size * self.retrain_growth:
+            return None
+        if size <= self.train_sample:
+            return np.array(rows.decode(), dtype=np.float32)
+        picks = np.sort(self._rng.choice(size, self.train_sample, replace=False))
+        return np.asarray(rows.decode(picks), dtype=np.float32)
+
+    def fit(self, sample: np.ndarray) -> np.ndarray:
+        """Centroids for ``sample``; touches no index state."""
+        return self._kmeans(sample, self._auto_nlist(sample.shape[0]))
+
+    def install(self, centroids: np.ndarray, rows: DenseRows):
+        """Swap in ``centroids`` and bucket every current row under them."""
+        size = len(rows)
+        assign = np.empty(size, dtype=np.int32)
+        for start, block in rows.iter_chunks():
+            assign[start:start + block.shape[0]] = self._nearest(block, centroids)
+        lists: List[List[int]] = [[] for _ in range(centroids.shape[0])]
+        for row, label in enumerate(assign.tolist()):
+            lists[label].append(row)
+        self._list_arrays = [np.asarray(members, dtype=np.int64) for members in lists]
+        self._lists = lists
+        self._assign = assign
+        self._centroids = centroids
+        self._trained_size = size
+
+    def train(self, rows: DenseRows):
+        """``fit`` and ``install`` in one step, if training is due."""
+        sample = self.training_sample(rows)
+        if sample is not None:
+            self.install(self.fit(sample), rows)
+
+    def _sync_list(self, label: int):
+        # Kept current on every mutation so search only reads.
+        self._list_arrays[label] = np.asarray(self._lists[label], dtype=np.int64)
+
+    def _move_to_list(self, row: int, label: int):
+        old = int(self._assign[row])
+        if old == label:
+            return
+        self._lists[old].remove(row)
+        self._sync_list(old)
+        self._lists[label].append(row)
+        self._sync_list(label)
+        self._assign[row] = label
+
+    def build(self, rows: DenseRows):
+        self._centroids = None
+        self._assign = np.empty(0, dtype=np.int32)
+        self._lists = []
+        self._list_arrays = []
+        self._trained_size = 0
+
+    def add(self, row: int, vector: np.ndarray):
+        if not self.trained:
+            return
+        label = int(np.argmax(self._centroids @ vector))
+        if row >= self._assign.shape[0]:
+            grown = np.empty(max(row + 1, self._assign.shape[0] * 2), dtype=np.int32)
+            grown[:self._assign.shape[0]] = self._assign
+            self._assign = grown
+        self._assign[row] = label
+        self._lists[label].append(row)
+        self._sync_list(label)
+
+    def update(self, row: int, vector: np.ndarray):
+        if self.trained:
+            self._move_to_list(row, int(np.argmax(self._centroids @ vector)))
+
+    def remove(self, row: int, last_row: int):
+        """Mirror the gallery's swap-remove: ``last_row`` moves into ``row``."""
+        if not self.trained:
+            return
+        label = int(self._assign[row])
+        self._lists[label].remove(row)
+        self._sync_list(label)
+        if last_row != row:
+            moved_label = int(self._assign[last_row])
+            members = self._lists[moved_label]
+            members[members.index(last_row)] = row
+            self._sync_list(moved_label)
+            self._assign[row] = moved_label
+
+    def search(self, rows: DenseRows, queries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.trained or len(rows) < self.min_train_size:
+            return exact_search(rows, queries)
+
+        count = queries.shape[0]
+        best_rows = np.full(count, -1, dtype=np.int64)
+        best_scores = np.full(count, -1.0, dtype=np.float32)
+        nlist = self._centroids.shape[0]
+        probe = min(self.nprobe, nlist)
+        coarse = queries @ self._centroids.T
+        probed = np.argpartition(-coarse, probe - 1, axis=1)[:, :probe]
+        for idx in range(count):
+            candidates = np.concatenate([self._list_arrays[label] for label in probed[idx]])
+            if candidates.size == 0:
+                continue
+            scores = rows.score(queries[idx:idx + 1], candidates)[0]
+            top = int(np.argmax(scores))
+            best_rows[idx] = candidates[top]
+            best_scores[idx] = scores[top]
+        return best_rows, best_scores
+
+    def stats(self) -> Dict:
+        sizes = [len(members) for members in self._lists]
+        return {
+            'backend': self.name,
+            'trained': self.trained,
+            'nlist': len(self._lists),
+            'nprobe': self.nprobe,
+            'trained_size': self._trained_size,
+            'largest_list': max(sizes) if sizes else 0,
+        }
+
+
+def make_index(backend: str = 'exact', **params):
+    backend = (backend or 'exact').strip().lower()
+    if backend == 'exact':
+        return ExactIndex()
+    if backend == 'ivf':
+        return IVFIndex(**params)
+    raise ValueError(f"Unknown visitor index backend: {backend}")
+
+
+def recall_report(matrix: np.ndarray, queries: np.ndarray, index, threshold: Optional[float] = None) -> Dict:
+    """
+    Compare an index against exact search on the same gallery.
+
+    Recall is top-1 agreement with the exact scan; when ``threshold`` is given,
+    ``decision_agreement`` also counts queries where both sides fall below it as agreeing.
+    """
+    rows = DenseRows(np.ascontiguousarray(matrix, dtype=np.float32))
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    index.build(rows)
+    index.train(rows)
+
+    started = time.perf_counter()
+    exact_rows, exact_scores = exact_search(rows, queries)
+    exact_ms = (time.perf_counter() - started) * 1000.0
+
+    started = time.perf_counter()
+    approx_rows, approx_scores = index.search(rows, queries)
+    approx_ms = (time.perf_counter() - started) * 1000.0
+
+    report = {
+        'gallery_size': len(rows),
+        'queries': int(queries.shape[0]),
+        'recall_at_1': float(np.mean(approx_rows == exact_rows)) if queries.shape[0] else 1.0,
+        'exact_ms_per_query': exact_ms / max(1, queries.shape[0]),
+        'index_ms_per_query': approx_ms / max(1, queries.shape[0]),
+        'index': index.stats(),
+    }
+    if threshold is not None:
+        exact_hit = exact_scores >= threshold
+        approx_hit = approx_scores >= threshold
+        agree = (exact_hit == approx_hit) & (~exact_hit | (approx_rows == exact_rows))
+        report['decision_agreement'] = float(np.mean(agree)) if queries.shape[0] else 1.0
+    return report
+
+
+def _synthetic_gallery(size: int, dim: int, queries: int, noise: float, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    gallery = rng.standard_normal((size, dim)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    picks = rng.choice(size, queries, replace=False)
+    probes = gallery[picks] + noise * rng.standard_normal((queries, dim)).astype(np.float32) / np.sqrt(dim)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+    return gallery, probes
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Recall/latency report: IVF visitor index vs exact scan.')
+    parser.add_argument('--size', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=0.8, help='query perturbation relative to a unit vector')
+    parser.add_argument('--nlist', type=int, default=0)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32])
+    parser.add_argument('--threshold', type=float, default=0.5)
+    args = parser.parse_args()
+
+    gallery_matrix, probe_matrix = _synthetic_gallery(args.size, args.dim, args.queries, args.noise)
+    for nprobe in args.nprobe:
+        result = recall_report(
+            gallery_matrix,
+            probe_matrix,
+            IVFIndex(nlist=args.nlist, nprobe=nprobe, min_train_size=1),
+            threshold=args.threshold,
+        )
+        print(json.dumps(result))
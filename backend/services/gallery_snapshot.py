@@ -0,0 +1,139 @@
+import datetime
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+def _iso(value: Optional[datetime.datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def _parse(value: Optional[str]) -> Optional[datetime.datetime]:
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def save_snapshot(directory: str, arrays: Dict, visitor_watermark, staff_watermark, keep: int = 2) -> str:
+    """
+    Write gallery arrays into a new version folder, then atomically repoint the manifest.
+
+    ``arrays`` holds visitor_ids, visitor_matrix, visitor_codes, staff_owners,
+    staff_templates and staff_profiles, plus visitor_scales for int8 rows. Older version folders beyond ``keep`` are removed
+    so processes still mapping the previous version are not pulled from under.
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
+    folder = f"snap-{version}"
+    target = os.path.join(directory, folder)
+    staging = f"{target}.tmp-{os.getpid()}"
+    os.makedirs(staging, exist_ok=True)
+
+    visitor_matrix = np.ascontiguousarray(arrays['visitor_matrix'])
+    np.save(os.path.join(staging, 'visitor_matrix.npy'), visitor_matrix)
+    visitor_scales = arrays.get('visitor_scales')
+    if visitor_scales is not None:
+        np.save(os.path.join(staging, 'visitor_scales.npy'), np.asarray(visitor_scales, dtype=np.float32))
+    np.save(os.path.join(staging, 'visitor_ids.npy'), np.asarray(arrays['visitor_ids'], dtype=np.int64))
+    np.save(os.path.join(staging, 'visitor_codes.npy'), np.asarray(arrays['visitor_codes'], dtype=str))
+    np.save(os.path.join(staging, 'staff_templates.npy'), np.ascontiguousarray(arrays['staff_templates']))
+    np.save(os.path.join(staging, 'staff_owners.npy'), np.asarray(arrays['staff_owners'], dtype=np.int64))
+    os.replace(staging, target)
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': version,
+        'folder': folder,
+        'created_at': datetime.datetime.now().isoformat(),
+        'visitor_watermark': _iso(visitor_watermark),
+        'staff_watermark': _iso(staff_watermark),
+        'visitor_count': int(visitor_matrix.shape[0]),
+        'dim': int(visitor_matrix.shape[1]) if visitor_matrix.ndim == 2 else 0,
+        'dtype': str(visitor_matrix.dtype),
+        'scaled': visitor_scales is not None,
+        'staff_profiles': {str(key): value for key, value in arrays['staff_profiles'].items()},
+    }
+    manifest_tmp = os.path.join(directory, f"{MANIFEST_NAME}.tmp-{os.getpid()}")
+    with open(manifest_tmp, 'w', encoding='utf-8') as fp:
+        json.dump(manifest, fp)
+    os.replace(manifest_tmp, os.path.join(directory, MANIFEST_NAME))
+
+    versions = sorted(name for name in os.listdir(directory) if name.startswith('snap-') and '.tmp-' not in name)
+    for stale in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, stale), ignore_errors=True)
+    return target
+
+
+def read_manifest(directory: str) -> Optional[Dict]:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as fp:
+        manifest = json.load(fp)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        return None
+    return manifest
+
+
+def load_snapshot(directory: str, mmap_mode: str = 'c') -> Optional[Dict]:
+    """
+    Memory-map the latest snapshot. The default copy-on-write mode lets the gallery
+    patch rows in place without touching the file or other processes' views.
+    """
+    manifest = read_manifest(directory)
+    if manifest is None:
+        return None
+    folder = os.path.join(directory, manifest['folder'])
+    if not os.path.isdir(folder):
+        return None
+    if not manifest.get('visitor_count'):
+        # Zero-length files cannot be memory-mapped.
+        mmap_mode = None
+    scales_path = os.path.join(folder, 'visitor_scales.npy')
+    return {
+        'manifest': manifest,
+        'visitor_watermark': _parse(manifest.get('visitor_watermark')),
+        'staff_watermark': _parse(manifest.get('staff_watermark')),
+        'visitor_matrix': np.load(os.path.join(folder, 'visitor_matrix.npy'), mmap_mode=mmap_mode),
+        'visitor_scales': np.load(scales_path) if manifest.get('scaled') and os.path.exists(scales_path) else None,
+        'visitor_ids': np.load(os.path.join(folder, 'visitor_ids.npy')),
+        'visitor_codes': np.load(os.path.join(folder, 'visitor_codes.npy')).tolist(),
+        'staff_templates': np.load(os.path.join(folder, 'staff_templates.npy')),
+        'staff_owners': np.load(os.path.join(folder, 'staff_owners.npy')),
+        'staff_profiles': {int(key): value for key, value in manifest.get('staff_profiles', {}).items()},
+    }
+
+
+class SnapshotWriter:
+    """Runs snapshot writes on a background thread, one at a time."""
+
+    def __init__(self, directory: str, logger=None):
+        self.directory = directory
+        self.logger = logger
+        self._thread: Optional[threading.Thread] = None
+        self.last_saved_at: Optional[datetime.datetime] = None
+
+    @property
+    def busy(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, arrays: Dict, visitor_watermark, staff_watermark) -> bool:
+        if self.busy:
+            return False
+
+        def run():
+            try:
+                save_snapshot(self.directory, arrays, visitor_watermark, staff_watermark)
+                self.last_saved_at = datetime.datetime.now()
+            except Exception as exc:
+                if self.logger is not None:
+                    self.logger.warning("Gallery snapshot write failed: %s", exc)
+
+        self._thread = threading.Thread(target=run, name='gallery-snapshot', daemon=True)
+        self._thread.start()
+        return True
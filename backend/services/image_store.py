@@ -0,0 +1,147 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+import cv2
+from flask import current_app
+
+
+class ImageWriterPool:
+    """
+    Encodes and writes JPEG snapshots on worker threads.
+
+    ``save`` returns the relative path at once so DB rows can reference it; the file
+    appears shortly after (written to a temp name and renamed, never half-written).
+    When the queue is full the image is written inline rather than dropped.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        workers: int = 2,
+        max_queue: int = 64,
+        jpeg_quality: int = 95,
+        max_dimension: int = 0,
+        logger=None,
+    ):
+        self.root = root
+        self.jpeg_quality = max(1, min(100, int(jpeg_quality)))
+        self.max_dimension = max(0, int(max_dimension))
+        self.logger = logger
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._written = 0
+        self._inline = 0
+        self._failed = 0
+        self._write_ms = 0.0
+        self._threads = []
+        for idx in range(max(1, int(workers))):
+            thread = threading.Thread(target=self._run, name=f"image-writer-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def save(self, image, rel_path: str) -> str:
+        """Queue ``image`` (not modified afterwards by the caller) for ``rel_path`` under the root."""
+        try:
+            self._queue.put_nowait((image, rel_path))
+        except queue.Full:
+            with self._lock:
+                self._inline += 1
+            self._write(image, rel_path)
+        return rel_path
+
+    def flush(self):
+        """Block until every queued image is on disk."""
+        self._queue.join()
+
+    def stop(self):
+        self.flush()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout=5.0)
+        self._threads = []
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'written': self._written,
+                'inline': self._inline,
+                'failed': self._failed,
+                'avg_write_ms': round(self._write_ms, 2),
+            }
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            finally:
+                self._queue.task_done()
+
+    def _encode(self, image):
+        h, w = image.shape[:2]
+        if self.max_dimension and max(h, w) > self.max_dimension:
+            scale = self.max_dimension / float(max(h, w))
+            image = cv2.resize(image, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+        if not ok:
+            raise ValueError('JPEG encoding failed')
+        return buffer.tobytes()
+
+    def _write(self, image, rel_path: str):
+        started = time.perf_counter()
+        abs_path = os.path.join(self.root, rel_path)
+        try:
+            data = self._encode(image)
+            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
+            tmp_path = f"{abs_path}.tmp"
+            with open(tmp_path, 'wb') as handle:
+                handle.write(data)
+            os.replace(tmp_path, abs_path)
+        except Exception as exc:
+            with self._lock:
+                self._failed += 1
+            if self.logger is not None:
+                self.logger.warning("Snapshot write failed for %s: %s", rel_path, exc)
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            self._written += 1
+            self._write_ms = elapsed_ms if self._written == 1 else self._write_ms * 0.9 + elapsed_ms * 0.1
+
+
+_writer: Optional[ImageWriterPool] = None
+_writer_lock = threading.Lock()
+
+
+def get_image_writer() -> ImageWriterPool:
+    """Process-wide writer for files under UPLOAD_FOLDER, created on first use."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            cfg = current_app.config
+            _writer = ImageWriterPool(
+                cfg['UPLOAD_FOLDER'],
+                workers=int(cfg.get('IMAGE_WRITE_WORKERS', 2)),
+                max_queue=int(cfg.get('IMAGE_WRITE_QUEUE', 64)),
+                jpeg_quality=int(cfg.get('IMAGE_JPEG_QUALITY', 95)),
+                max_dimension=int(cfg.get('IMAGE_MAX_DIMENSION', 0)),
+                logger=current_app.logger,
+            )
+            atexit.register(_writer.stop)
+        return _writer
+
+
+def shutdown_image_writer():
+    """Write out queued images; used where atexit does not run (spawned workers)."""
+    with _writer_lock:
+        writer = _writer
+    if writer is not None:
+        writer.flush()
@@ -0,0 +1,75 @@
+import threading
+import time
+from typing import Dict, Optional
+
+# Model lifecycle of this process: idle -> loading -> warming -> ready (or failed);
+# 'skipped' when camera worker processes run the analysis instead.
+_status: Dict = {
+    'state': 'idle',
+    'error': None,
+    'load_ms': None,
+    'warmup_ms': None,
+    'started_at': None,
+    'ready_at': None,
+    'session': None,
+}
+_status_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+
+
+def _update(**values):
+    with _status_lock:
+        _status.update(values)
+
+
+def record_model_load(load_ms: float):
+    """Called by FaceRecognitionService once its models are prepared."""
+    with _status_lock:
+        _status['load_ms'] = round(load_ms, 1)
+        if _status['state'] in ('idle', 'failed', 'skipped'):
+            # Loaded on demand rather than by the preload thread.
+            _status.update(state='ready', error=None, ready_at=time.time())
+
+
+def model_status() -> Dict:
+    with _status_lock:
+        status = dict(_status)
+    status['ready'] = status['state'] in ('ready', 'skipped')
+    return status
+
+
+def preload_models(app):
+    """Load the face models and run warm-up inference (body of the preload thread)."""
+    _update(state='loading', error=None, started_at=time.time())
+    with app.app_context():
+        try:
+            from services.face_recognition import FaceRecognitionService
+
+            service = FaceRecognitionService()
+            _update(state='warming', session=service.ort_settings)
+            warmup_ms = service.warm_up(int(app.config.get('MODEL_WARMUP_RUNS', 2)))
+            _update(state='ready', warmup_ms=round(warmup_ms, 1), ready_at=time.time())
+            app.logger.info("Face models ready (load %.0f ms, warm-up %.0f ms)", _status['load_ms'] or 0, warmup_ms)
+        except Exception as exc:
+            _update(state='failed', error=str(exc))
+            app.logger.warning("Face model preload failed: %s", exc)
+
+
+def start_model_preload(app) -> Optional[threading.Thread]:
+    """
+    Preload models in the background (MODEL_PRELOAD). Camera worker processes load
+    and warm their own service on start, after their per-process config is applied.
+    With CAMERA_WORKER_MODE=process the web process does no stream analysis, so it
+    leaves the cores and memory to the workers and loads models only on demand.
+    """
+    global _thread
+    from services.camera_workers import is_camera_worker
+
+    if not app.config.get('MODEL_PRELOAD', True) or is_camera_worker() or _thread is not None:
+        return _thread
+    if (app.config.get('CAMERA_WORKER_MODE') or 'inline').strip().lower() == 'process':
+        _update(state='skipped')
+        return None
+    _thread = threading.Thread(target=preload_models, args=(app,), name='model-preload', daemon=True)
+    _thread.start()
+    return _thread
@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+_EXECUTION_MODES = ('sequential', 'parallel')
+_OPTIMIZATION_LEVELS = {
+    'disabled': 'ORT_DISABLE_ALL',
+    'basic': 'ORT_ENABLE_BASIC',
+    'extended': 'ORT_ENABLE_EXTENDED',
+    'all': 'ORT_ENABLE_ALL',
+}
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def intra_op_threads(config, thread_share: Optional[int] = None) -> int:
+    """
+    ORT_INTRA_OP_THREADS, or with 0 the CPU count split across ``thread_share``
+    processes running inference on this host (camera workers, web workers).
+    """
+    threads = int(config.get('ORT_INTRA_OP_THREADS', 0))
+    if threads > 0:
+        return threads
+    share = max(1, int(thread_share or config.get('ORT_THREAD_SHARE', 1)))
+    return max(1, (os.cpu_count() or 1) // share)
+
+
+def session_settings(config, thread_share: Optional[int] = None) -> Dict:
+    """The effective ONNX Runtime session settings, as plain values."""
+    mode = str(config.get('ORT_EXECUTION_MODE', 'sequential')).strip().lower()
+    level = str(config.get('ORT_GRAPH_OPTIMIZATION', 'all')).strip().lower()
+    return {
+        'intra_op_threads': intra_op_threads(config, thread_share),
+        'inter_op_threads': max(0, int(config.get('ORT_INTER_OP_THREADS', 1))),
+        'execution_mode': mode if mode in _EXECUTION_MODES else 'sequential',
+        'graph_optimization': level if level in _OPTIMIZATION_LEVELS else 'all',
+        'cpu_mem_arena': _flag(config.get('ORT_CPU_MEM_ARENA', True)),
+        'mem_pattern': _flag(config.get('ORT_MEM_PATTERN', True)),
+        'allow_spinning': _flag(config.get('ORT_ALLOW_SPINNING', True)),
+    }
+
+
+def session_options(settings: Dict):
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = settings['intra_op_threads']
+    options.inter_op_num_threads = settings['inter_op_threads']
+    options.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL if settings['execution_mode'] == 'parallel'
+        else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    options.graph_optimization_level = getattr(
+        ort.GraphOptimizationLevel, _OPTIMIZATION_LEVELS[settings['graph_optimization']]
+    )
+    options.enable_cpu_mem_arena = settings['cpu_mem_arena']
+    options.enable_mem_pattern = settings['mem_pattern']
+    # Busy-waiting workers burn cores other sessions could use when oversubscribed.
+    options.add_session_config_entry('session.intra_op.allow_spinning', '1' if settings['allow_spinning'] else '0')
+    options.add_session_config_entry('session.inter_op.allow_spinning', '1' if settings['allow_spinning'] else '0')
+    return options
+
+
+def apply_session_options(face_analysis, settings: Dict, providers: List[str]):
+    """
+    Recreate each model session of a FaceAnalysis with ``settings``.
+
+    insightface only forwards providers to ``InferenceSession``, so the sessions are
+    rebuilt from the same model files; input and output names are unchanged.
+    """
+    import onnxruntime as ort
+
+    options = session_options(settings)
+    for model in face_analysis.models.values():
+        model.session = ort.InferenceSession(model.model_file, sess_options=options, providers=providers)
+
+
+def benchmark(face_analysis, det_size: int, streams: int = 1, runs: int = 20, faces_per_frame: int = 4) -> Dict:
+    """
+    Frames per second of detector + recognizer on synthetic input with ``streams``
+    threads sharing the sessions, as inline camera streams do.
+    """
+    import numpy as np
+
+    rec_model = face_analysis.models['recognition']
+    det_model = face_analysis.det_model
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, size=(det_size, det_size, 3), dtype=np.uint8)
+    crops = [
+        rng.integers(0, 255, size=(rec_model.input_size[1], rec_model.input_size[0], 3), dtype=np.uint8)
+        for _ in range(faces_per_frame)
+    ]
+
+    def step():
+        det_model.detect(frame, input_size=(det_size, det_size), max_num=0, metric='default')
+        rec_model.get_feat(crops)
+
+    step()
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def worker():
+        local = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            step()
+            local.append((time.perf_counter() - started) * 1000.0)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, streams))]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'frames_per_second': round(len(latencies) / elapsed, 2) if elapsed > 0 else 0.0,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 1),
+        'p95_ms': round(float(np.percentile(latencies, 95)), 1),
+    }
+
+
+def _candidate_threads(cores: int, share: int) -> List[int]:
+    limit = max(1, cores // max(1, share))
+    values, threads = [], 1
+    while threads < limit:
+        values.append(threads)
+        threads *= 2
+    values.append(limit)
+    return values
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    from insightface.app import FaceAnalysis
+
+    parser = argparse.ArgumentParser(description='Pick ONNX Runtime session settings for the face models on this host.')
+    parser.add_argument('--model', default='buffalo_l')
+    parser.add_argument('--det-size', type=int, default=int(os.getenv('FACE_DET_SIZE', 640)))
+    parser.add_argument('--streams', type=int, default=1, help='concurrent streams per process')
+    parser.add_argument('--share', type=int, default=1, help='processes running inference on this host')
+    parser.add_argument('--runs', type=int, default=20, help='frames per stream and candidate')
+    args = parser.parse_args()
+
+    face_analysis = FaceAnalysis(
+        name=args.model,
+        providers=['CPUExecutionProvider'],
+        allowed_modules=['detection', 'recognition'],
+    )
+    face_analysis.prepare(ctx_id=0, det_size=(args.det_size, args.det_size))
+
+    results = []
+    for threads in _candidate_threads(os.cpu_count() or 1, args.share):
+        for mode, inter in (('sequential', 1), ('parallel', 2)):
+            settings = session_settings({
+                'ORT_INTRA_OP_THREADS': threads,
+                'ORT_INTER_OP_THREADS': inter,
+                'ORT_EXECUTION_MODE': mode,
+                'ORT_ALLOW_SPINNING': args.share == 1 and args.streams == 1,
+            })
+            apply_session_options(face_analysis, settings, ['CPUExecutionProvider'])
+            report = {**settings, **benchmark(face_analysis, args.det_size, args.streams, args.runs)}
+            results.append(report)
+            print(json.dumps(report))
+
+    best = max(results, key=lambda item: (item['frames_per_second'], -item['p95_ms']))
+    print(json.dumps({
+        'recommended': {
+            'ORT_INTRA_OP_THREADS': best['intra_op_threads'],
+            'ORT_INTER_OP_THREADS': best['inter_op_threads'],
+            'ORT_EXECUTION_MODE': best['execution_mode'],
+            'ORT_ALLOW_SPINNING': best['allow_spinning'],
+        }
+    }))
@@ -0,0 +1,294 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db
+from models.visitor import Visitor, VisitorImage, VisitorSession
+from services.report_jobs import enqueue_visitor_report, notify_report_workers
+from services.visitor_codes import next_visitor_code, visitor_code_taken
+
+# Domain events emitted by recognition; each is a dict with a 'type' key.
+VISITOR_CREATED = 'visitor_created'
+SESSION_OPENED = 'session_opened'
+SESSION_CLOSED = 'session_closed'
+CAMERA_SESSIONS_CLOSED = 'camera_sessions_closed'
+LAST_SEEN = 'last_seen'
+TEMPLATE_UPDATED = 'template_updated'
+
+# Only the newest value per visitor in a batch is written. Under backpressure these are
+# dropped rather than blocking the frame loop; a later sighting sends them again.
+_COALESCED = (LAST_SEEN, TEMPLATE_UPDATED)
+
+
+def _chunks(values, size=1000):
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class RecognitionWriter:
+    """
+    Write-behind persistence for recognition results.
+
+    Frame threads ``submit`` events into a bounded queue; one background thread
+    coalesces them and commits a batch once ``batch_size`` events are queued or
+    ``flush_interval`` seconds passed since the first one. Closing a visit enqueues
+    its PDF as a report job in the same transaction.
+    """
+
+    def __init__(
+        self,
+        app,
+        max_queue: int = 2048,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        block_timeout: float = 5.0,
+        on_create_failed: Optional[Callable[[Dict], None]] = None,
+        on_code_changed: Optional[Callable[[Dict], None]] = None,
+    ):
+        self.app = app
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.0, float(flush_interval))
+        self.block_timeout = block_timeout
+        self.on_create_failed = on_create_failed
+        self.on_code_changed = on_code_changed
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._cond = threading.Condition()
+        self._submitted = 0
+        self._processed = 0
+        self._dropped = 0
+        self._failed = 0
+        self._batches = 0
+        self._last_batch_ms = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='recognition-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, event: Dict) -> bool:
+        coalesced = event['type'] in _COALESCED
+        try:
+            if coalesced:
+                self._queue.put_nowait(event)
+            else:
+                self._queue.put(event, timeout=self.block_timeout)
+        except queue.Full:
+            with self._cond:
+                self._dropped += 1
+            if not coalesced:
+                self.app.logger.warning("Recognition write queue full, dropped %s event", event['type'])
+            return False
+        with self._cond:
+            self._submitted += 1
+        return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything submitted so far is committed (or failed)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._submitted
+            while self._processed < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout: float = 10.0):
+        """Drain the queue and stop the writer thread."""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'queued': self._queue.qsize(),
+                'submitted': self._submitted,
+                'written': self._processed - self._failed,
+                'dropped': self._dropped,
+                'failed': self._failed,
+                'batches': self._batches,
+                'last_batch_ms': round(self._last_batch_ms, 2),
+            }
+
+    def _next_batch(self) -> List[Dict]:
+        try:
+            batch = [self._queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0 or self._stop.is_set():
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                if self._stop.is_set() and self._queue.empty():
+                    break
+                continue
+            started = time.perf_counter()
+            failed = 0
+            try:
+                failed = self._write(batch)
+            except Exception as exc:
+                failed = len(batch)
+                self.app.logger.warning("Recognition writer batch lost: %s", exc)
+            with self._cond:
+                self._processed += len(batch)
+                self._failed += failed
+                self._batches += 1
+                self._last_batch_ms = (time.perf_counter() - started) * 1000.0
+                self._cond.notify_all()
+
+    def _write(self, batch: List[Dict]) -> int:
+        """Commit ``batch``; on failure retry event by event. Returns the failed count."""
+        failed = 0
+        with self.app.app_context():
+            try:
+                try:
+                    closed = self._apply(batch)
+                    db.session.commit()
+                except Exception as exc:
+                    db.session.rollback()
+                    self.app.logger.warning("Recognition batch of %d failed, retrying singly: %s", len(batch), exc)
+                    closed = []
+                    for event in batch:
+                        try:
+                            closed.extend(self._apply([event]))
+                            db.session.commit()
+                        except Exception as event_exc:
+                            db.session.rollback()
+                            if event['type'] == VISITOR_CREATED and self._recode_visitor(event, event_exc):
+                                continue
+                            failed += 1
+                            self.app.logger.warning("Dropped %s event: %s", event['type'], event_exc)
+                            if event['type'] == VISITOR_CREATED and self.on_create_failed is not None:
+                                self.on_create_failed(event)
+                if closed:
+                    notify_report_workers()
+            finally:
+                db.session.remove()
+        return failed
+
+    def _recode_visitor(self, event: Dict, exc: Exception, attempts: int = 3) -> bool:
+        """
+        Insert a new visitor again under a fresh code when its code was taken, e.g.
+        assigned by hand while it sat in this process's reserved block.
+        """
+        while attempts > 0 and isinstance(exc, IntegrityError) and visitor_code_taken(event['visitor_code']):
+            attempts -= 1
+            previous = event['visitor_code']
+            event['visitor_code'] = next_visitor_code()
+            try:
+                self._apply([event])
+                db.session.commit()
+            except Exception as retry_exc:
+                db.session.rollback()
+                exc = retry_exc
+                continue
+            self.app.logger.info("Visitor code %s was taken; enrolled as %s", previous, event['visitor_code'])
+            if self.on_code_changed is not None:
+                self.on_code_changed(event)
+            return True
+        return False
+
+    def _apply(self, batch: List[Dict]) -> List[int]:
+        """Stage ``batch`` in the session; returns the visitors whose visit was closed."""
+        last_seen: Dict[int, object] = {}
+        templates: Dict[int, bytes] = {}
+        closed = []
+        for event in batch:
+            kind = event['type']
+            if kind == LAST_SEEN:
+                visitor_db_id = event['visitor_db_id']
+                previous = last_seen.get(visitor_db_id)
+                last_seen[visitor_db_id] = event['at'] if previous is None else max(previous, event['at'])
+            elif kind == TEMPLATE_UPDATED:
+                templates[event['visitor_db_id']] = event['embedding']
+            elif kind == VISITOR_CREATED:
+                self._create_visitor(event)
+            elif kind == SESSION_OPENED:
+                self._open_session(event)
+            elif kind == SESSION_CLOSED:
+                if self._close_sessions(event['visitor_db_id'], event['exit_time']):
+                    enqueue_visitor_report(event['visitor_db_id'], event.get('event_start'), event.get('event_end'))
+                    closed.append(event['visitor_db_id'])
+            elif kind == CAMERA_SESSIONS_CLOSED:
+                query = VisitorSession.query.filter_by(is_active=True)
+                if event.get('camera_db_id') is not None:
+                    query = query.filter_by(camera_id=event['camera_db_id'])
+                for visitor_db_id in sorted({session.visitor_id for session in query.all()}):
+                    if self._close_sessions(visitor_db_id, event['exit_time']):
+                        enqueue_visitor_report(visitor_db_id, event.get('event_start'), event.get('event_end'))
+                        closed.append(visitor_db_id)
+
+        touched = sorted(set(last_seen) | set(templates))
+        for chunk in _chunks(touched):
+            for visitor in Visitor.query.filter(Visitor.id.in_(chunk)).all():
+                if visitor.id in templates:
+                    visitor.embedding = templates[visitor.id]
+                seen = last_seen.get(visitor.id)
+                if seen is not None and (visitor.last_seen is None or seen > visitor.last_seen):
+                    visitor.last_seen = seen
+        return closed
+
+    @staticmethod
+    def _create_visitor(event: Dict):
+        # The primary key was reserved from the sequence when the visitor was enrolled.
+        db.session.add(Visitor(
+            id=event['visitor_db_id'],
+            visitor_id=event['visitor_code'],
+            primary_image_path=event['image_path'],
+            embedding=event['embedding'],
+            first_seen=event['seen_at'],
+            last_seen=event['seen_at'],
+            visit_count=1,
+        ))
+        db.session.add(VisitorImage(visitor_id=event['visitor_db_id'], image_path=event['image_path']))
+        db.session.add(VisitorSession(
+            visitor_id=event['visitor_db_id'],
+            camera_id=event.get('camera_db_id'),
+            entry_time=event['seen_at'],
+            is_active=True,
+        ))
+
+    @staticmethod
+    def _open_session(event: Dict):
+        """Open a session unless one is active already (another process or a restart)."""
+        visitor_db_id = event['visitor_db_id']
+        active = VisitorSession.query.filter_by(visitor_id=visitor_db_id, is_active=True).first()
+        if active is not None:
+            return
+        visitor = Visitor.query.get(visitor_db_id)
+        if visitor is None:
+            return
+        db.session.add(VisitorSession(
+            visitor_id=visitor_db_id,
+            camera_id=event.get('camera_db_id'),
+            entry_time=event['entry_time'],
+            is_active=True,
+        ))
+        visitor.visit_count = (visitor.visit_count or 0) + 1
+
+    @staticmethod
+    def _close_sessions(visitor_db_id: int, exit_time) -> bool:
+        visitor = Visitor.query.get(visitor_db_id)
+        if visitor is None:
+            return False
+        for session in VisitorSession.query.filter_by(visitor_id=visitor_db_id, is_active=True).all():
+            session.is_active = False
+            session.exit_time = exit_time
+        visitor.last_seen = exit_time
+        return True
@@ -0,0 +1,256 @@
+import datetime
+import os
+import threading
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import db
+from models.report_job import ReportJob
+from models.visitor import Visitor
+
+
+def _widen(current, incoming, pick):
+    # LEAST/GREATEST skip NULLs, which would narrow an open (NULL) bound.
+    return db.case(
+        (db.or_(current.is_(None), incoming.is_(None)), db.null()),
+        else_=pick(current, incoming),
+    )
+
+
+def _widen_bound(current, incoming, pick):
+    return None if current is None or incoming is None else pick(current, incoming)
+
+
+def enqueue_visitor_report(visitor_db_id: int, event_start=None, event_end=None) -> Optional[int]:
+    """
+    Stage a PDF job for a visitor in the current session (the caller commits).
+
+    A visitor has at most one queued job; enqueueing again widens its event window
+    instead of adding a row (a NULL bound is open and stays open). A job that is
+    already running is left alone.
+    """
+    now = datetime.datetime.now()
+    table = ReportJob.__table__
+    statement = pg_insert(table).values(
+        visitor_id=visitor_db_id,
+        status='queued',
+        event_start=event_start,
+        event_end=event_end,
+        attempts=0,
+        created_at=now,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.visitor_id],
+        index_where=text("status = 'queued'"),
+        set_={
+            'event_start': _widen(table.c.event_start, statement.excluded.event_start, db.func.least),
+            'event_end': _widen(table.c.event_end, statement.excluded.event_end, db.func.greatest),
+        },
+    ).returning(table.c.id)
+    # The visitor may have been created in the same, not yet flushed, unit of work.
+    db.session.flush()
+    row = db.session.execute(statement).first()
+    return row[0] if row else None
+
+
+class ReportJobPool:
+    """
+    Worker threads that render queued visitor PDFs.
+
+    Jobs are claimed with ``FOR UPDATE SKIP LOCKED``, so several web processes can run
+    pools against the same table. Workers poll every ``poll_interval`` seconds and are
+    woken early by ``notify`` when a job is enqueued in this process. A failed job is
+    queued again after ``retry_backoff`` seconds, doubling per attempt, until it has
+    been tried ``max_attempts`` times.
+    """
+
+    def __init__(
+        self,
+        app,
+        workers: int = 2,
+        poll_interval: float = 2.0,
+        stale_after: float = 600.0,
+        max_attempts: int = 3,
+        retry_backoff: float = 30.0,
+    ):
+        self.app = app
+        self.workers = max(1, int(workers))
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.max_attempts = max(1, int(max_attempts))
+        self.retry_backoff = max(0.0, float(retry_backoff))
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._requeue_stale()
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"report-worker-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def notify(self):
+        self._wake.set()
+
+    def _requeue_stale(self):
+        """Requeue jobs left 'running' by a crashed process (unless a newer one is queued)."""
+        now = datetime.datetime.now()
+        cutoff = now - datetime.timedelta(seconds=self.stale_after)
+        with self.app.app_context():
+            try:
+                stale = ReportJob.query.filter(ReportJob.status == 'running', ReportJob.started_at < cutoff).all()
+                queued = {
+                    row[0] for row in db.session.query(ReportJob.visitor_id).filter_by(status='queued').all()
+                }
+                for job in stale:
+                    if job.visitor_id in queued:
+                        job.status = 'failed'
+                        job.error = 'Interrupted; superseded by a queued job'
+                        job.finished_at = now
+                    elif (job.attempts or 0) >= self.max_attempts:
+                        job.status = 'failed'
+                        job.error = 'Interrupted; no attempts left'
+                        job.finished_at = now
+                    else:
+                        job.status = 'queued'
+                        job.run_after = None
+                        queued.add(job.visitor_id)
+                db.session.commit()
+            except Exception as exc:
+                db.session.rollback()
+                self.app.logger.warning("Could not requeue stale report jobs: %s", exc)
+            finally:
+                db.session.remove()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                worked = self._run_one()
+            except Exception as exc:
+                worked = False
+                self.app.logger.warning("Report worker iteration failed: %s", exc)
+            if not worked:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def _claim(self) -> Optional[ReportJob]:
+        now = datetime.datetime.now()
+        job = (
+            ReportJob.query.filter(
+                ReportJob.status == 'queued',
+                db.or_(ReportJob.run_after.is_(None), ReportJob.run_after <= now),
+            )
+            .order_by(ReportJob.created_at)
+            .with_for_update(skip_locked=True, of=ReportJob)
+            .first()
+        )
+        if job is None:
+            db.session.rollback()
+            return None
+        job.status = 'running'
+        job.started_at = now
+        job.attempts = (job.attempts or 0) + 1
+        db.session.commit()
+        return job
+
+    def _run_one(self) -> bool:
+        with self.app.app_context():
+            try:
+                job = self._claim()
+                if job is None:
+                    return False
+                try:
+                    from services.report_generator import ReportGenerator
+
+                    visitor = Visitor.query.get(job.visitor_id)
+                    if visitor is None:
+                        raise ValueError('Visitor no longer exists')
+                    filepath = ReportGenerator().generate_visitor_pdf(
+                        visitor,
+                        event_start=job.event_start,
+                        event_end=job.event_end,
+                    )
+                    job.status = 'done'
+                    job.file_path = os.path.relpath(filepath, self.app.config['REPORTS_FOLDER'])
+                    job.error = None
+                except Exception as exc:
+                    db.session.rollback()
+                    job = ReportJob.query.get(job.id)
+                    if job is None:
+                        return True
+                    job.error = str(exc)[:2000]
+                    if self._retry(job):
+                        self.app.logger.warning(
+                            "Visitor PDF generation failed for visitor_id=%s (attempt %d, retrying): %s",
+                            job.visitor_id,
+                            job.attempts,
+                            exc,
+                        )
+                        db.session.commit()
+                        return True
+                    job.status = 'failed'
+                    self.app.logger.warning("Visitor PDF generation failed for visitor_id=%s: %s", job.visitor_id, exc)
+                job.finished_at = datetime.datetime.now()
+                db.session.commit()
+                return True
+            finally:
+                db.session.remove()
+
+    def _retry(self, job: ReportJob) -> bool:
+        """
+        Queue a failed job again after its backoff; False once it is out of attempts.
+        A job queued for the same visitor meanwhile takes over its event window instead.
+        """
+        attempts = job.attempts or 0
+        if attempts >= self.max_attempts:
+            return False
+        queued = ReportJob.query.filter_by(visitor_id=job.visitor_id, status='queued').with_for_update().first()
+        if queued is not None:
+            queued.event_start = _widen_bound(queued.event_start, job.event_start, min)
+            queued.event_end = _widen_bound(queued.event_end, job.event_end, max)
+            job.status = 'failed'
+            job.error = f"{job.error}; superseded by a queued job"[:2000]
+            job.finished_at = datetime.datetime.now()
+            return True
+        job.status = 'queued'
+        job.run_after = datetime.datetime.now() + datetime.timedelta(
+            seconds=self.retry_backoff * (2 ** (attempts - 1))
+        )
+        return True
+
+
+_pool: Optional[ReportJobPool] = None
+
+
+def start_report_workers(app) -> Optional[ReportJobPool]:
+    """Start the report pool (REPORT_WORKERS > 0); camera worker processes only enqueue."""
+    global _pool
+    from services.camera_workers import is_camera_worker
+
+    workers = int(app.config.get('REPORT_WORKERS', 2))
+    if workers <= 0 or is_camera_worker() or _pool is not None:
+        return _pool
+    _pool = ReportJobPool(
+        app,
+        workers=workers,
+        poll_interval=float(app.config.get('REPORT_JOB_POLL_INTERVAL', 2.0)),
+        stale_after=float(app.config.get('REPORT_JOB_STALE_SECONDS', 600.0)),
+        max_attempts=int(app.config.get('REPORT_JOB_MAX_ATTEMPTS', 3)),
+        retry_backoff=float(app.config.get('REPORT_JOB_RETRY_BACKOFF', 30.0)),
+    )
+    _pool.start()
+    return _pool
+
+
+def notify_report_workers():
+    if _pool is not None:
+        _pool.notify()
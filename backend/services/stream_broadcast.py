@@ -0,0 +1,250 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import cv2
+
+from services.stream_overlay import draw_overlays
+
+# Encode profiles a viewer can ask for: 'preview' for thumbnail walls, 'full' for operators.
+STREAM_PROFILES = ('preview', 'full')
+
+
+def profile_settings(config, profile: str) -> Tuple[int, int]:
+    """(max_width, jpeg_quality) of a stream profile; max_width 0 keeps the camera size."""
+    key = 'PREVIEW' if profile == 'preview' else 'FULL'
+    default_width, default_quality = (640, 60) if key == 'PREVIEW' else (0, 95)
+    return (
+        max(0, int(config.get(f'STREAM_{key}_MAX_WIDTH', default_width))),
+        max(1, min(100, int(config.get(f'STREAM_{key}_JPEG_QUALITY', default_quality)))),
+    )
+
+
+def encode_jpeg(frame, max_width: int = 0, quality: int = 95) -> Optional[bytes]:
+    h, w = frame.shape[:2]
+    if max_width and w > max_width:
+        scale = max_width / float(w)
+        frame = cv2.resize(frame, (max_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    ret, jpeg = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+    return jpeg.tobytes() if ret else None
+
+
+class FrameSlot:
+    """
+    One subscriber's mailbox holding only the newest encoded frame.
+
+    The publisher never waits on it: an unread frame is replaced and counted as
+    dropped, so a slow client skips frames instead of holding up the others.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._data: Optional[bytes] = None
+        self._captured_at = 0.0
+        self._read_seq = 0
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, seq: int, data: bytes, captured_at: float):
+        with self._cond:
+            if self._seq > self._read_seq:
+                self.dropped += 1
+            self._seq = seq
+            self._data = data
+            self._captured_at = captured_at
+            self._cond.notify_all()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def get(self, timeout: float = 10.0) -> Tuple[Optional[bytes], float]:
+        """Block for a frame newer than the last one read; (None, 0.0) on timeout or close."""
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._seq <= self._read_seq and not self._closed:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None, 0.0
+                self._cond.wait(remaining)
+            if self._seq <= self._read_seq:
+                return None, 0.0
+            self._read_seq = self._seq
+            return self._data, self._captured_at
+
+
+class CameraBroadcaster:
+    """
+    Captures, analyzes and encodes one camera once and fans the JPEGs out to viewers.
+
+    Runs on its own thread inside an app context, so recognition (tracks, sessions)
+    happens once per camera however many browsers watch it. Each frame is encoded at
+    most once per profile that has subscribers. It stops with its last subscriber.
+    """
+
+    def __init__(self, app, camera_id: str):
+        self.app = app
+        self.camera_id = camera_id
+        self._slots: Dict[str, List[FrameSlot]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._grabber = None
+        self.encoded: Dict[str, int] = {}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"broadcast-{self.camera_id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._close_slots()
+
+    def _close_slots(self):
+        with self._lock:
+            slots = [slot for group in self._slots.values() for slot in group]
+        for slot in slots:
+            slot.close()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive() and not self._stop.is_set()
+
+    def add(self, profile: str = 'full') -> FrameSlot:
+        slot = FrameSlot()
+        with self._lock:
+            self._slots.setdefault(profile, []).append(slot)
+        return slot
+
+    def remove(self, slot: FrameSlot) -> int:
+        """Drop ``slot``; returns the number of subscribers left."""
+        with self._lock:
+            for profile, group in list(self._slots.items()):
+                if slot in group:
+                    group.remove(slot)
+                if not group:
+                    self._slots.pop(profile)
+            return sum(len(group) for group in self._slots.values())
+
+    def record_delivery(self, captured_at: float):
+        grabber = self._grabber
+        if grabber is not None:
+            grabber.record_delivery(captured_at)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'subscribers': {profile: len(group) for profile, group in self._slots.items()},
+                'encoded': dict(self.encoded),
+                'slot_dropped': sum(slot.dropped for group in self._slots.values() for slot in group),
+            }
+
+    def _run(self):
+        from models.camera import Camera
+        from services.detection_events import DetectionPublisher
+        from services.frame_capture import acquire_grabber, camera_source, release_grabber
+        from services.stream_pipeline import StreamPipeline
+
+        with self.app.app_context():
+            try:
+                camera = Camera.query.filter_by(camera_id=self.camera_id).first()
+                if camera is None:
+                    return
+                fr_service = None
+                try:
+                    # Import lazily to avoid hard-failing stream on model import issues.
+                    from services.face_recognition import FaceRecognitionService
+                    fr_service = FaceRecognitionService()
+                except Exception as exc:
+                    self.app.logger.warning("Face model unavailable for stream: %s", exc)
+
+                source = camera_source(camera)
+                grabber = acquire_grabber(camera.camera_id, source, logger=self.app.logger)
+                if grabber is None:
+                    self.app.logger.error("Could not open camera stream: %s", source)
+                    return
+
+                from routes.events import get_event_state_snapshot
+                cfg = self.app.config
+                pipeline = StreamPipeline(
+                    fr_service,
+                    camera,
+                    lambda: get_event_state_snapshot(sync=True),
+                    fps_limit=float(cfg.get('STREAM_ANALYSIS_FPS', 0)) or camera.fps_limit,
+                    max_duty=float(cfg.get('STREAM_ANALYSIS_MAX_DUTY', 0.6)),
+                    logger=self.app.logger,
+                )
+                grabber.analysis = pipeline
+                grabber.broadcast = self
+                self._grabber = grabber
+                publisher = DetectionPublisher(
+                    camera.camera_id,
+                    max_fps=float(cfg.get('DETECTIONS_EMIT_FPS', 10.0)),
+                )
+                try:
+                    self._loop(grabber, pipeline, publisher)
+                finally:
+                    if grabber.broadcast is self:
+                        grabber.broadcast = None
+                    release_grabber(grabber)
+            finally:
+                self._stop.set()
+                self._close_slots()
+
+    def _loop(self, grabber, pipeline, publisher):
+        settings = {profile: profile_settings(self.app.config, profile) for profile in STREAM_PROFILES}
+        draw = bool(self.app.config.get('STREAM_DRAW_OVERLAYS', True))
+        seq = 0
+        while not self._stop.is_set():
+            seq, frame, captured_at = grabber.read(seq, timeout=1.0)
+            if frame is None:
+                if not grabber.running:
+                    break
+                continue
+            overlays = pipeline.process(frame)
+            try:
+                publisher.publish(overlays, frame.shape, captured_at, pipeline.last_analyzed)
+            except Exception as exc:
+                self.app.logger.warning("Detections publish failed for %s: %s", self.camera_id, exc)
+            if draw and overlays:
+                frame = draw_overlays(frame.copy(), overlays)
+            with self._lock:
+                groups = {profile: list(group) for profile, group in self._slots.items()}
+            for profile, slots in groups.items():
+                # One encode per profile per frame, shared by all its subscribers.
+                data = encode_jpeg(frame, *settings[profile])
+                if data is None:
+                    continue
+                self.encoded[profile] = self.encoded.get(profile, 0) + 1
+                for slot in slots:
+                    slot.put(seq, data, captured_at)
+
+
+_broadcasters: Dict[str, CameraBroadcaster] = {}
+_broadcasters_lock = threading.Lock()
+
+
+def subscribe(app, camera_id: str, profile: str = 'full') -> Tuple[CameraBroadcaster, FrameSlot]:
+    """Join the camera's broadcaster for ``profile``, starting it for the first viewer."""
+    with _broadcasters_lock:
+        broadcaster = _broadcasters.get(camera_id)
+        if broadcaster is None or not broadcaster.running:
+            broadcaster = CameraBroadcaster(app, camera_id)
+            _broadcasters[camera_id] = broadcaster
+            slot = broadcaster.add(profile)
+            broadcaster.start()
+        else:
+            slot = broadcaster.add(profile)
+        return broadcaster, slot
+
+
+def unsubscribe(broadcaster: CameraBroadcaster, slot: FrameSlot):
+    """Leave a broadcaster; the last viewer stops capture and analysis."""
+    with _broadcasters_lock:
+        if broadcaster.remove(slot) > 0:
+            return
+        if _broadcasters.get(broadcaster.camera_id) is broadcaster:
+            _broadcasters.pop(broadcaster.camera_id, None)
+    broadcaster.stop()
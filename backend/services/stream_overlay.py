@@ -0,0 +1,196 @@
+import time
+from typing import Dict, List, Optional
+
+import cv2
+import numpy as np
+
+
+def make_overlay(
+    bbox,
+    label: Optional[str],
+    color,
+    thickness: int = 2,
+    font_scale: float = 0.56,
+    kind: str = 'gate',
+    reason: Optional[str] = None,
+    identity: Optional[Dict] = None,
+    score: Optional[float] = None,
+    quality: Optional[float] = None,
+) -> Dict:
+    """
+    One detection and how to draw it; ``kind`` is 'gate', 'staff' or 'visitor'.
+
+    ``reason`` says why the face got its label (a failed quality gate, 'analyzing',
+    'matched', 'enrolled', ...); ``identity`` and ``score`` describe the match.
+    """
+    return {
+        'bbox': tuple(int(v) for v in bbox),
+        'label': label,
+        'color': tuple(int(v) for v in color),
+        'thickness': int(thickness),
+        'font_scale': float(font_scale),
+        'kind': kind,
+        'reason': reason,
+        'identity': identity,
+        'score': round(float(score), 4) if score is not None else None,
+        'quality': round(float(quality), 4) if quality is not None else None,
+    }
+
+
+def detections(overlays: List[Dict]) -> List[Dict]:
+    """The overlays without drawing attributes, for clients that render boxes themselves."""
+    return [
+        {
+            'bbox': list(overlay['bbox']),
+            'kind': overlay.get('kind'),
+            'reason': overlay.get('reason'),
+            'identity': overlay.get('identity'),
+            'score': overlay.get('score'),
+            'quality': overlay.get('quality'),
+            'label': overlay.get('label'),
+        }
+        for overlay in overlays
+    ]
+
+
+def draw_overlays(frame, overlays: List[Dict]):
+    for overlay in overlays:
+        x1, y1, x2, y2 = overlay['bbox']
+        color = overlay['color']
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, overlay.get('thickness', 2))
+        if overlay.get('label'):
+            cv2.putText(
+                frame,
+                overlay['label'],
+                (x1, max(20, y1 - 10)),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                overlay.get('font_scale', 0.56),
+                color,
+                2,
+            )
+    return frame
+
+
+class OverlayTracker:
+    """
+    Carries the last analyzed overlays across skipped frames.
+
+    Each box is shifted by the median sparse optical flow (Lucas-Kanade) of corner
+    points inside it, measured on a downscaled grayscale frame. Boxes whose points
+    are all lost keep their last position.
+    """
+
+    def __init__(self, scale: float = 0.5, max_points: int = 24):
+        self.scale = scale
+        self.max_points = max_points
+        self._prev_gray: Optional[np.ndarray] = None
+        self._overlays: List[Dict] = []
+        self._boxes: List[np.ndarray] = []
+        self._points: List[Optional[np.ndarray]] = []
+
+    def _gray(self, frame) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scale != 1.0:
+            gray = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _seed(self, gray: np.ndarray, box: np.ndarray) -> Optional[np.ndarray]:
+        x1, y1, x2, y2 = (box * self.scale).astype(int)
+        h, w = gray.shape[:2]
+        x1, y1 = max(0, x1), max(0, y1)
+        x2, y2 = min(w, x2), min(h, y2)
+        if x2 - x1 < 4 or y2 - y1 < 4:
+            return None
+        corners = cv2.goodFeaturesToTrack(gray[y1:y2, x1:x2], self.max_points, 0.01, 3)
+        if corners is None:
+            return None
+        return (corners.reshape(-1, 2) + np.array([x1, y1], dtype=np.float32)).astype(np.float32)
+
+    def reset(self, frame, overlays: List[Dict]):
+        """Start tracking the overlays produced by a full analysis of ``frame``."""
+        self._prev_gray = self._gray(frame)
+        self._overlays = [dict(overlay) for overlay in overlays]
+        self._boxes = [np.asarray(overlay['bbox'], dtype=np.float32) for overlay in overlays]
+        self._points = [self._seed(self._prev_gray, box) for box in self._boxes]
+
+    def advance(self, frame) -> List[Dict]:
+        """Shift the tracked overlays onto ``frame`` and return them."""
+        if self._prev_gray is None or not self._overlays:
+            return []
+        gray = self._gray(frame)
+        h, w = frame.shape[:2]
+        for idx, points in enumerate(self._points):
+            if points is None or len(points) == 0:
+                continue
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(
+                self._prev_gray,
+                gray,
+                points.reshape(-1, 1, 2),
+                None,
+                winSize=(15, 15),
+                maxLevel=2,
+            )
+            good = status.reshape(-1) == 1
+            if not np.any(good):
+                self._points[idx] = None
+                continue
+            moved = moved.reshape(-1, 2)[good]
+            shift = np.median(moved - points[good], axis=0) / self.scale
+            box = self._boxes[idx] + np.array([shift[0], shift[1], shift[0], shift[1]], dtype=np.float32)
+            box[[0, 2]] = np.clip(box[[0, 2]], 0, w - 1)
+            box[[1, 3]] = np.clip(box[[1, 3]], 0, h - 1)
+            self._boxes[idx] = box
+            self._points[idx] = moved
+            self._overlays[idx]['bbox'] = tuple(int(v) for v in box)
+        self._prev_gray = gray
+        return self._overlays
+
+
+class AnalysisScheduler:
+    """
+    Decides which frames get full inference.
+
+    The analysis rate is capped by ``fps_limit``; when ``max_duty`` is set the interval
+    also stretches so inference takes at most that fraction of wall time, measured from
+    a moving average of recent inference latency.
+    """
+
+    def __init__(self, fps_limit: Optional[float] = None, max_duty: float = 0.0):
+        self.fps_limit = float(fps_limit) if fps_limit else 0.0
+        self.max_duty = float(max_duty)
+        self.latency = 0.0
+        self._last_start = 0.0
+        self.analyzed = 0
+        self.skipped = 0
+
+    @property
+    def interval(self) -> float:
+        interval = 1.0 / self.fps_limit if self.fps_limit > 0 else 0.0
+        if self.max_duty > 0 and self.latency > 0:
+            interval = max(interval, self.latency / self.max_duty)
+        return interval
+
+    def due(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        if now - self._last_start >= self.interval:
+            return True
+        self.skipped += 1
+        return False
+
+    def record(self, started: float, finished: Optional[float] = None):
+        """Mark an analysis tick; pass ``finished`` when inference actually ran."""
+        self._last_start = started
+        if finished is None:
+            return
+        latency = max(0.0, finished - started)
+        self.latency = latency if self.analyzed == 0 else 0.8 * self.latency + 0.2 * latency
+        self.analyzed += 1
+
+    def stats(self) -> Dict:
+        interval = self.interval
+        return {
+            'analysis_fps': round(1.0 / interval, 2) if interval > 0 else None,
+            'inference_ms': round(self.latency * 1000.0, 1),
+            'analyzed': self.analyzed,
+            'skipped': self.skipped,
+        }
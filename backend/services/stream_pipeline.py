@@ -0,0 +1,83 @@
+import datetime
+import time
+from typing import Callable, Dict, List, Optional
+
+from services.stream_overlay import AnalysisScheduler, OverlayTracker
+
+
+class StreamPipeline:
+    """
+    Per-camera analysis step shared by inline MJPEG streams and camera worker processes.
+
+    Decides whether a frame gets full inference, keeps sessions closed while no event
+    is running, and returns the overlays to draw (tracked ones on skipped frames).
+    ``event_state`` returns the current event snapshot as in ``routes.events``.
+    """
+
+    def __init__(
+        self,
+        service,
+        camera,
+        event_state: Callable[[], Dict],
+        fps_limit: Optional[float] = None,
+        max_duty: float = 0.0,
+        logger=None,
+    ):
+        self.service = service
+        self.camera = camera
+        self.event_state = event_state
+        self.logger = logger
+        self.scheduler = AnalysisScheduler(fps_limit, max_duty=max_duty)
+        self.tracker = OverlayTracker()
+        self.event_active = False
+        # Whether the last ``process`` ran full inference (False: tracked or no boxes).
+        self.last_analyzed = False
+        self._last_inactive_cleanup = datetime.datetime.min
+
+    def process(self, frame) -> List[Dict]:
+        """Return overlays for ``frame``; the frame itself is not modified."""
+        self.last_analyzed = False
+        if self.service is None:
+            return []
+        try:
+            started = time.time()
+            if not self.scheduler.due(started):
+                if self.event_active:
+                    # Between analyses, reuse the last boxes shifted by optical flow.
+                    return self.tracker.advance(frame)
+                return []
+
+            overlays = []
+            event_state = self.event_state() or {}
+            self.event_active = bool(event_state.get('workflow_active'))
+            selected_camera_id = event_state.get('selected_camera_id')
+            if selected_camera_id and selected_camera_id != self.camera.camera_id:
+                self.event_active = False
+
+            if self.event_active:
+                overlays = self.service.analyze_frame(frame, self.camera, event_context=event_state)
+                self.scheduler.record(started, time.time())
+                self.last_analyzed = True
+            else:
+                self.scheduler.record(started)
+                now_local = datetime.datetime.now()
+                if (now_local - self._last_inactive_cleanup).total_seconds() >= 2.0:
+                    self.service.finalize_active_sessions(
+                        now_local=now_local,
+                        event_start=event_state.get('start_time'),
+                        event_end=event_state.get('end_time'),
+                        camera_db_id=self.camera.id,
+                    )
+                    self._last_inactive_cleanup = now_local
+            self.tracker.reset(frame, overlays)
+            return overlays
+        except Exception as exc:
+            if self.logger is not None:
+                self.logger.warning("Stream frame annotation failed: %s", exc)
+            return []
+
+    def stats(self) -> Dict:
+        stats = self.scheduler.stats()
+        if self.service is not None:
+            stats['writes'] = self.service.write_stats()
+        return stats
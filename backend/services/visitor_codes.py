@@ -0,0 +1,74 @@
+import re
+import threading
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import text
+
+from models import db
+from models.visitor import Visitor
+from utils.sequence_block import SequenceBlock
+
+VISITOR_CODE_SEQUENCE = 'visitor_code_seq'
+_CODE_PATTERN = re.compile(r'^ID(\d+)$')
+
+_codes: Optional[SequenceBlock] = None
+_codes_lock = threading.Lock()
+
+
+def ensure_visitor_code_sequence(engine):
+    """
+    Create the visitor code sequence if it is missing.
+
+    Only on creation is it started after the highest existing ``ID<n>`` code, so
+    databases that predate the sequence keep numbering where they left off.
+    """
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT to_regclass(:name)"), {'name': VISITOR_CODE_SEQUENCE}
+        ).scalar()
+        if exists is not None:
+            return
+        connection.execute(text(f"CREATE SEQUENCE IF NOT EXISTS {VISITOR_CODE_SEQUENCE}"))
+        connection.execute(text(
+            f"SELECT setval('{VISITOR_CODE_SEQUENCE}', COALESCE(("
+            "SELECT MAX(CAST(substring(visitor_id FROM 3) AS BIGINT)) FROM visitors "
+            "WHERE visitor_id ~ '^ID[0-9]+$'), 0) + 1, false)"
+        ))
+
+
+def next_visitor_code() -> str:
+    """
+    Next ``ID<n>`` code from the sequence.
+
+    Each process reserves VISITOR_CODE_BLOCK values per round trip, so codes stay
+    unique across workers and restarts but are not strictly in enrollment order.
+    """
+    global _codes
+    with _codes_lock:
+        if _codes is None:
+            _codes = SequenceBlock(VISITOR_CODE_SEQUENCE, int(current_app.config.get('VISITOR_CODE_BLOCK', 16)))
+    return f"ID{_codes.next(db.engine)}"
+
+
+def visitor_code_taken(visitor_code: str) -> bool:
+    """Whether a visitor already has ``visitor_code``; used after a failed insert."""
+    return db.session.query(Visitor.id).filter_by(visitor_id=visitor_code).first() is not None
+
+
+def claim_visitor_code(visitor_code: str):
+    """
+    Move the sequence past a code assigned by hand so it is not generated again.
+    Blocks other processes already reserved may still hold it; inserts that collide
+    with it draw a new code (see ``visitor_code_taken``).
+    """
+    match = _CODE_PATTERN.match(visitor_code or '')
+    if not match:
+        return
+    db.session.execute(
+        text(
+            f"SELECT setval('{VISITOR_CODE_SEQUENCE}', GREATEST(:num, "
+            f"(SELECT last_value FROM {VISITOR_CODE_SEQUENCE})))"
+        ),
+        {'num': int(match.group(1))},
+    )
@@ -1,12 +1,12 @@
-import os
 import uuid
 import datetime
 import numpy as np
-import cv2
 from flask import current_app
 from models import db
 from models.visitor import Visitor, VisitorSession, VisitorImage
 from services.face_recognition import FaceRecognitionService
+from services.image_store import get_image_writer
+from utils.embedding_codec import decode_embedding, encode_embedding
 
 class VisitorManager:
     def __init__(self):
@@ -32,7 +32,9 @@ class VisitorManager:
         best_score = -1
         
         for v in known_visitor:
-            v_emb = np.frombuffer(v.embedding, dtype=np.float32)
+            v_emb = decode_embedding(v.embedding)
+            if v_emb is None or v_emb.shape != embedding.shape:
+                continue
             score = np.dot(embedding, v_emb)
             if score > current_app.config['FACE_SIMILARITY_THRESHOLD'] and score > best_score:
                 best_match = v
@@ -43,11 +45,7 @@ class VisitorManager:
         if not visitor:
             # 3. New Visitor
             filename = f"V_{uuid.uuid4().hex}_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.jpg"
-            rel_path = f"visitors/{filename}"
-            full_path = os.path.join(current_app.config['VISITOR_UPLOAD_FOLDER'], filename)
-            
-            os.makedirs(current_app.config['VISITOR_UPLOAD_FOLDER'], exist_ok=True)
-            cv2.imwrite(full_path, face_img)
+            rel_path = get_image_writer().save(face_img.copy(), f"visitors/{filename}")
 
             last_visitor = Visitor.query.order_by(Visitor.id.desc()).first()
             next_id_num = (int(last_visitor.visitor_id[1:]) + 1) if last_visitor else 1
@@ -56,7 +54,7 @@ class VisitorManager:
             visitor = Visitor(
                 visitor_id=visitor_id_str,
                 primary_image_path=rel_path,
-                embedding=embedding.tobytes()
+                embedding=encode_embedding(embedding, current_app.config.get('EMBEDDING_DB_FORMAT', 'float32'))
             )
             db.session.add(visitor)
             db.session.flush() 
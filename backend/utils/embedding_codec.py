@@ -0,0 +1,66 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+STORAGE_DTYPES = ('float32', 'float16', 'int8')
+
+# Non-float32 BYTEA blobs carry a 4-byte tag; untagged blobs are legacy raw float32.
+_BLOB_TAGS = {
+    'float16': b'EQ16',
+    'int8': b'EQI8',
+}
+
+
+def quantize_rows(vectors: np.ndarray, dtype: str = 'float32') -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """
+    Encode normalized float32 rows for compact storage.
+
+    int8 uses a symmetric per-row scale (max |x| / 127) returned alongside the codes;
+    the float types return ``None`` for scales.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == 'float32':
+        return vectors, None
+    if dtype == 'float16':
+        return vectors.astype(np.float16), None
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=-1) / 127.0
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scales[..., None]), -127, 127).astype(np.int8)
+        return codes, scales
+    raise ValueError(f"Unsupported embedding storage dtype: {dtype}")
+
+
+def dequantize_rows(data: np.ndarray, scales: Optional[np.ndarray] = None) -> np.ndarray:
+    rows = np.asarray(data).astype(np.float32)
+    if scales is not None:
+        rows *= np.asarray(scales, dtype=np.float32)[..., None]
+    return rows
+
+
+def encode_embedding(vector: np.ndarray, fmt: str = 'float32') -> bytes:
+    """Serialize one embedding for the visitors/staff_images BYTEA columns."""
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    if fmt == 'float32':
+        return vector.tobytes()
+    data, scales = quantize_rows(vector.reshape(1, -1), fmt)
+    payload = data.tobytes()
+    if scales is not None:
+        payload = scales.astype(np.float32).tobytes() + payload
+    return _BLOB_TAGS[fmt] + payload
+
+
+def decode_embedding(blob) -> Optional[np.ndarray]:
+    """Inverse of ``encode_embedding``; returns float32 (not re-normalized)."""
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    tag = blob[:4]
+    if tag == _BLOB_TAGS['float16'] and (len(blob) - 4) % 2 == 0:
+        return np.frombuffer(blob, dtype=np.float16, offset=4).astype(np.float32)
+    if tag == _BLOB_TAGS['int8'] and len(blob) > 8:
+        scale = np.frombuffer(blob, dtype=np.float32, count=1, offset=4)[0]
+        return np.frombuffer(blob, dtype=np.int8, offset=8).astype(np.float32) * scale
+    if len(blob) % 4:
+        return None
+    return np.frombuffer(blob, dtype=np.float32)
@@ -0,0 +1,107 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+
+def pairwise_iou(boxes_a, boxes_b) -> np.ndarray:
+    """IoU of every (x1, y1, x2, y2) box in ``boxes_a`` against every box in ``boxes_b``; shape (N, M)."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    if a.shape[0] == 0 or b.shape[0] == 0:
+        return np.zeros((a.shape[0], b.shape[0]), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = np.clip(a[:, 2] - a[:, 0], 0, None) * np.clip(a[:, 3] - a[:, 1], 0, None)
+    area_b = np.clip(b[:, 2] - b[:, 0], 0, None) * np.clip(b[:, 3] - b[:, 1], 0, None)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0).astype(np.float32)
+
+
+def greedy_assign(scores: np.ndarray, threshold: float) -> List[Tuple[int, int]]:
+    """
+    One-to-one assignment by repeatedly taking the highest remaining score.
+
+    Returns (row, col) pairs with score >= ``threshold``; close to Hungarian matching
+    for the small, well-separated IoU matrices seen between consecutive frames.
+    """
+    scores = np.asarray(scores, dtype=np.float32)
+    if scores.size == 0:
+        return []
+    rows, cols = np.nonzero(scores >= threshold)
+    if rows.size == 0:
+        return []
+    order = np.argsort(-scores[rows, cols], kind='stable')
+    used_rows, used_cols = set(), set()
+    pairs = []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        pairs.append((row, col))
+    return pairs
+
+
+def roi_regions(roi, width: int, height: int) -> List[Tuple[Tuple[int, int, int, int], Optional[np.ndarray]]]:
+    """
+    Pixel regions of a camera ROI for a ``width`` x ``height`` frame.
+
+    ``roi`` is a list of rectangles ``{"x", "y", "w", "h"}`` or polygons
+    ``{"points": [[x, y], ...]}`` in fractions of the frame (0-1). Returns the
+    (x1, y1, x2, y2) bounding box of each region and its polygon in pixels (None
+    for rectangles); empty regions are skipped.
+    """
+    regions = []
+    for region in roi or []:
+        polygon = None
+        if 'points' in region:
+            polygon = np.asarray(region['points'], dtype=np.float32).reshape(-1, 2)
+            polygon = np.clip(polygon, 0.0, 1.0) * np.array([width, height], dtype=np.float32)
+            x1, y1 = np.floor(polygon.min(axis=0)).astype(int)
+            x2, y2 = np.ceil(polygon.max(axis=0)).astype(int)
+        else:
+            x1 = int(np.floor(min(max(float(region['x']), 0.0), 1.0) * width))
+            y1 = int(np.floor(min(max(float(region['y']), 0.0), 1.0) * height))
+            x2 = int(np.ceil(min(max(float(region['x']) + float(region['w']), 0.0), 1.0) * width))
+            y2 = int(np.ceil(min(max(float(region['y']) + float(region['h']), 0.0), 1.0) * height))
+        x1, y1, x2, y2 = max(0, int(x1)), max(0, int(y1)), min(width, int(x2)), min(height, int(y2))
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            continue
+        regions.append(((x1, y1, x2, y2), polygon))
+    return regions
+
+
+def points_in_polygon(points, polygon) -> np.ndarray:
+    """Even-odd test of every (x, y) in ``points`` against ``polygon`` (K, 2); boolean (N,)."""
+    pts = np.asarray(points, dtype=np.float32).reshape(-1, 2)
+    poly = np.asarray(polygon, dtype=np.float32).reshape(-1, 2)
+    inside = np.zeros(pts.shape[0], dtype=bool)
+    if pts.shape[0] == 0 or poly.shape[0] < 3:
+        return inside
+    x, y = pts[:, 0:1], pts[:, 1:2]
+    x1, y1 = poly[None, :, 0], poly[None, :, 1]
+    x2, y2 = np.roll(poly, -1, axis=0)[None, :, 0], np.roll(poly, -1, axis=0)[None, :, 1]
+    crosses = (y1 > y) != (y2 > y)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    hits = crosses & (x < x_cross)
+    return (np.count_nonzero(hits, axis=1) % 2) == 1
+
+
+def suppress_duplicates(boxes, scores, threshold: float = 0.5) -> List[int]:
+    """Indices kept by greedy NMS: highest score first, dropping boxes with IoU > ``threshold``."""
+    scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+    if scores.size == 0:
+        return []
+    ious = pairwise_iou(boxes, boxes)
+    keep = []
+    suppressed = np.zeros(scores.size, dtype=bool)
+    for idx in np.argsort(-scores, kind='stable').tolist():
+        if suppressed[idx]:
+            continue
+        keep.append(idx)
+        suppressed |= ious[idx] > threshold
+    return keep
@@ -0,0 +1,34 @@
+import threading
+from collections import deque
+
+from sqlalchemy import text
+
+
+class SequenceBlock:
+    """
+    Hands out values of a Postgres sequence, reserving ``block_size`` per round trip.
+
+    Values are taken with ``nextval`` on a separate connection, so they are unique
+    across processes and survive rollbacks; unused values of a block are simply skipped.
+    """
+
+    def __init__(self, sequence_name: str, block_size: int = 32):
+        self.sequence_name = sequence_name
+        self.block_size = max(1, int(block_size))
+        self._values = deque()
+        self._lock = threading.Lock()
+
+    def next(self, engine) -> int:
+        with self._lock:
+            if not self._values:
+                with engine.connect() as connection:
+                    rows = connection.execute(
+                        text("SELECT nextval(CAST(:name AS regclass)) FROM generate_series(1, :n)"),
+                        {'name': self.sequence_name, 'n': self.block_size},
+                    ).fetchall()
+                self._values.extend(int(row[0]) for row in rows)
+            return self._values.popleft()
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
@@ -87,7 +87,9 @@ CREATE TABLE IF NOT EXISTS cameras (
     is_online BOOLEAN DEFAULT FALSE,
     fps_limit INTEGER DEFAULT 30,
     resolution_width INTEGER DEFAULT 1920,
-    resolution_height INTEGER DEFAULT 1080
+    resolution_height INTEGER DEFAULT 1080,
+    det_size INTEGER, -- detector input size, NULL = FACE_DET_SIZE
+    roi JSON -- regions of interest in frame fractions: [{x, y, w, h} | {points: [[x, y], ...]}]
 );
 
 -- 9. System Settings
@@ -98,8 +100,39 @@ CREATE TABLE IF NOT EXISTS system_settings (
     description VARCHAR(255)
 );
 
+-- 10. Gallery Changelog (incremental sync of recognition caches)
+CREATE TABLE IF NOT EXISTS gallery_changes (
+    id BIGSERIAL PRIMARY KEY,
+    entity VARCHAR(20) NOT NULL, -- visitor, staff
+    entity_id INTEGER NOT NULL,
+    operation VARCHAR(10) NOT NULL, -- upsert, delete
+    changed_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 11. Report Jobs (visitor PDFs generated off the stream by the report worker pool)
+CREATE TABLE IF NOT EXISTS report_jobs (
+    id SERIAL PRIMARY KEY,
+    visitor_id INTEGER NOT NULL REFERENCES visitors(id) ON DELETE CASCADE,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- queued, running, done, failed
+    event_start TIMESTAMP WITHOUT TIME ZONE,
+    event_end TIMESTAMP WITHOUT TIME ZONE,
+    file_path VARCHAR(255),
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    run_after TIMESTAMP WITHOUT TIME ZONE, -- retry backoff: not claimed before this time
+    created_at TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITHOUT TIME ZONE,
+    finished_at TIMESTAMP WITHOUT TIME ZONE
+);
+
+-- 12. Visitor codes (ID<n>), allocated by nextval so workers never scan visitors
+CREATE SEQUENCE IF NOT EXISTS visitor_code_seq;
+
 -- Performance Indexes
 CREATE INDEX idx_visitors_first_seen ON visitors(first_seen);
 CREATE INDEX idx_visitor_sessions_entry ON visitor_sessions(entry_time);
 CREATE INDEX idx_visitor_sessions_active ON visitor_sessions(is_active) WHERE is_active = true;
-CREATE INDEX idx_staff_images_staff ON staff_images(staff_id);
\ No newline at end of file
+CREATE INDEX idx_staff_images_staff ON staff_images(staff_id);
+CREATE INDEX idx_gallery_changes_changed_at ON gallery_changes(changed_at);
+CREATE UNIQUE INDEX uq_report_jobs_visitor_queued ON report_jobs(visitor_id) WHERE status = 'queued';
+CREATE INDEX idx_report_jobs_status_created ON report_jobs(status, created_at);
\ No newline at end of file